@@ -13,10 +13,11 @@ __systemIsIntitialized_ = False
 
 def setSystemInitialized():
     global __systemIsIntitialized_
-    from viur.core.skeleton import iterAllSkelClasses
+    from viur.core.skeleton import clearStructureCache, iterAllSkelClasses
     __systemIsIntitialized_ = True
     for skelCls in iterAllSkelClasses():
         skelCls.setSystemInitialized()
+    clearStructureCache()
 
 
 def getSystemInitialized():
@@ -39,6 +40,67 @@ class ReadFromClientError:
     invalidatedFields: List[str] = None
 
 
+class ClientData(dict):
+    """
+        The parameters submitted by the client, additionally indexed by the name of the bone they belong to.
+
+        Each key is filed under the part before its first dot, so a bone only has to look at its own parameters
+        ("name", "name.de", "name.0.street", ...) instead of all parameters of the request. The index is built on
+        first use and dropped whenever the parameters are modified.
+    """
+    __slots__ = ("_index",)
+
+    def fieldsOf(self, name: str) -> Dict[str, Any]:
+        """
+            Returns the parameters submitted for the bone *name*
+        """
+        try:
+            index = self._index
+        except AttributeError:
+            index = self._index = {}
+            for key, value in self.items():
+                index.setdefault(str(key).partition(".")[0], {})[key] = value
+        return index.get(name, {})
+
+    def _dropIndex(self):
+        try:
+            del self._index
+        except AttributeError:
+            pass
+
+    def __setitem__(self, key, value):
+        self._dropIndex()
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._dropIndex()
+        super().__delitem__(key)
+
+    def pop(self, *args):
+        self._dropIndex()
+        return super().pop(*args)
+
+    def setdefault(self, key, default=None):
+        self._dropIndex()
+        return super().setdefault(key, default)
+
+    def update(self, *args, **kwargs):
+        self._dropIndex()
+        super().update(*args, **kwargs)
+
+    def popitem(self):
+        self._dropIndex()
+        return super().popitem()
+
+    def clear(self):
+        self._dropIndex()
+        super().clear()
+
+    def __ior__(self, other):
+        self._dropIndex()
+        return super().__ior__(other)
+
+
 class UniqueLockMethod(Enum):
     SameValue = 1  # Lock this value we have just one entry, or lock each value individually if bone is multiple
     SameSet = 2  # Same Set of entries (including duplicates), any order
@@ -217,6 +279,9 @@ class BaseBone(object):
         super().__setattr__(key, value)
 
     def collectRawClientData(self, name, data, multiple, languages, collectSubfields):
+        if isinstance(data, ClientData):
+            # Only look at our own parameters
+            data = data.fieldsOf(name)
         fieldSubmitted = False
         if languages:
             res = {}
@@ -883,6 +948,13 @@ class BaseBone(object):
             else:
                 yield None, None, value
 
+    def isStructureStatic(self) -> bool:
+        """
+        Returns True if the result of :meth:`structure` only depends on the configuration of this bone and the
+        current language, so it can be cached. Must be overridden if parts of it are computed at runtime.
+        """
+        return True
+
     def structure(self) -> dict:
         """
         Describes the bone and its settings as an JSON-serializable dict.
@@ -1,13 +1,59 @@
 from datetime import datetime, timedelta, timezone
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Tuple, Union
 
 import pytz
+import re
 import tzlocal
+from functools import lru_cache
 
 from viur.core import conf, current, db
 from viur.core.bones.base import BaseBone, ReadFromClientError, ReadFromClientErrorSeverity
 from viur.core.utils import utcNow
 
+_timestampRegex = re.compile(r"-?\d+(?:\.\d*)?")
+_timeRegex = re.compile(r"(\d{1,2})\s*:\s*(\d{1,2})(?:\s*:\s*(\d{1,2}))?")
+_timeSuffix = r"(?:\s+(?P<H>\d{1,2}):(?P<M>\d{1,2})(?::(?P<S>\d{1,2}))?)?"
+_isoDateRegex = re.compile(r"(?P<Y>\d{4})-(?P<m>\d{1,2})-(?P<d>\d{1,2})" + _timeSuffix)
+_usDateRegex = re.compile(r"(?P<m>\d{1,2})/(?P<d>\d{1,2})/(?P<Y>\d{4})" + _timeSuffix)
+_euDateRegex = re.compile(r"(?P<d>\d{1,2})\.(?P<m>\d{1,2})\.(?P<Y>\d{4})" + _timeSuffix)
+
+
+@lru_cache(maxsize=4096)
+def _parseDateTime(rawValue: str, date: bool, time: bool, timeZone) -> Union[datetime, bool]:
+    """
+        Parses *rawValue* by the formats accepted by :meth:`DateBone.singleValueFromClient`, except "now".
+        Returns False if it's invalid.
+
+        The format is chosen by the shape of the value, so at most one regular expression is tried before falling
+        back to :meth:`datetime.fromisoformat`. The results are cached, as bulk imports repeat the same values.
+    """
+    try:
+        if _timestampRegex.fullmatch(rawValue):
+            timestamp = float(rawValue)  # Huge values become inf
+            if not -1 * (2 ** 30) <= timestamp <= (2 ** 31) - 2:
+                return False  # its invalid
+            return datetime.fromtimestamp(timestamp, tz=timeZone).replace(microsecond=0)
+
+        if not date and time:
+            if match := _timeRegex.fullmatch(rawValue.strip()):
+                hour, minute, second = match.groups()
+                return datetime(year=1970, month=1, day=1, hour=int(hour), minute=int(minute),
+                                second=int(second or 0), tzinfo=timeZone)
+            return datetime.fromisoformat(rawValue)
+
+        if "-" in rawValue:  # ISO Date
+            match = _isoDateRegex.fullmatch(rawValue)
+        elif "/" in rawValue:  # Ami Date
+            match = _usDateRegex.fullmatch(rawValue)
+        else:  # European Date
+            match = _euDateRegex.fullmatch(rawValue)
+        if match:
+            return datetime(int(match["Y"]), int(match["m"]), int(match["d"]),
+                            int(match["H"] or 0), int(match["M"] or 0), int(match["S"] or 0))
+        return datetime.fromisoformat(rawValue)
+    except (OverflowError, ValueError):
+        return False  # its invalid
+
 
 class DateBone(BaseBone):
     type = "date"
@@ -102,68 +148,22 @@ class DateBone(BaseBone):
             :param value: *User-supplied* request-data, has to be of valid format
             :returns: tuple[datetime or None, [Errors] or None]
         """
-        time_zone = self.guessTimeZone()
-        rawValue = value
-        if str(rawValue).replace("-", "", 1).replace(".", "", 1).isdigit():
-            if int(rawValue) < -1 * (2 ** 30) or int(rawValue) > (2 ** 31) - 2:
-                value = False  # its invalid
-            else:
-                value = datetime.fromtimestamp(float(rawValue), tz=time_zone).replace(microsecond=0)
-        elif not self.date and self.time:
-            try:
-                value = datetime.fromisoformat(value)
-            except:
-                try:
-                    if str(rawValue).count(":") > 1:
-                        (hour, minute, second) = [int(x.strip()) for x in str(rawValue).split(":")]
-                        value = datetime(year=1970, month=1, day=1, hour=hour, minute=minute, second=second,
-                                         tzinfo=time_zone)
-                    elif str(rawValue).count(":") > 0:
-                        (hour, minute) = [int(x.strip()) for x in str(rawValue).split(":")]
-                        value = datetime(year=1970, month=1, day=1, hour=hour, minute=minute, tzinfo=time_zone)
-                    elif str(rawValue).replace("-", "", 1).isdigit():
-                        value = datetime(year=1970, month=1, day=1, second=int(rawValue), tzinfo=time_zone)
-                    else:
-                        value = False  # its invalid
-                except:
-                    value = False
-        elif str(rawValue).lower().startswith("now"):
-            tmpRes = datetime.now(time_zone)
-            if len(str(rawValue)) > 4:
+        return self.parseValue(value, self.guessTimeZone())
+
+    def parseValue(self, value, timeZone) -> Tuple[Optional[datetime], Optional[List[ReadFromClientError]]]:
+        """
+            Parses a single value from the client in the time zone *timeZone*, see :meth:`singleValueFromClient`.
+        """
+        rawValue = str(value)
+        if rawValue[:3].lower() == "now" and (self.date or not self.time):
+            value = datetime.now(timeZone)
+            if len(rawValue) > 4:
                 try:
-                    tmpRes += timedelta(seconds=int(str(rawValue)[3:]))
-                except:
+                    value += timedelta(seconds=int(rawValue[3:]))
+                except (OverflowError, ValueError):
                     pass
-            value = tmpRes
         else:
-            try:
-                value = datetime.fromisoformat(value)
-            except:
-                try:
-                    if " " in rawValue:  # Date with time
-                        try:  # Times with seconds
-                            if "-" in rawValue:  # ISO Date
-                                value = datetime.strptime(str(rawValue), "%Y-%m-%d %H:%M:%S")
-                            elif "/" in rawValue:  # Ami Date
-                                value = datetime.strptime(str(rawValue), "%m/%d/%Y %H:%M:%S")
-                            else:  # European Date
-                                value = datetime.strptime(str(rawValue), "%d.%m.%Y %H:%M:%S")
-                        except:
-                            if "-" in rawValue:  # ISO Date
-                                value = datetime.strptime(str(rawValue), "%Y-%m-%d %H:%M")
-                            elif "/" in rawValue:  # Ami Date
-                                value = datetime.strptime(str(rawValue), "%m/%d/%Y %H:%M")
-                            else:  # European Date
-                                value = datetime.strptime(str(rawValue), "%d.%m.%Y %H:%M")
-                    else:
-                        if "-" in rawValue:  # ISO (Date only)
-                            value = datetime.strptime(str(rawValue), "%Y-%m-%d")
-                        elif "/" in rawValue:  # Ami (Date only)
-                            value = datetime.strptime(str(rawValue), "%m/%d/%Y")
-                        else:  # European (Date only)
-                            value = datetime.strptime(str(rawValue), "%d.%m.%Y")
-                except:
-                    value = False  # its invalid
+            value = _parseDateTime(rawValue, self.date, self.time, timeZone)
 
         if not value:
             return self.getEmptyValue(), [
@@ -174,7 +174,7 @@ class DateBone(BaseBone):
                 ReadFromClientError(ReadFromClientErrorSeverity.Invalid, "Datetime must be naive")
             ]
         if not value.tzinfo and not self.naive:
-            value = time_zone.localize(value)
+            value = timeZone.localize(value)
 
         value = value.replace(microsecond=0)
 
@@ -205,16 +205,20 @@ class DateBone(BaseBone):
         if not (self.date and self.time and self.localize):
             return pytz.utc
 
+        currReqData = current.request_data.get()
+        if currReqData is not None and "timeZone" in currReqData:
+            # Check the local cache first
+            return currReqData["timeZone"]
+
         if conf["viur.instance.is_dev_server"]:
-            return tzlocal.get_localzone()
+            timeZone = tzlocal.get_localzone()
+            if currReqData is not None:
+                currReqData["timeZone"] = timeZone
+            return timeZone
 
         timeZone = pytz.utc  # Default fallback
-        currReqData = current.request_data.get()
 
         try:
-            # Check the local cache first
-            if "timeZone" in currReqData:
-                return currReqData["timeZone"]
             headers = current.request.get().request.headers
             if "X-Appengine-Country" in headers:
                 country = headers["X-Appengine-Country"]
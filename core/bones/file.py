@@ -1,28 +1,64 @@
 import logging
 from hashlib import sha256
 from time import time
-from typing import Any, Dict, List, Set, Union
+from typing import Any, Dict, Iterable, List, Set, Union
 
 from viur.core import conf, db
 from viur.core.bones.treeleaf import TreeLeafBone
 from viur.core.tasks import CallDeferred
 
 
-@CallDeferred
-def ensureDerived(key: db.Key, srcKey, deriveMap: Dict[str, Any], refreshKey: db.Key = None):
+def fetchFilesByDlKey(dlKeys: Iterable[str]) -> Dict[str, db.Entity]:
     """
-    Ensure that pending thumbnails or other derived Files are build
-    :param key: DB-Key of the file-object on which we should update the derivemap
-    :param srcKey: Prefix for a (hopefully) stable key to prevent rebuilding derives over and over again
-    :param deriveMap: List of DeriveDicts we should build/update
-    :param refreshKey: If set, we'll fetch and refresh the skeleton after building new derives
+    Fetches the (oldest) file entry of each of the given download-keys in one batch.
+
+    The key of that file entry is remembered in an entity of kind "viur-file-dlkeys" for each dlkey, so a lookup
+    only needs two batched reads. Download-keys missing in that index (or pointing to a file entry which has been
+    deleted) are resolved by a query and added to the index.
+
+    :param dlKeys: The download-keys to look up
+    :return: Mapping of each dlkey to the entity of its file entry; dlkeys without a file entry are omitted
+    """
+    dlKeys = list(dict.fromkeys(dlKeys))
+    if not dlKeys:
+        return {}
+    res = {}
+    dlKeyByFileKey = {
+        indexEntry["file"]: dlKey
+        for dlKey, indexEntry in zip(dlKeys, db.Get([db.Key("viur-file-dlkeys", x) for x in dlKeys]))
+        if indexEntry
+    }
+    if dlKeyByFileKey:
+        for fileObj in db.Get(list(dlKeyByFileKey.keys())):
+            if fileObj and fileObj.get("dlkey") == dlKeyByFileKey[fileObj.key]:
+                res[fileObj["dlkey"]] = fileObj
+    newIndexEntries = []
+    for dlKey in dlKeys:
+        if dlKey in res:
+            continue
+        fileObj = db.Query("file").filter("dlkey =", dlKey).order(("creationdate", db.SortOrder.Ascending)).getEntry()
+        if fileObj:
+            res[dlKey] = fileObj
+            indexEntry = db.Entity(db.Key("viur-file-dlkeys", dlKey))
+            indexEntry["file"] = fileObj.key
+            newIndexEntries.append(indexEntry)
+    if newIndexEntries:
+        db.Put(newIndexEntries)
+    return res
+
+
+def _buildDerives(key: db.Key, srcKey, deriveMap: Dict[str, Any]) -> bool:
+    """
+    Builds the pending derives of a single file, see :func:`ensureDerived`.
+
+    :return: True if new derives have been written to the file entry
     """
     from viur.core.skeleton import skeletonByKind, updateRelations
     deriveFuncMap = conf["viur.file.derivers"]
     skel = skeletonByKind("file")()
     if not skel.fromDB(key):
         logging.info("File-Entry went missing in ensureDerived")
-        return
+        return False
     if not skel["derived"]:
         logging.info("No Derives for this file")
         skel["derived"] = {}
@@ -67,15 +103,59 @@ def ensureDerived(key: db.Key, srcKey, deriveMap: Dict[str, Any], refreshKey: db
         # the same FileBone have the chance to finish, otherwise that updateRelations Task will call postSavedHandler
         # on that FileBone again - re-queueing any ensureDerivedCalls that have not finished yet.
         updateRelations(key, time() + 1, "derived", _countdown=30)
-        if refreshKey:
-            def refreshTxn():
-                skel = skeletonByKind(refreshKey.kind)()
-                if not skel.fromDB(refreshKey):
-                    return
-                skel.refresh()
-                skel.toDB(update_relations=False)
+        return True
+    return False
+
+
+def _refreshSkel(refreshKey: db.Key):
+    from viur.core.skeleton import skeletonByKind
+
+    def refreshTxn():
+        skel = skeletonByKind(refreshKey.kind)()
+        if not skel.fromDB(refreshKey):
+            return
+        skel.refresh()
+        skel.toDB(update_relations=False)
+
+    db.RunInTransaction(refreshTxn)
+
 
-            db.RunInTransaction(refreshTxn)
+@CallDeferred
+def ensureDerived(key: db.Key, srcKey, deriveMap: Dict[str, Any], refreshKey: db.Key = None):
+    """
+    Ensure that pending thumbnails or other derived Files are build
+    :param key: DB-Key of the file-object on which we should update the derivemap
+    :param srcKey: Prefix for a (hopefully) stable key to prevent rebuilding derives over and over again
+    :param deriveMap: List of DeriveDicts we should build/update
+    :param refreshKey: If set, we'll fetch and refresh the skeleton after building new derives
+    """
+    if _buildDerives(key, srcKey, deriveMap) and refreshKey:
+        _refreshSkel(refreshKey)
+
+
+# Number of files whose derives are built by a single task of ensureDerivedMany
+_deriveChunkSize = 4
+
+
+def ensureDerivedMany(keys: List[db.Key], srcKey, deriveMap: Dict[str, Any], refreshKey: db.Key = None):
+    """
+    Like :func:`ensureDerived`, but for several files. Their derives are built by a task per chunk of a few files,
+    which refreshes the skeleton *refreshKey* once afterwards if it built any derive.
+    """
+    for idx in range(0, len(keys), _deriveChunkSize):
+        ensureDerivedChunk(keys[idx:idx + _deriveChunkSize], srcKey, deriveMap, refreshKey)
+
+
+@CallDeferred
+def ensureDerivedChunk(keys: List[db.Key], srcKey, deriveMap: Dict[str, Any], refreshKey: db.Key = None):
+    """
+    Builds the derives of a chunk of files for :func:`ensureDerivedMany`.
+    """
+    changed = False
+    for key in keys:
+        changed = _buildDerives(key, srcKey, deriveMap) or changed
+    if changed and refreshKey:
+        _refreshSkel(refreshKey)
 
 
 class FileBone(TreeLeafBone):
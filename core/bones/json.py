@@ -1,9 +1,33 @@
 import ast
 import json
 import jsonschema
-from typing import Union, Mapping
+from typing import Any, Mapping, Optional, Union
 from viur.core.bones.base import ReadFromClientError, ReadFromClientErrorSeverity
 from viur.core.bones.raw import RawBone
+from viur.core import conf
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    """
+        Parses *data*, using orjson if conf["viur.bone.json.fastCodec"] is set and it's installed.
+    """
+    if orjson is not None and conf["viur.bone.json.fastCodec"]:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(value: Any) -> str:
+    """
+        Serializes *value* to JSON, using orjson if conf["viur.bone.json.fastCodec"] is set and it's installed.
+    """
+    if orjson is not None and conf["viur.bone.json.fastCodec"]:
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode("UTF-8")
+    return json.dumps(value)
 
 
 class JsonBone(RawBone):
@@ -19,12 +43,15 @@ class JsonBone(RawBone):
         >>>     }
         >>> }
         This will only accept the provided JSON when price is a number and name is a string.
+    :param maxLength Limit the serialized content to maxLength characters; longer input is rejected before parsing.
 
+    The stored string is only parsed when the value is accessed, see :meth:`rawValue`.
     """
 
     type = "raw.json"
 
     def __init__(self, indexed: bool = False, multiple: bool = False, languages: bool = None, schema: Mapping = {},
+                 maxLength: Optional[int] = 1000000,
                  *args,
                  **kwargs):
         super().__init__(*args, **kwargs)
@@ -32,12 +59,16 @@ class JsonBone(RawBone):
         assert not languages
         assert not indexed
         # Validate the schema, if it's invalid a SchemaError will be raised
-        jsonschema.validators.validator_for(False).check_schema(schema)
+        validatorCls = jsonschema.validators.validator_for(schema)
+        validatorCls.check_schema(schema)
         self.schema = schema
+        self.maxLength = maxLength
+        # Compile the validator once; an empty schema accepts anything
+        self._validator = validatorCls(schema) if schema else None
 
     def serialize(self, skel: 'SkeletonInstance', name: str, parentIndexed: bool) -> bool:
         if name in skel.accessedValues:
-            skel.dbEntity[name] = json.dumps(skel.accessedValues[name])
+            skel.dbEntity[name] = dumps(skel.accessedValues[name])
 
             # Ensure this bone is NOT indexed!
             skel.dbEntity.exclude_from_indexes.add(name)
@@ -48,19 +79,33 @@ class JsonBone(RawBone):
 
     def unserialize(self, skel: 'viur.core.skeleton.SkeletonInstance', name: str) -> bool:
         if data := skel.dbEntity.get(name):
-            skel.accessedValues[name] = json.loads(data)
+            skel.accessedValues[name] = loads(data)
             return True
 
         return False
 
+    def rawValue(self, skel: 'viur.core.skeleton.SkeletonInstance', name: str) -> Optional[str]:
+        """
+            Returns the value of this bone as JSON-string. If it hasn't been accessed yet, that's the string stored
+            in the datastore, which is returned without parsing it.
+        """
+        if name not in skel.accessedValues and skel.dbEntity is not None:
+            return skel.dbEntity.get(name) or None
+        value = skel[name]
+        return dumps(value) if value is not None else None
+
     def singleValueFromClient(self, value: Union[str, list, dict], *args, **kwargs):
         if value:
             if not isinstance(value, (list, dict)):
                 value = str(value)
+                if self.maxLength and len(value) > self.maxLength:
+                    return self.getEmptyValue(), [
+                        ReadFromClientError(ReadFromClientErrorSeverity.Invalid, "Maximum length exceeded")
+                    ]
 
                 # Try to parse a JSON string
                 try:
-                    value = json.loads(value)
+                    value = loads(value)
 
                 except json.decoder.JSONDecodeError as e:
                     # Try to parse a Python dict as fallback
@@ -73,12 +118,15 @@ class JsonBone(RawBone):
                             ReadFromClientError(ReadFromClientErrorSeverity.Invalid, f"Invalid JSON supplied: {e!s}")
                         ]
 
-                try:
-                    jsonschema.validate(value, self.schema)
-                except (jsonschema.exceptions.ValidationError, jsonschema.exceptions.SchemaError) as e:
-                    return self.getEmptyValue(), [
-                        ReadFromClientError(ReadFromClientErrorSeverity.Invalid,
-                                            f"Invalid JSON for schema supplied: {e!s}")]
+            elif self.maxLength and len(dumps(value)) > self.maxLength:
+                return self.getEmptyValue(), [
+                    ReadFromClientError(ReadFromClientErrorSeverity.Invalid, "Maximum length exceeded")
+                ]
+
+            if self._validator and (error := jsonschema.exceptions.best_match(self._validator.iter_errors(value))):
+                return self.getEmptyValue(), [
+                    ReadFromClientError(ReadFromClientErrorSeverity.Invalid,
+                                        f"Invalid JSON for schema supplied: {error!s}")]
         return super().singleValueFromClient(value, *args, **kwargs)
 
     def structure(self) -> dict:
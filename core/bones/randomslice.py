@@ -1,30 +1,53 @@
+import logging
+import warnings
+from copy import deepcopy
 from viur.core.bones.base import BaseBone
 from viur.core import db
-from typing import Dict, List, Optional
-from random import random, sample, shuffle
-from itertools import chain
-from math import ceil
+from typing import Any, Dict, List, Optional, Tuple
+from random import random, randrange, Random
 
 
 class RandomSliceBone(BaseBone):
     """
         Simulates the orderby=random from SQL.
         If you sort by this bone, the query will return a random set of elements from that query.
+
+        Each entry stores a random value for each of the *permutations*, so sorting by one of them yields
+        a shuffled order of all entries. A query starts at a random position within one of these orders and
+        continues from there, wrapping around at its end. Only the requested amount of entries is fetched.
+
+        The position is derived from a seed, which is part of the cursor of the query. Paging through the results
+        therefore never returns an entry twice, and the same cursor returns the same entries again (unless they have
+        been modified in the meantime). A seed can be given by the filter ``name.seed`` to reproduce a sequence.
     """
 
     type = "randomslice"
+    cursorPrefix = "randomslice"
 
-    def __init__(self, *, visible=False, readOnly=True, slices=2, sliceSize=0.5, **kwargs):
+    def __init__(self, *, visible=False, readOnly=True, permutations: int = 1, slices=None, sliceSize=None,
+                 **kwargs):
         """
             Initializes a new RandomSliceBone.
 
-
+            :param permutations: The number of independent random orders stored for each entry. Entries
+                written before increasing this are only found in the additional orders after being saved again.
+            :param slices: Deprecated and ignored.
+            :param sliceSize: Deprecated and ignored.
         """
         if visible or not readOnly:
             raise NotImplemented("A RandomSliceBone must not visible and readonly!")
         super().__init__(indexed=True, visible=False, readOnly=True, **kwargs)
-        self.slices = slices
-        self.sliceSize = sliceSize
+        if slices is not None or sliceSize is not None:
+            logging.warning("slices- and sliceSize-parameters to RandomSliceBone are deprecated")
+            warnings.warn("slices- and sliceSize-parameters to RandomSliceBone are deprecated", DeprecationWarning)
+        assert permutations >= 1, "permutations must be at least 1"
+        self.permutations = permutations
+
+    def getPermutationProperty(self, name: str, permutation: int) -> str:
+        """
+            :return: The name of the property storing the random value of *permutation*
+        """
+        return name if not permutation else "%s_%d" % (name, permutation)
 
     def serialize(self, skel: 'SkeletonInstance', name: str, parentIndexed: bool) -> bool:
         """
@@ -32,12 +55,14 @@ class RandomSliceBone(BaseBone):
             can write into the datastore.
 
             This time, we just ignore whatever is set on this bone and write a randomly chosen
-            float [0..1) as value for this bone.
+            float [0..1) as value for this bone (and each further permutation).
 
             :param name: The property-name this bone has in its Skeleton (not the description!)
         """
-        skel.dbEntity[name] = random()
-        skel.dbEntity.exclude_from_indexes.discard(name)  # Random bones can never be not indexed
+        for permutation in range(0, self.permutations):
+            prop = self.getPermutationProperty(name, permutation)
+            skel.dbEntity[prop] = random()
+            skel.dbEntity.exclude_from_indexes.discard(prop)  # Random bones can never be not indexed
         return True
 
     def buildDBSort(
@@ -64,78 +89,127 @@ class RandomSliceBone(BaseBone):
             :returns: The modified :class:`viur.core.db.Query`
         """
 
-        def applyFilterHook(dbfilter, property, value):
-            """
-                Applies dbfilter._filterHook to the given filter if set,
-                else return the unmodified filter.
-                Allows orderby=random also be used in relational-queries.
-            """
-            if dbFilter._filterHook is None:
-                return property, value
-            try:
-                property, value = dbFilter._filterHook(dbFilter, property, value)
-            except:
-                # Either, the filterHook tried to do something special to dbFilter (which won't
-                # work as we are currently rewriting the core part of it) or it thinks that the query
-                # is unsatisfiable (fe. because of a missing ref/parent key in RelationalBone).
-                # In each case we kill the query here - making it to return no results
-                raise RuntimeError()
-            return property, value
-
         if "orderby" in rawFilter and rawFilter["orderby"] == name:
             # We select a random set of elements from that collection
             assert not isinstance(dbFilter.queries,
                                   list), "Orderby random is not possible on a query that already uses an IN-filter!"
+            try:
+                seed = int(rawFilter[name + ".seed"]) if name + ".seed" in rawFilter else None
+            except ValueError:
+                seed = None
             origFilter: dict = dbFilter.queries.filters
-            origKind = dbFilter.getKind()
-            queries = []
-            for unused in range(0, self.slices):  # Fetch 3 Slices from the set
-                rndVal = random()  # Choose our Slice center
-                # Right Side
-                q = db.QueryDefinition(origKind, {}, [])
-                property, value = applyFilterHook(dbFilter, "%s <=" % name, rndVal)
-                q.filters[property] = value
-                q.orders = [(name, db.SortOrder.Descending)]
-                queries.append(q)
-                # Left Side
-                q = db.QueryDefinition(origKind, {}, [])
-                property, value = applyFilterHook(dbFilter, "%s >" % name, rndVal)
-                q.filters[property] = value
-                q.orders = [(name, db.SortOrder.Ascending)]
-                queries.append(q)
-            dbFilter.queries = queries
+            # The actual query depends on the cursor, which isn't known yet
+            dbFilter.queries = [db.QueryDefinition(dbFilter.getKind(), {}, [])]
             # Map the original filter back in
             for k, v in origFilter.items():
                 dbFilter.filter(k, v)
+            # The filters (mapped by the filterHook) on the random property of each permutation
+            filters = []
+            for permutation in range(0, self.permutations):
+                prop = self.getPermutationProperty(name, permutation)
+                filters.append((self._applyFilterHook(dbFilter, "%s >=" % prop, 0.0)[0],
+                                self._applyFilterHook(dbFilter, "%s <" % prop, 0.0)[0]))
+            dbFilter.customQueryInfo["randomSlice"] = {
+                "name": name,
+                "seed": seed if seed is not None else randrange(2 ** 31),
+                "filters": filters,
+            }
             dbFilter._customMultiQueryMerge = self.customMultiQueryMerge
             dbFilter._calculateInternalMultiQueryLimit = self.calculateInternalMultiQueryLimit
 
+    @staticmethod
+    def _applyFilterHook(dbFilter: db.Query, property: str, value: Any) -> Tuple[str, Any]:
+        """
+            Applies dbFilter._filterHook to the given filter if set,
+            else return the unmodified filter.
+            Allows orderby=random also be used in relational-queries.
+        """
+        if dbFilter._filterHook is None:
+            return property, value
+        try:
+            property, value = dbFilter._filterHook(dbFilter, property, value)
+        except:
+            # Either, the filterHook tried to do something special to dbFilter (which won't
+            # work as we are currently rewriting the core part of it) or it thinks that the query
+            # is unsatisfiable (fe. because of a missing ref/parent key in RelationalBone).
+            # In each case we kill the query here - making it to return no results
+            raise RuntimeError()
+        return property, value
+
+    def _parseCursor(self, cursor: Optional[str]) -> Optional[Tuple[int, str, Optional[str]]]:
+        """
+            :return: The seed, phase and datastore cursor encoded in *cursor*, or None if it's not one of ours
+        """
+        try:
+            prefix, seed, phase, innerCursor = (cursor or "").split(":", 3)
+            assert prefix == self.cursorPrefix and phase in ("start", "wrapped")
+            return int(seed), phase, innerCursor or None
+        except (ValueError, AssertionError):
+            return None
+
+    def _buildPhaseQuery(self, dbFilter: db.Query, baseQuery: db.QueryDefinition, phase: str,
+                         startCursor: Optional[str]) -> db.QueryDefinition:
+        """
+            Builds the query fetching the entries from the start position to the end of the permutation
+            (phase "start") or from its beginning up to the start position (phase "wrapped").
+        """
+        info = dbFilter.customQueryInfo["randomSlice"]
+        startFilter, wrappedFilter = info["filters"][info["seed"] % self.permutations]
+        query = deepcopy(baseQuery)
+        query.filters[startFilter if phase == "start" else wrappedFilter] = Random(info["seed"]).random()
+        query.orders = [(startFilter.split(" ")[0], db.SortOrder.Ascending)]
+        query.startCursor = startCursor
+        query.endCursor = None
+        query.currentCursor = None
+        return query
+
     def calculateInternalMultiQueryLimit(self, query: db.Query, targetAmount: int) -> int:
         """
             Tells :class:`viur.core.db.Query` How much entries should be fetched in each subquery.
 
+            Also replaces the placeholder query by the one continuing at the position given by the cursor.
+
             :param targetAmount: How many entries shall be returned from db.Query
             :returns: The amount of elements db.Query should fetch on each subquery
         """
-        return ceil(targetAmount * self.sliceSize)
+        info = query.customQueryInfo["randomSlice"]
+        baseQuery = info.setdefault("baseQuery", query.queries[0])
+        phase, innerCursor = "start", None
+        if parsedCursor := self._parseCursor(baseQuery.startCursor):
+            info["seed"], phase, innerCursor = parsedCursor
+        elif baseQuery.startCursor:
+            logging.debug("Ignoring invalid cursor for %s", info["name"])
+        info["phase"] = phase
+        info["targetAmount"] = targetAmount
+        query.queries = [self._buildPhaseQuery(query, baseQuery, phase, innerCursor)]
+        return targetAmount
 
     def customMultiQueryMerge(self, dbFilter: db.Query, result: List[db.Entity], targetAmount: int) -> List[db.Entity]:
         """
-            Randomly returns 'targetAmount' elements from 'result'
+            Returns the entries of the current phase, continuing with the wrapped phase if these are not enough,
+            and points the cursor of dbFilter behind the last of these.
 
             :param dbFilter: The db.Query calling this function
             :param result: The list of results for each subquery we've run
             :param targetAmount: How many results should be returned from db.Query
             :return: list of elements which should be returned from db.Query
         """
-        # res is a list of iterators at this point, chain them together
-        res = chain(*[list(x) for x in result])
-        # Remove duplicates
-        tmpDict = {}
-        for item in res:
-            tmpDict[str(item.key)] = item
-        res = list(tmpDict.values())
-        # Slice the requested amount of results our 3times lager set
-        res = sample(res, min(len(res), targetAmount))
-        shuffle(res)
+        info = dbFilter.customQueryInfo["randomSlice"]
+        targetAmount = info["targetAmount"]
+        query = dbFilter.queries[0]
+        res = list(result[0])
+        phase = info["phase"]
+        nextCursor = None  # The phase and datastore cursor to continue with
+        if len(res) >= targetAmount:
+            if query.currentCursor:
+                nextCursor = (phase, query.currentCursor)
+            elif phase == "start":
+                nextCursor = ("wrapped", "")
+        elif phase == "start":
+            # Wrap around to the beginning of the permutation
+            wrappedQuery = self._buildPhaseQuery(dbFilter, info["baseQuery"], "wrapped", None)
+            res.extend(dbFilter._fixKind(dbFilter._runSingleFilterQuery(wrappedQuery, targetAmount - len(res))))
+            if len(res) >= targetAmount and wrappedQuery.currentCursor:
+                nextCursor = ("wrapped", wrappedQuery.currentCursor)
+        query.currentCursor = "%s:%d:%s:%s" % ((self.cursorPrefix, info["seed"]) + nextCursor) if nextCursor else None
         return res
@@ -123,6 +123,9 @@ class RecordBone(BaseBone):
         """
         raise NotImplementedError
 
+    def isStructureStatic(self) -> bool:
+        return all(bone.isStructureStatic() for bone in self.using().values())
+
     def structure(self) -> dict:
         return super().structure() | {
             "format": self.format,
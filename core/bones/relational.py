@@ -985,6 +985,12 @@ class RelationalBone(BaseBone):
         elif isinstance(value, list):
             return self._hashValueForUniquePropertyIndex([x["dest"]["key"] for x in value])
 
+    def isStructureStatic(self) -> bool:
+        return all(
+            bone.isStructureStatic()
+            for bone in chain(self._refSkelCache().values(), self.using().values() if self.using else [])
+        )
+
     def structure(self) -> dict:
         return super().structure() | {
             "type": f"{self.type}.{self.kind}",
@@ -1,8 +1,10 @@
 import enum
 from collections import OrderedDict
+from datetime import timedelta
 from numbers import Number
-from typing import Callable, Dict, List, Tuple, Union
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
+from viur.core import current, utils
 from viur.core.bones.base import BaseBone, ReadFromClientError, ReadFromClientErrorSeverity
 from viur.core.i18n import translate
 
@@ -10,8 +12,25 @@ SelectBoneValue = Union[str, Number, enum.Enum]
 SelectBoneMultiple = List[SelectBoneValue]
 
 
+class _SelectBoneValues:
+    """
+        Descriptor providing the values of a :class:`SelectBone` as dict, see :meth:`SelectBone.resolveValues`.
+    """
+
+    def __get__(self, bone, owner=None):
+        if bone is None:
+            return self
+        return bone.resolveValues()[0]
+
+    def __set__(self, bone, values):
+        bone.invalidateValues()
+        bone._values = values
+        bone._valuesToken = object()
+
+
 class SelectBone(BaseBone):
     type = "select"
+    values = _SelectBoneValues()
 
     def __init__(
         self,
@@ -22,6 +41,7 @@ class SelectBone(BaseBone):
             Dict[str, Union[SelectBoneMultiple, SelectBoneValue]],
         ] = None,
         values: Union[Dict, List, Tuple, Callable, enum.EnumMeta] = (),
+        valuesCacheLifetime: Optional[timedelta] = None,
         **kwargs
     ):
         """
@@ -29,6 +49,8 @@ class SelectBone(BaseBone):
 
             :param defaultValue: key(s) which will be checked by default
             :param values: dict of key->value pairs from which the user can choose from.
+            :param valuesCacheLifetime: If *values* is a callable, its result is kept for the current request.
+                If set, it's kept for that duration instead, shared by all requests of this instance.
         """
         super().__init__(defaultValue=defaultValue, **kwargs)
 
@@ -38,30 +60,69 @@ class SelectBone(BaseBone):
 
         assert isinstance(values, (dict, OrderedDict)) or callable(values)
         self._values = values
+        self._valuesCacheLifetime = valuesCacheLifetime
+        self._valuesCache = None  # Tuple of values, lookup and expiry date, if cached beyond the current request
+        # Identifies the values of this instance in the request cache; unlike id(self), it can't be reused by
+        # another bone as long as its cache entry exists. Clones get a new one, as deepcopy copies it.
+        self._valuesToken = object()
 
-    def __getattribute__(self, item):
-        if item == "values":
-            values = self._values
-            if isinstance(values, enum.EnumMeta):
-                values = {value.value: translate(value.name) for value in values}
-            elif callable(values):
-                values = values()
-
-                # handle list/tuple as dicts
-                if isinstance(values, (list, tuple)):
-                    values = {i: translate(i) for i in values}
-
-                assert isinstance(values, (dict, OrderedDict))
-
-            return values
+    def resolveValues(self) -> Tuple[Dict, Dict[str, Any]]:
+        """
+            Returns the values of this bone and a mapping of the str-representation of each key to that key.
 
-        return super().__getattribute__(item)
+            Static values and Enums are resolved once; the results of callables are cached for the current request
+            or *valuesCacheLifetime*, see :meth:`invalidateValues`.
+        """
+        if (cache := self._valuesCache) and (cache[2] is None or cache[2] > utils.utcNow()):
+            return cache[0], cache[1]
+        requestData = current.request_data.get()
+        if requestData is not None and (cache := requestData.get(("viur.selectbone.values", self._valuesToken))):
+            return cache
+
+        values = self._values
+        if isinstance(values, enum.EnumMeta):
+            values = {value.value: translate(value.name) for value in values}
+        elif callable(values):
+            values = values()
+
+            # handle list/tuple as dicts
+            if isinstance(values, (list, tuple)):
+                values = {i: translate(i) for i in values}
+
+            assert isinstance(values, (dict, OrderedDict))
+
+        lookup = self._buildLookup(values)
+
+        if self.isStructureStatic():
+            self._valuesCache = (values, lookup, None)
+        elif self._valuesCacheLifetime:
+            self._valuesCache = (values, lookup, utils.utcNow() + self._valuesCacheLifetime)
+        elif requestData is not None:
+            requestData[("viur.selectbone.values", self._valuesToken)] = (values, lookup)
+        return values, lookup
+
+    @staticmethod
+    def _buildLookup(values: Dict) -> Dict[str, Any]:
+        lookup = {}
+        for key in values:
+            lookup.setdefault(str(key), key)
+        return lookup
+
+    def invalidateValues(self) -> None:
+        """
+            Drops the cached values, so a callable providing them is called again on the next access.
+            This only affects the current instance.
+        """
+        self._valuesCache = None
+        if (requestData := current.request_data.get()) is not None:
+            requestData.pop(("viur.selectbone.values", self._valuesToken), None)
 
     def singleValueUnserialize(self, val):
         if isinstance(self._values, enum.EnumMeta):
-            for value in self._values:
-                if value.value == val:
-                    return value
+            try:
+                return self._values(val)
+            except ValueError:
+                pass
         return val
 
     def singleValueSerialize(self, val, skel: 'SkeletonInstance', name: str, parentIndexed: bool):
@@ -72,14 +133,21 @@ class SelectBone(BaseBone):
     def singleValueFromClient(self, value, skel, name, origData):
         if not str(value):
             return self.getEmptyValue(), [ReadFromClientError(ReadFromClientErrorSeverity.Empty, "No value selected")]
-        for key in self.values.keys():
-            if str(key) == str(value):
-                if isinstance(self._values, enum.EnumMeta):
-                    return self._values(key), None
-                return key, None
+        values, lookup = self.resolveValues()
+        if (value := str(value)) not in lookup or lookup[value] not in values:
+            # The values may have been modified in-place since the lookup was built. It's only extended, so other
+            # threads using it concurrently never miss a value; keys removed from the values are checked above.
+            lookup.update(self._buildLookup(values))
+        if value in lookup and lookup[value] in values:
+            if isinstance(self._values, enum.EnumMeta):
+                return self._values(lookup[value]), None
+            return lookup[value], None
         return self.getEmptyValue(), [
             ReadFromClientError(ReadFromClientErrorSeverity.Invalid, "Invalid value selected")]
 
+    def isStructureStatic(self) -> bool:
+        return not callable(self._values) or isinstance(self._values, enum.EnumMeta)
+
     def structure(self) -> dict:
         return super().structure() | {
             "values": [(k, str(v)) for k, v in self.values.items()],
@@ -4,7 +4,12 @@ import logging, math
 from math import pow, floor, ceil
 from copy import deepcopy
 from math import floor
-from typing import Any, Dict, List, Optional, Tuple, Union
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 def haversine(lat1, lng1, lat2, lng2):
@@ -24,6 +29,23 @@ def haversine(lat1, lng1, lat2, lng2):
     return math.atan2(math.sqrt(d), math.sqrt(1 - d)) * 12742000  # 12742000 = Avg. Earth size (6371km) in meters*2
 
 
+def haversineMany(lat: float, lng: float, lats: Sequence[float], lngs: Sequence[float]) -> Sequence[float]:
+    """
+        Calculates the distances between (lat, lng) and each of the points given by *lats* and *lngs* in Meter.
+        All distances are computed at once if NumPy is installed.
+
+        :return: Distances in Meter, in the order of the given points
+    """
+    if numpy is None:
+        return [haversine(lat, lng, lat2, lng2) for lat2, lng2 in zip(lats, lngs)]
+    lat = math.radians(lat)
+    lng = math.radians(lng)
+    lats = numpy.radians(numpy.asarray(lats, dtype=float))
+    lngs = numpy.radians(numpy.asarray(lngs, dtype=float))
+    d = numpy.sin((lats - lat) / 2.0) ** 2.0 + math.cos(lat) * numpy.cos(lats) * numpy.sin((lngs - lng) / 2.0) ** 2.0
+    return numpy.arctan2(numpy.sqrt(d), numpy.sqrt(1 - d)) * 12742000
+
+
 class SpatialBone(BaseBone):
     """
         Allows to query by Elements close to a given position.
@@ -41,17 +63,40 @@ class SpatialBone(BaseBone):
             improving performance and reducing costs per query.
 
         Example region: Germany: boundsLat=(46.988, 55.022), boundsLng=(4.997, 15.148)
+
+        Each entry is stored with the tiles around its own one, so a query for a single tile returns all entries
+        of the 3x3 tiles around it (a block). Lists can be filtered by
+
+            * ``name.lat`` and ``name.lng``: The entries nearest to that point. If there aren't enough results
+              within the guaranteed distance, the search expands ring by ring to the surrounding blocks
+              (up to maxRings).
+            * additionally ``name.radius``: All entries within that distance (in meters) of the point.
+            * ``name.bbox``: All entries within "latMin,lngMin,latMax,lngMax", nearest to its center (or to
+              ``name.lat``/``name.lng``) first.
+
+        Each block is queried in two halves, north and south of the point, ordered by latitude away from it.
+        This requires composite indexes on (name.tiles.lat, name.tiles.lng, name.coordinates.lat) in both
+        directions, prefixed by the filters of the list.
+
+        The distance up to which the result is guaranteed to be complete is stored as
+        "spatialGuaranteedCorrectness" in the customQueryInfo of the query.
     """
 
     type = "spatial"
 
-    def __init__(self, *, boundsLat: Tuple[float, float], boundsLng: Tuple[float, float], gridDimensions: Tuple[int, int], **kwargs):
+    def __init__(self, *, boundsLat: Tuple[float, float], boundsLng: Tuple[float, float],
+                 gridDimensions: Tuple[int, int], maxRings: int = 1, blockLimit: int = 500, blockLimitFactor: int = 5,
+                 **kwargs):
         """
             Initializes a new SpatialBone.
 
             :param boundsLat: Outer bounds (Latitude) of the region we will search in.
             :param boundsLng: Outer bounds (Latitude) of the region we will search in.
             :param gridDimensions: Number of sub-regions the map will be divided in
+            :param maxRings: How many rings of blocks around the initial one a search may expand to.
+            :param blockLimit: Maximum number of entries fetched for each half of a block.
+            :param blockLimitFactor: Fetch at most this many times the number of entries requested from each half
+                of a block (but not more than blockLimit).
         """
         super().__init__(**kwargs)
         assert isinstance(boundsLat, tuple) and len(boundsLat) == 2, "boundsLat must be a tuple of (float, float)"
@@ -72,6 +117,9 @@ class SpatialBone(BaseBone):
         self.boundsLat = boundsLat
         self.boundsLng = boundsLng
         self.gridDimensions = gridDimensions
+        self.maxRings = maxRings
+        self.blockLimit = blockLimit
+        self.blockLimitFactor = blockLimitFactor
 
     def getGridSize(self):
         """
@@ -82,6 +130,95 @@ class SpatialBone(BaseBone):
         lngDelta = float(self.boundsLng[1] - self.boundsLng[0])
         return latDelta / float(self.gridDimensions[0]), lngDelta / float(self.gridDimensions[1])
 
+    def getTile(self, lat: float, lng: float) -> Tuple[int, int]:
+        """
+            :return: The tile containing the point (lat, lng)
+        """
+        gridSizeLat, gridSizeLng = self.getGridSize()
+        return int(floor((lat - self.boundsLat[0]) / gridSizeLat)), int(floor((lng - self.boundsLng[0]) / gridSizeLng))
+
+    def getBlockBounds(self, block: Tuple[int, int]) -> Tuple[float, float, float, float]:
+        """
+            :return: The area (latMin, lngMin, latMax, lngMax) covered by the 3x3 tiles around the tile *block*
+        """
+        gridSizeLat, gridSizeLng = self.getGridSize()
+        return (
+            self.boundsLat[0] + (block[0] - 1) * gridSizeLat,
+            self.boundsLng[0] + (block[1] - 1) * gridSizeLng,
+            self.boundsLat[0] + (block[0] + 2) * gridSizeLat,
+            self.boundsLng[0] + (block[1] + 2) * gridSizeLng,
+        )
+
+    def _isBlockInBounds(self, block: Tuple[int, int]) -> bool:
+        return -1 <= block[0] <= self.gridDimensions[0] + 1 and -1 <= block[1] <= self.gridDimensions[1] + 1
+
+    def _ringBlocks(self, tile: Tuple[int, int], ring: int) -> List[Tuple[int, int]]:
+        """
+            :return: The blocks of the *ring*-th ring around the block of *tile*
+        """
+        res = []
+        for i in range(-ring, ring + 1):
+            for j in range(-ring, ring + 1):
+                if max(abs(i), abs(j)) == ring and self._isBlockInBounds(block := (tile[0] + 3 * i, tile[1] + 3 * j)):
+                    res.append(block)
+        return res
+
+    def _areaBlocks(self, tile: Tuple[int, int], area: Tuple[float, float, float, float]) -> List[Tuple[int, int]]:
+        """
+            :return: The blocks aligned to the block of *tile* needed to cover *area*
+        """
+        minLat, minLng = self.getTile(area[0], area[1])
+        maxLat, maxLng = self.getTile(area[2], area[3])
+        return [
+            block
+            for i in range(ceil((minLat - 1 - tile[0]) / 3), floor((maxLat + 1 - tile[0]) / 3) + 1)
+            for j in range(ceil((minLng - 1 - tile[1]) / 3), floor((maxLng + 1 - tile[1]) / 3) + 1)
+            if self._isBlockInBounds(block := (tile[0] + 3 * i, tile[1] + 3 * j))
+        ]
+
+    @staticmethod
+    def _distanceToArea(lat: float, lng: float, area: Tuple[float, float, float, float]) -> float:
+        """
+            :return: The distance from (lat, lng) to *area* in Meter, or 0 if it's inside
+        """
+        return haversine(lat, lng, min(max(lat, area[0]), area[2]), min(max(lng, area[1]), area[3]))
+
+    def _distanceToEdge(self, lat: float, lng: float, area: Tuple[float, float, float, float]) -> float:
+        """
+            :return: The distance from (lat, lng) to the nearest edge of *area* that's inside our bounds, in Meter
+        """
+        return min([
+            haversine(lat, lng, area[0], lng) if area[0] > self.boundsLat[0] else math.inf,
+            haversine(lat, lng, lat, area[1]) if area[1] > self.boundsLng[0] else math.inf,
+            haversine(lat, lng, area[2], lng) if area[2] < self.boundsLat[1] else math.inf,
+            haversine(lat, lng, lat, area[3]) if area[3] < self.boundsLng[1] else math.inf,
+        ])
+
+    def _blockQueries(self, name: str, origQuery: db.QueryDefinition, block: Tuple[int, int],
+                      lat: float) -> List[Tuple[Tuple[int, int], db.QueryDefinition]]:
+        """
+            Splits *block* at *lat* into a northern and a southern half, each ordered by the distance in latitude
+            to *lat*. If a half has more entries than we fetch, the ones left out are at least as far away as the
+            last one fetched. Halves lying completely beyond the block are skipped.
+
+            :return: The pairs of (block, query) for each half
+        """
+        res = []
+        latMin, _, latMax, _ = self.getBlockBounds(block)
+        for op, order, isEmpty in (
+            (" >=", db.SortOrder.Ascending, latMax < lat),
+            (" <", db.SortOrder.Descending, latMin >= lat),
+        ):
+            if isEmpty:
+                continue
+            query = deepcopy(origQuery)
+            query.filters[name + ".tiles.lat ="] = block[0]
+            query.filters[name + ".tiles.lng ="] = block[1]
+            query.filters[name + ".coordinates.lat" + op] = lat
+            query.orders = [(name + ".coordinates.lat", order)]
+            res.append((block, query))
+        return res
+
     def isInvalid(self, value: Tuple[float, float]) -> Union[str, bool]:
         """
             Tests, if the point given by 'value' is inside our boundaries.
@@ -210,107 +347,177 @@ class SpatialBone(BaseBone):
             :returns: The modified :class:`viur.core.db.Query`
         """
         assert prefix is None, "You cannot use spatial data in a relation for now"
-        if name + ".lat" in rawFilter and name + ".lng" in rawFilter:
-            try:
+        hasPoint = name + ".lat" in rawFilter and name + ".lng" in rawFilter
+        if not hasPoint and name + ".bbox" not in rawFilter:
+            return
+        radius = bbox = None
+        try:
+            if name + ".bbox" in rawFilter:
+                bbox = tuple(float(x) for x in str(rawFilter[name + ".bbox"]).split(","))
+                assert len(bbox) == 4 and bbox[0] <= bbox[2] and bbox[1] <= bbox[3]
+                # Nothing can be found outside our bounds
+                bbox = (max(bbox[0], self.boundsLat[0]), max(bbox[1], self.boundsLng[0]),
+                        min(bbox[2], self.boundsLat[1]), min(bbox[3], self.boundsLng[1]))
+            if hasPoint:
                 lat = float(rawFilter[name + ".lat"])
                 lng = float(rawFilter[name + ".lng"])
-            except:
-                logging.debug("Received invalid values for lat/lng in %s", name)
-                dbFilter.datastoreQuery = None
-                return
-            if self.isInvalid((lat, lng)):
-                logging.debug("Values out of range in %s", name)
-                dbFilter.datastoreQuery = None
-                return
-            gridSizeLat, gridSizeLng = self.getGridSize()
-            tileLat = int(floor((lat - self.boundsLat[0]) / gridSizeLat))
-            tileLng = int(floor((lng - self.boundsLng[0]) / gridSizeLng))
-            assert isinstance(dbFilter.queries, db.QueryDefinition)  # Not supported on multi-queries
-            origQuery = dbFilter.queries
-            # Lat - Right Side
-            q1 = deepcopy(origQuery)
-            q1.filters[name + ".coordinates.lat >="] = lat
-            q1.filters[name + ".tiles.lat ="] = tileLat
-            q1.orders = [(name + ".coordinates.lat", db.SortOrder.Ascending)]
-            # Lat - Left Side
-            q2 = deepcopy(origQuery)
-            q2.filters[name + ".coordinates.lat <"] = lat
-            q2.filters[name + ".tiles.lat ="] = tileLat
-            q2.orders = [(name + ".coordinates.lat", db.SortOrder.Descending)]
-            # Lng - Down
-            q3 = deepcopy(origQuery)
-            q3.filters[name + ".coordinates.lng >="] = lng
-            q3.filters[name + ".tiles.lng ="] = tileLng
-            q3.orders = [(name + ".coordinates.lng", db.SortOrder.Ascending)]
-            # Lng - Top
-            q4 = deepcopy(origQuery)
-            q4.filters[name + ".coordinates.lng <"] = lng
-            q4.filters[name + ".tiles.lng ="] = tileLng
-            q4.orders = [(name + ".coordinates.lng", db.SortOrder.Descending)]
-            dbFilter.queries = [q1, q2, q3, q4]
-            dbFilter._customMultiQueryMerge = lambda *args, **kwargs: self.customMultiQueryMerge(name, lat, lng, *args,
-                                                                                                 **kwargs)
-            dbFilter._calculateInternalMultiQueryLimit = self.calculateInternalMultiQueryLimit
-
-    # return super().buildDBFilter(name, skel, dbFilter, rawFilter)
+            else:
+                lat, lng = (bbox[0] + bbox[2]) / 2, (bbox[1] + bbox[3]) / 2
+            if name + ".radius" in rawFilter:
+                radius = float(rawFilter[name + ".radius"])
+                assert radius > 0
+        except:
+            logging.debug("Received invalid values for lat/lng/radius/bbox in %s", name)
+            dbFilter.queries = None
+            return
+        if self.isInvalid((lat, lng)) or (bbox and (bbox[0] > bbox[2] or bbox[1] > bbox[3])):
+            logging.debug("Values out of range in %s", name)
+            dbFilter.queries = None
+            return
+        assert isinstance(dbFilter.queries, db.QueryDefinition)  # Not supported on multi-queries
+        origQuery = dbFilter.queries
+        tile = self.getTile(lat, lng)
+        area = bbox
+        if radius:
+            # The area around our point containing the circle of that radius
+            radiusLat = math.degrees(radius / 6371000)
+            radiusLng = radiusLat / max(math.cos(math.radians(lat)), 1e-6)
+            area = (lat - radiusLat, lng - radiusLng, lat + radiusLat, lng + radiusLng)
+            if bbox:
+                area = (max(area[0], bbox[0]), max(area[1], bbox[1]), min(area[2], bbox[2]), min(area[3], bbox[3]))
+        if area:
+            blocks = self._areaBlocks(tile, area)
+            # Don't query more blocks than a search expanding to maxRings would
+            blocks.sort(key=lambda x: self._distanceToArea(lat, lng, self.getBlockBounds(x)))
+            maxBlocks = (2 * self.maxRings + 1) ** 2
+            blocks, droppedBlocks = blocks[:maxBlocks], blocks[maxBlocks:]
+        else:
+            blocks = self._ringBlocks(tile, 0)
+            droppedBlocks = []
+        subQueries = [x for block in blocks for x in self._blockQueries(name, origQuery, block, lat)]
+        if not subQueries:
+            dbFilter.queries = None
+            return
+        dbFilter.queries = [query for _, query in subQueries]
+        dbFilter._customMultiQueryMerge = lambda *args, **kwargs: self.customMultiQueryMerge(
+            name, lat, lng, *args, blocks=[block for block, _ in subQueries], droppedBlocks=droppedBlocks,
+            origQuery=origQuery,
+            radius=radius, bbox=bbox, **kwargs)
+        dbFilter._calculateInternalMultiQueryLimit = self.calculateInternalMultiQueryLimit
 
     def calculateInternalMultiQueryLimit(self, dbQuery: db.Query, targetAmount: int):
         """
             Tells :class:`viur.core.db.Query` How much entries should be fetched in each subquery.
 
             :param targetAmount: How many entries shall be returned from db.Query
-            :returns: The amount of elements db.Query should fetch on each subquery
+            :returns: The amount of elements db.Query should fetch on each subquery (each half of a block)
         """
-        return targetAmount * 2
+        dbQuery.customQueryInfo["spatialTargetAmount"] = targetAmount
+        blockLimit = max(min(self.blockLimit, targetAmount * self.blockLimitFactor), 1)
+        dbQuery.customQueryInfo["spatialBlockLimit"] = blockLimit
+        return blockLimit
 
     def customMultiQueryMerge(self, name, lat, lng, dbFilter: db.Query,
-                              result: List[db.Entity], targetAmount: int
+                              result: List[List[db.Entity]], targetAmount: int,
+                              blocks: List[Tuple[int, int]] = (), droppedBlocks: List[Tuple[int, int]] = (),
+                              origQuery: Optional[db.QueryDefinition] = None, radius: Optional[float] = None,
+                              bbox: Optional[Tuple[float, float, float, float]] = None
                               ) -> List[db.Entity]:
         """
-            Randomly returns 'targetAmount' elements from 'result'
+            Returns the 'targetAmount' elements from 'result' nearest to (lat, lng).
+
+            Without a radius or bbox, the blocks of the next ring are queried as long as there are less than
+            'targetAmount' results within the distance guaranteed to be correct.
 
-            :param name:
-            :param lat:
-            :param lng:
+            :param name: The name of this bone
+            :param lat: Latitude of the point searched for
+            :param lng: Longitude of the point searched for
             :param dbFilter: The db.Query calling this function
             :param result: The list of results for each subquery we've run
             :param targetAmount: How many results should be returned from db.Query
+            :param blocks: The block queried by each of the subqueries
+            :param droppedBlocks: Blocks which would have been needed to cover the radius or bbox, but weren't queried
+            :param origQuery: The query to derive the subqueries of further blocks from
+            :param radius: Only return entries within that distance in Meter
+            :param bbox: Only return entries within (latMin, lngMin, latMax, lngMax)
             :return: List of elements which should be returned from db.Query
         """
-        assert len(result) == 4  # There should be exactly one result for each direction
-        result = [list(x) for x in result]  # Remove the iterators
-        latRight, latLeft, lngBottom, lngTop = result
-        gridSizeLat, gridSizeLng = self.getGridSize()
-        # Calculate the outer bounds we've reached - used to tell to which distance we can
-        # prove the result to be correct.
-        # If a result further away than this distance there might be missing results before that result
-        # If there are no results in a give lane (f.e. because we are close the border and there is no point
-        # in between) we choose a arbitrary large value for that lower bound
-        expectedAmount = self.calculateInternalMultiQueryLimit(dbFilter,
-                                                               targetAmount)  # How many items we expect in each direction
-        limits = [
-            haversine(latRight[-1][name]["coordinates"]["lat"], lng, lat, lng) if latRight and len(
-                latRight) == expectedAmount else 2 ** 31,  # Lat - Right Side
-            haversine(latLeft[-1][name]["coordinates"]["lat"], lng, lat, lng) if latLeft and len(
-                latLeft) == expectedAmount else 2 ** 31,  # Lat - Left Side
-            haversine(lat, lngBottom[-1][name]["coordinates"]["lng"], lat, lng) if lngBottom and len(
-                lngBottom) == expectedAmount else 2 ** 31,  # Lng - Bottom
-            haversine(lat, lngTop[-1][name]["coordinates"]["lng"], lat, lng) if lngTop and len(
-                lngTop) == expectedAmount else 2 ** 31,  # Lng - Top
-            haversine(lat + gridSizeLat, lng, lat, lng),
-            haversine(lat, lng + gridSizeLng, lat, lng)
-        ]
-        dbFilter.customQueryInfo["spatialGuaranteedCorrectness"] = min(limits)
-        logging.debug("SpatialGuaranteedCorrectness: %s", dbFilter.customQueryInfo["spatialGuaranteedCorrectness"])
-        # Filter duplicates
-        tmpDict = {}
-        for item in (latRight + latLeft + lngBottom + lngTop):
-            tmpDict[str(item.key)] = item
+        targetAmount = dbFilter.customQueryInfo.get("spatialTargetAmount", targetAmount)
+        blockLimit = dbFilter.customQueryInfo.get("spatialBlockLimit", self.blockLimit)
+        entries = {}  # Unique entries by their key
+        truncated = [math.inf]  # Distance up to which no entry can be missing from the halves we didn't fully fetch
+
+        def collect(blocks, results):
+            for block, blockResult in zip(blocks, results):
+                blockResult = list(blockResult)
+                if len(blockResult) >= blockLimit:
+                    # Entries left out are further away in latitude than the last one fetched
+                    lastLat = blockResult[-1][name]["coordinates"]["lat"]
+                    truncated.append(max(self._distanceToArea(lat, lng, self.getBlockBounds(block)),
+                                         haversine(lat, lng, lastLat, lng)))
+                for entry in blockResult:
+                    if (value := entry.get(name)) and value.get("coordinates"):
+                        entries[str(entry.key)] = entry
+
+        collect(blocks, result)
+        tile = self.getTile(lat, lng)
+        ring = 0
+        while True:
+            entryList = list(entries.values())
+            lats = [x[name]["coordinates"]["lat"] for x in entryList]
+            lngs = [x[name]["coordinates"]["lng"] for x in entryList]
+            distances = haversineMany(lat, lng, lats, lngs)
+            if radius or bbox:
+                guaranteed = min(
+                    [min(truncated), radius or math.inf]
+                    + [self._distanceToArea(lat, lng, self.getBlockBounds(x)) for x in droppedBlocks]
+                    + ([self._distanceToEdge(lat, lng, bbox)] if bbox else []))
+                break
+            gridSizeLat, gridSizeLng = self.getGridSize()
+            coveredBounds = self.getBlockBounds(tile)
+            coveredBounds = (coveredBounds[0] - 3 * ring * gridSizeLat, coveredBounds[1] - 3 * ring * gridSizeLng,
+                             coveredBounds[2] + 3 * ring * gridSizeLat, coveredBounds[3] + 3 * ring * gridSizeLng)
+            guaranteed = min(min(truncated), self._distanceToEdge(lat, lng, coveredBounds))
+            if ring >= self.maxRings or guaranteed == math.inf \
+                    or len(self._selectNearest(distances, lats, lngs, len(distances), guaranteed)) >= targetAmount:
+                break
+            ring += 1
+            ringQueries = [
+                x for block in self._ringBlocks(tile, ring) for x in self._blockQueries(name, origQuery, block, lat)
+            ]
+            collect([block for block, _ in ringQueries], [
+                dbFilter._fixKind(dbFilter._runSingleFilterQuery(query, blockLimit)) for _, query in ringQueries
+            ])
+        dbFilter.customQueryInfo["spatialGuaranteedCorrectness"] = guaranteed
+        logging.debug("SpatialGuaranteedCorrectness: %s", guaranteed)
         # Build up the final results
-        tmpList = [(haversine(x[name]["coordinates"]["lat"], x[name]["coordinates"]["lng"], lat, lng), x) for x in
-                   tmpDict.values()]
-        tmpList.sort(key=lambda x: x[0])
-        return [x[1] for x in tmpList[:targetAmount]]
+        return [entryList[idx] for idx in self._selectNearest(distances, lats, lngs, targetAmount, radius, bbox)]
+
+    @staticmethod
+    def _selectNearest(distances: Sequence[float], lats: List[float], lngs: List[float], amount: int,
+                       radius: Optional[float] = None,
+                       bbox: Optional[Tuple[float, float, float, float]] = None) -> List[int]:
+        """
+            :return: The indexes of the *amount* points nearest within *radius* and *bbox*, ordered by distance
+        """
+        if numpy is not None:
+            distances = numpy.asarray(distances, dtype=float)
+            mask = numpy.ones(len(distances), dtype=bool)
+            if radius is not None:
+                mask &= distances <= radius
+            if bbox:
+                lats = numpy.asarray(lats, dtype=float)
+                lngs = numpy.asarray(lngs, dtype=float)
+                mask &= (lats >= bbox[0]) & (lats <= bbox[2]) & (lngs >= bbox[1]) & (lngs <= bbox[3])
+            candidates = numpy.flatnonzero(mask)
+            return candidates[numpy.argsort(distances[candidates], kind="stable")][:amount].tolist()
+        candidates = [
+            (distance, idx) for idx, distance in enumerate(distances)
+            if (radius is None or distance <= radius)
+            and (not bbox or (bbox[0] <= lats[idx] <= bbox[2] and bbox[1] <= lngs[idx] <= bbox[3]))
+        ]
+        candidates.sort()
+        return [idx for _, idx in candidates[:amount]]
 
     def setBoneValue(
         self,
@@ -70,58 +70,94 @@ class CollectBlobKeys(HTMLParser):
                         self.blobs.add(blobKey)
 
 
+_filterChars = frozenset("\"'\\\0\r\n@()")  # Characters not allowed in attribute names and values
+_filterCharsRelaxed = frozenset("\"'\\\0\r\n")  # Same, but allowing @ and () for title, href and alt
+_validClassChars = frozenset(string.ascii_lowercase + string.ascii_uppercase + string.digits + "-")
+_escapeData = str.maketrans({"<": "&lt;", ">": "&gt;", "\"": "&quot;", "'": "&#39;", "\0": None})
+
+
+class HtmlWhitelist:
+    """
+        The validHtml structure of a TextBone (see :prop:_defaultTags), compiled into sets for fast lookups.
+    """
+    __slots__ = ("validTags", "validAttrs", "validStyles", "validClasses", "validClassPrefixes", "singleTags")
+
+    def __init__(self, validHtml: Dict):
+        self.validTags = frozenset(validHtml.get("validTags") or ())
+        self.validAttrs = {tag: frozenset(attrs) for tag, attrs in (validHtml.get("validAttrs") or {}).items()}
+        self.validStyles = frozenset(validHtml.get("validStyles") or ())
+        validClasses = validHtml.get("validClasses") or ()
+        self.validClasses = frozenset(x for x in validClasses if not x.endswith("*"))
+        self.validClassPrefixes = tuple(x[:-1] for x in validClasses if x.endswith("*"))
+        self.singleTags = frozenset(validHtml.get("singleTags") or ())
+
+    def isValidClass(self, className: str) -> bool:
+        """
+            Checks if the class-name matches or is white-listed by a prefix
+        """
+        return className in self.validClasses or className.startswith(self.validClassPrefixes)
+
+
 class HtmlSerializer(HTMLParser):  # html.parser.HTMLParser
-    def __init__(self, validHtml=None, srcSet=None):
-        global _defaultTags
+    def __init__(self, validHtml: Union[None, Dict, HtmlWhitelist] = None, srcSet=None,
+                 files: Optional[Dict[str, db.Entity]] = None):
+        """
+            :param validHtml: The whitelist, either a structure like :prop:_defaultTags or its compiled HtmlWhitelist
+            :param srcSet: If set, inject srcset tags to embedded images, see :class:`TextBone`
+            :param files: Mapping of dlkeys to their file entries used to build the srcsets. If not given, it's
+                fetched by :func:`viur.core.bones.file.fetchFilesByDlKey` for all images before sanitizing.
+        """
         super(HtmlSerializer, self).__init__()
-        self.result = ""  # The final result that will be returned
-        self.openTagsList = []  # List of tags that still need to be closed
+        self.buffer = []  # Chunks of the final result that will be returned
+        self.openTagsList = []  # Stack of tags that still need to be closed, the innermost one last
         self.tagCache = []  # Tuple of tags that have been processed but not written yet
+        if validHtml and not isinstance(validHtml, HtmlWhitelist):
+            validHtml = HtmlWhitelist(validHtml)
         self.validHtml = validHtml
         self.srcSet = srcSet
+        self.files = files
+
+    @property
+    def result(self) -> str:
+        return "".join(self.buffer)
 
     def handle_data(self, data):
-        data = str(data) \
-            .replace("<", "&lt;") \
-            .replace(">", "&gt;") \
-            .replace("\"", "&quot;") \
-            .replace("'", "&#39;") \
-            .replace("\0", "")
+        data = str(data).translate(_escapeData)
         if data.strip():
             self.flushCache()
-            self.result += data
+            self.buffer.append(data)
 
     def handle_charref(self, name):
         self.flushCache()
-        self.result += "&#%s;" % (name)
+        self.buffer.append("&#%s;" % (name))
 
     def handle_entityref(self, name):  # FIXME
-        if name in htmlentitydefs.entitydefs.keys():
+        if name in htmlentitydefs.entitydefs:
             self.flushCache()
-            self.result += "&%s;" % (name)
+            self.buffer.append("&%s;" % (name))
 
     def flushCache(self):
         """
             Flush pending tags into the result and push their corresponding end-tags onto the stack
         """
         for start, end in self.tagCache:
-            self.result += start
-            self.openTagsList.insert(0, end)
+            self.buffer.append(start)
+            self.openTagsList.append(end)
         self.tagCache = []
 
     def handle_starttag(self, tag, attrs):
         """ Delete all tags except for legal ones """
-        filterChars = "\"'\\\0\r\n@()"
-        if self.validHtml and tag in self.validHtml["validTags"]:
-            cacheTagStart = '<' + tag
+        if self.validHtml and tag in self.validHtml.validTags:
+            cacheTagStart = ['<' + tag]
+            validAttrs = self.validHtml.validAttrs.get(tag, ())
             isBlankTarget = False
             styles = None
             classes = None
             for k, v in attrs:
                 k = k.strip()
-                v = v.strip()
-                if any([c in k for c in filterChars]) or any([c in v for c in filterChars]):
-                    if k in {"title", "href", "alt"} and not any([c in v for c in "\"'\\\0\r\n"]):
+                v = (v or "").strip()
+                if not _filterChars.isdisjoint(k) or not _filterChars.isdisjoint(v):
+                    if k in {"title", "href", "alt"} and _filterCharsRelaxed.isdisjoint(v):
                         # If we have a title or href attribute, ignore @ and ()
                         pass
                     else:
@@ -146,15 +182,15 @@ class HtmlSerializer(HTMLParser):  # html.parser.HTMLParser
                         if self.srcSet:
                             # Build the src set with files already available. If a derived file is not yet build,
                             # getReferencedBlobs will catch it, build it, and we're going to be re-called afterwards.
-                            fileObj = db.Query("file").filter("dlkey =", blobKey) \
-                                .order(("creationdate", db.SortOrder.Ascending)).getEntry()
-                            srcSet = utils.srcSetFor(fileObj, None, self.srcSet.get("width"), self.srcSet.get("height"))
-                            cacheTagStart += ' srcSet="%s"' % srcSet
-                if not tag in self.validHtml["validAttrs"].keys() or not k in self.validHtml["validAttrs"][tag]:
+                            if (fileObj := self.fileFor(blobKey)) is not None:
+                                srcSet = utils.srcSetFor(
+                                    fileObj, None, self.srcSet.get("width"), self.srcSet.get("height"))
+                                cacheTagStart.append(' srcSet="%s"' % srcSet)
+                if k not in validAttrs:
                     # That attribute is not valid on this tag
                     continue
                 if k.lower()[0:2] != 'on' and v.lower()[0:10] != 'javascript':
-                    cacheTagStart += ' %s="%s"' % (k, v)
+                    cacheTagStart.append(' %s="%s"' % (k, v))
                 if tag == "a" and k == "target" and v.lower() == "_blank":
                     isBlankTarget = True
             if styles:
@@ -162,84 +198,83 @@ class HtmlSerializer(HTMLParser):  # html.parser.HTMLParser
                 for s in styles:
                     style = s[: s.find(":")].strip()
                     value = s[s.find(":") + 1:].strip()
-                    if any([c in style for c in filterChars]) or any(
-                        [c in value for c in filterChars]):
+                    if not _filterChars.isdisjoint(style) or not _filterChars.isdisjoint(value):
                         # Either the key or the value contains a character that's not supposed to be there
                         continue
                     if value.lower().startswith("expression") or value.lower().startswith("import"):
                         # IE evaluates JS inside styles if the keyword expression is present
                         continue
-                    if style in self.validHtml["validStyles"] and not any(
-                        [(x in value) for x in ["\"", ":", ";"]]):
+                    if style in self.validHtml.validStyles and ":" not in value and ";" not in value:
                         syleRes[style] = value
-                if len(syleRes.keys()):
-                    cacheTagStart += " style=\"%s\"" % "; ".join(
-                        [("%s: %s" % (k, v)) for (k, v) in syleRes.items()])
+                if syleRes:
+                    cacheTagStart.append(" style=\"%s\"" % "; ".join(
+                        [("%s: %s" % (k, v)) for (k, v) in syleRes.items()]))
             if classes:
-                validClasses = []
-                for currentClass in classes:
-                    validClassChars = string.ascii_lowercase + string.ascii_uppercase + string.digits + "-"
-                    if not all([x in validClassChars for x in currentClass]):
-                        # The class contains invalid characters
-                        continue
-                    isOkay = False
-                    for validClass in self.validHtml["validClasses"]:
-                        # Check if the classname matches or is white-listed by a prefix
-                        if validClass == currentClass:
-                            isOkay = True
-                            break
-                        if validClass.endswith("*"):
-                            validClass = validClass[:-1]
-                            if currentClass.startswith(validClass):
-                                isOkay = True
-                                break
-                    if isOkay:
-                        validClasses.append(currentClass)
+                validClasses = [
+                    currentClass for currentClass in classes
+                    # Skip classes containing invalid characters
+                    if _validClassChars.issuperset(currentClass) and self.validHtml.isValidClass(currentClass)
+                ]
                 if validClasses:
-                    cacheTagStart += " class=\"%s\"" % " ".join(validClasses)
+                    cacheTagStart.append(" class=\"%s\"" % " ".join(validClasses))
             if isBlankTarget:
                 # Add rel tag to prevent the browser to pass window.opener around
-                cacheTagStart += " rel=\"noopener noreferrer\""
-            if tag in self.validHtml["singleTags"]:
+                cacheTagStart.append(" rel=\"noopener noreferrer\"")
+            cacheTagStart.append(">")  # dont need slash in void elements in html5
+            if tag in self.validHtml.singleTags:
                 # Single-Tags do have a visual representation; ensure it makes it into the result
                 self.flushCache()
-                self.result += cacheTagStart + '>'  # dont need slash in void elements in html5
+                self.buffer.append("".join(cacheTagStart))
             else:
                 # We opened a 'normal' tag; push it on the cache so it can be discarded later if
                 # we detect it has no content
-                cacheTagStart += '>'
-                self.tagCache.append((cacheTagStart, tag))
+                self.tagCache.append(("".join(cacheTagStart), tag))
         else:
-            self.result += " "
+            self.buffer.append(" ")
 
     def handle_endtag(self, tag):
         if self.validHtml:
             if self.tagCache:
                 # Check if that element is still on the cache
                 # and just silently drop the cache up to that point
-                if tag in [x[1] for x in self.tagCache] + self.openTagsList:
-                    for tagCache in self.tagCache[::-1]:
-                        self.tagCache.remove(tagCache)
-                        if tagCache[1] == tag:
+                if tag in self.openTagsList or any(x[1] == tag for x in self.tagCache):
+                    while self.tagCache:
+                        if self.tagCache.pop()[1] == tag:
                             return
             if tag in self.openTagsList:
                 # Close all currently open Tags until we reach the current one. If no one is found,
                 # we just close everything and ignore the tag that should have been closed
-                for endTag in self.openTagsList[:]:
-                    self.result += "</%s>" % endTag
-                    self.openTagsList.remove(endTag)
+                while self.openTagsList:
+                    endTag = self.openTagsList.pop()
+                    self.buffer.append("</%s>" % endTag)
                     if endTag == tag:
                         break
 
     def cleanup(self):  # FIXME: vertauschte tags
         """ Append missing closing tags """
         self.flushCache()
-        for tag in self.openTagsList:
-            endTag = '</%s>' % tag
-            self.result += endTag
+        while self.openTagsList:
+            self.buffer.append("</%s>" % self.openTagsList.pop())
+
+    def fileFor(self, blobKey: str) -> Optional[db.Entity]:
+        """
+            Returns the file entry of *blobKey* from the files fetched in advance
+        """
+        if blobKey not in self.files:
+            # Not collected in advance (the whitelist allows src on other tags than img), fetch it now
+            from viur.core.bones.file import fetchFilesByDlKey
+            self.files.update(fetchFilesByDlKey([blobKey]))
+        return self.files.get(blobKey)
 
     def sanitize(self, instr):
-        self.result = ""
+        if self.srcSet and self.files is None:
+            # Fetch the file entries of all embedded images at once, instead of one by one while sanitizing
+            from viur.core.bones.file import fetchFilesByDlKey
+            collector = CollectBlobKeys()
+            collector.feed(instr)
+            collector.close()
+            self.files = fetchFilesByDlKey(collector.blobs)
+        self.buffer = []
         self.openTagsList = []
         self.feed(instr)
         self.close()
@@ -277,6 +312,7 @@ class TextBone(BaseBone):
             validHtml = _defaultTags
 
         self.validHtml = validHtml
+        self.htmlWhitelist = HtmlWhitelist(validHtml) if validHtml else None
         self.maxLength = maxLength
         self.srcSet = srcSet
 
@@ -286,7 +322,7 @@ class TextBone(BaseBone):
     def singleValueFromClient(self, value, skel, name, origData):
         err = self.isInvalid(value)  # Returns None on success, error-str otherwise
         if not err:
-            return HtmlSerializer(self.validHtml, self.srcSet).sanitize(value), None
+            return HtmlSerializer(self.htmlWhitelist, self.srcSet).sanitize(value), None
         else:
             return self.getEmptyValue(), [ReadFromClientError(ReadFromClientErrorSeverity.Invalid, err)]
 
@@ -325,12 +361,10 @@ class TextBone(BaseBone):
                                  {"height": x} for x in (self.srcSet.get("height") or [])
                              ]
             }
-            from viur.core.bones.file import ensureDerived
-            for blob_key in blob_keys:
-                file_obj = db.Query("file").filter("dlkey =", blob_key) \
-                    .order(("creationdate", db.SortOrder.Ascending)).getEntry()
-                if file_obj:
-                    ensureDerived(file_obj.key, "%s_%s" % (skel.kindName, name), derive_dict, skel["key"])
+            from viur.core.bones.file import ensureDerivedMany, fetchFilesByDlKey
+            if fileKeys := [fileObj.key for fileObj in fetchFilesByDlKey(blob_keys).values()]:
+                # Build the derives of all referenced files in one task, which refreshes this skeleton afterwards
+                ensureDerivedMany(fileKeys, "%s_%s" % (skel.kindName, name), derive_dict, skel["key"])
 
         return blob_keys
 
@@ -2,6 +2,7 @@ import logging, os
 from datetime import timedelta
 from functools import wraps
 from hashlib import sha512
+from types import GeneratorType
 from typing import List, Union, Callable, Tuple, Dict
 
 from viur.core import tasks, utils, db, current
@@ -148,6 +149,9 @@ def wrapCallable(f, urls: List[str], userSensitive: int, languageSensitive: bool
         oldAccessLog = db.startDataAccessLog()
         try:
             res = f(self, *args, **kwargs)
+            if isinstance(res, GeneratorType):
+                # Streamed responses have to be rendered completely to be stored
+                res = "".join(res)
         finally:
             accessedEntries = db.endDataAccessLog(oldAccessLog)
         dbEntity = db.Entity(db.Key(viurCacheName, key))
@@ -81,6 +81,9 @@ conf = Conf({
     # Allowed values that define a str to evaluate to true
     "viur.bone.boolean.str2true": ("true", "yes", "1"),
 
+    # If set, JsonBones use orjson (if installed) instead of the json module to store their values
+    "viur.bone.json.fastCodec": False,
+
     # If set, this function will be called for each cache-attempt and the result will be included in
     # the computed cache-key
     "viur.cacheEnvironmentKey": None,
@@ -148,9 +151,19 @@ conf = Conf({
     # Hmac-Key used to sign download urls - set automatically
     "viur.file.hmacKey": None,
 
+    # Storage of the blobs of the File module; the project's Cloud Storage bucket if None.
+    # A viur.core.storage.LocalBlobStorage allows running the file handling without access to Cloud Storage
+    "viur.file.blobStorage": None,
+
+    # Maximum size in bytes of an upload received by file/upload (LocalBlobStorage) if its URL doesn't specify the size
+    "viur.file.maxUploadSize": 100 * 1024 * 1024,
+
     # Call-Map for file pre-processors
     "viur.file.derivers": {},
 
+    # Number of processes rendering thumbnails, so several files are processed in parallel (0 renders them in-process)
+    "viur.file.thumbnailerProcesses": 0,
+
     # Name of this version as deployed to the appengine
     "viur.instance.app_version": __app_version,
 
@@ -214,12 +227,41 @@ conf = Conf({
     # The default duration, for which downloadURLs generated by the html renderer will stay valid
     "viur.render.html.downloadUrlExpiration": None,
 
+    # Cache for compiled templates: True keeps them in memory, shared by all modules, a path stores them in that
+    # directory, a jinja2.BytecodeCache is used as it is, and None disables caching
+    "viur.render.html.bytecodeCache": True,
+
+    # Directory of the templates compiled by viur.core.render.html.default.Render.precompileTemplates()
+    "viur.render.html.precompiledTemplates": None,
+
     # The default duration, for which downloadURLs generated by the json renderer will stay valid
     "viur.render.json.downloadUrlExpiration": None,
 
+    # If set, the json renderer uses orjson (if installed) instead of the json module
+    "viur.render.json.fastEncoder": False,
+
+    # If set, lists rendered by the json renderer are streamed to the client entry by entry
+    "viur.render.json.streamLists": False,
+
+    # If set, the xml renderer indents its output
+    "viur.render.xml.prettyPrint": True,
+
+    # If set, lists rendered by the xml renderer are streamed to the client entry by entry
+    "viur.render.xml.streamLists": False,
+
     # Allows the application to register a function that's called before the request gets routed
     "viur.requestPreprocessor": None,
 
+    # Maximum number of key-ranges processed at the same time when rebuilding the search index
+    "viur.searchIndex.rebuild.parallelism": 8,
+
+    # Number of key-ranges the allocated ids of each kind get split into when rebuilding the search index
+    # (ids below them and named keys get a key-range of their own each)
+    "viur.searchIndex.rebuild.shards": 16,
+
+    # Key-ranges not finished within this time are given up when rebuilding the search index, so it still finishes
+    "viur.searchIndex.rebuild.shardTimeout": datetime.timedelta(hours=6),
+
     # Characters valid for the internal search functionality (all other chars are ignored)
     "viur.searchValidChars": "abcdefghijklmnopqrstuvwxyzäöüß0123456789",
 
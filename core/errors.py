@@ -149,7 +149,7 @@ class RequestTooLarge(HTTPException):
     """
         RequestTooLarge
 
-        Not used inside viur.core
+        Raised if an upload exceeds conf["viur.file.maxUploadSize"]
     """
 
     def __init__(self, descr: str = "Request Too Large"):
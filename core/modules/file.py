@@ -3,23 +3,23 @@ import email.header
 import google.auth
 import json
 import logging
+import multiprocessing
 import string
 import html
-from PIL import Image, ImageCms
 from base64 import urlsafe_b64decode
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta
-from google.auth import compute_engine
-from google.auth.transport import requests
 from google.cloud import iam_credentials_v1, storage
 from google.oauth2.service_account import Credentials as ServiceAccountCredentials
-from io import BytesIO
 from quopri import decodestring
-from typing import Any, List, Tuple, Union
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Union
 from urllib.request import urlopen
 from viur.core import db, conf, errors, exposed, forcePost, forceSSL, securitykey, utils, current
 from viur.core.bones import BaseBone, BooleanBone, KeyBone, NumericBone, StringBone
 from viur.core.prototypes.tree import SkelType, Tree, TreeSkel
 from viur.core.skeleton import SkeletonInstance, skeletonByKind
+from viur.core.storage import BlobStorage, GCSBlobStorage, LocalBlobStorage
+from viur.core.thumbnails import renderThumbnails
 from viur.core.tasks import PeriodicTask, CallDeferred
 from viur.core.utils import sanitizeFileName
 
@@ -27,6 +27,14 @@ credentials, project = google.auth.default()
 client = storage.Client(project, credentials)
 bucket = client.lookup_bucket(f"""{conf["viur.instance.project_id"]}.appspot.com""")
 iamClient = iam_credentials_v1.IAMCredentialsClient()
+_gcsBlobStorage = GCSBlobStorage(bucket, credentials)
+
+
+def getBlobStorage() -> BlobStorage:
+    """
+        Returns the storage holding the blobs, as selected by conf["viur.file.blobStorage"].
+    """
+    return conf["viur.file.blobStorage"] or _gcsBlobStorage
 
 
 def importBlobFromViur2(dlKey, fileName):
@@ -87,57 +95,47 @@ class InjectStoreURLBone(BaseBone):
         return False
 
 
+_thumbnailerPool = None
+
+
+def _getThumbnailerPool() -> Optional[ProcessPoolExecutor]:
+    """
+    Returns the process pool used to render thumbnails, or None if they should be rendered in this process.
+
+    The processes are started by a forkserver, as forking this process is unsafe once gRPC has started its threads.
+    """
+    global _thumbnailerPool
+    if not (processes := conf["viur.file.thumbnailerProcesses"]):
+        return None
+    if _thumbnailerPool is None:
+        _thumbnailerPool = ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context("forkserver"))
+    return _thumbnailerPool
+
+
 def thumbnailer(fileSkel, existingFiles, params):
     file_name = html.unescape(fileSkel["name"])
-    blob = bucket.get_blob("%s/source/%s" % (fileSkel["dlkey"], file_name))
-    if not blob:
-        logging.warning("Blob %s/source/%s is missing from cloud storage!" % (fileSkel["dlkey"], file_name))
+    sourcePath = "%s/source/%s" % (fileSkel["dlkey"], file_name)
+    blobStorage = getBlobStorage()
+    fileData = blobStorage.get(sourcePath)
+    if fileData is None:
+        logging.warning("Blob %s is missing from cloud storage!" % sourcePath)
         return
-    fileData = BytesIO()
-    blob.download_to_file(fileData)
-    resList = []
-    for sizeDict in params:
-        fileData.seek(0)
-        outData = BytesIO()
-        try:
-            img = Image.open(fileData)
-        except Image.UnidentifiedImageError:  # We can't load this image; so there's no need to try other resolutions
-            return []
-        iccProfile = img.info.get('icc_profile')
-        if iccProfile:
-            # JPEGs might be encoded with a non-standard color-profile; we need to compensate for this if we convert
-            # to WEBp as we'll loose this color-profile information
-            f = BytesIO(iccProfile)
-            src_profile = ImageCms.ImageCmsProfile(f)
-            dst_profile = ImageCms.createProfile('sRGB')
-            try:
-                img = ImageCms.profileToProfile(img,
-                                                inputProfile=src_profile,
-                                                outputProfile=dst_profile,
-                                                outputMode="RGB")
-            except Exception as e:
-                logging.exception(e)
-                continue
-        fileExtension = sizeDict.get("fileExtension", "webp")
-        if "width" in sizeDict and "height" in sizeDict:
-            width = sizeDict["width"]
-            height = sizeDict["height"]
-            targetName = "thumbnail-%s-%s.%s" % (width, height, fileExtension)
-        elif "width" in sizeDict:
-            width = sizeDict["width"]
-            height = int((float(img.size[1]) * float(width / float(img.size[0]))))
-            targetName = "thumbnail-w%s.%s" % (width, fileExtension)
-        else:  # No default fallback - ignore
-            continue
-        mimeType = sizeDict.get("mimeType", "image/webp")
-        img = img.resize((width, height), Image.ANTIALIAS)
-        img.save(outData, fileExtension)
-        outSize = outData.tell()
-        outData.seek(0)
-        targetBlob = bucket.blob("%s/derived/%s" % (fileSkel["dlkey"], targetName))
-        targetBlob.upload_from_file(outData, content_type=mimeType)
-        resList.append((targetName, outSize, mimeType, {"mimetype": mimeType, "width": width, "height": height}))
-    return resList
+    if pool := _getThumbnailerPool():
+        targets, encoded = pool.submit(renderThumbnails, fileData, params).result()
+    else:
+        targets, encoded = renderThumbnails(fileData, params)
+    if not targets:
+        return []
+
+    def upload(target, data):
+        blobStorage.put("%s/derived/%s" % (fileSkel["dlkey"], target[2]), data, target[4])
+
+    with ThreadPoolExecutor(min(len(targets), 8)) as executor:
+        list(executor.map(upload, targets, encoded))
+    return [
+        (targetName, len(data), mimeType, {"mimetype": mimeType, "width": width, "height": height})
+        for (width, height, targetName, _, mimeType, _), data in zip(targets, encoded)
+    ]
 
 
 def cloudfunction_thumbnailer(fileSkel, existingFiles, params):
@@ -170,18 +168,12 @@ def cloudfunction_thumbnailer(fileSkel, existingFiles, params):
             signedUrl = utils.downloadUrlFor(fileSkel["dlkey"], fileSkel["name"])
         else:
             path = f"""{fileSkel["dlkey"]}/source/{file_name}"""
-            if not (blob := bucket.get_blob(path)):
+            if not blobStorage.stat(path):
                 logging.warning(f"Blob {path} is missing from cloud storage!")
                 return None
-            authRequest = requests.Request()
-            expiresAt = datetime.now() + timedelta(seconds=60)
-            signing_credentials = compute_engine.IDTokenCredentials(authRequest, "")
             contentDisposition = "filename=%s" % fileSkel["name"]
-            signedUrl = blob.generate_signed_url(
-                expiresAt,
-                credentials=signing_credentials,
-                response_disposition=contentDisposition,
-                version="v4")
+            signedUrl = blobStorage.signedUrl(path, timedelta(seconds=60), contentDisposition) \
+                or utils.downloadUrlFor(fileSkel["dlkey"], fileSkel["name"])
         return signedUrl
 
     def make_request():
@@ -218,6 +210,7 @@ def cloudfunction_thumbnailer(fileSkel, existingFiles, params):
         return response_data
 
     file_name = html.unescape(fileSkel["name"])
+    blobStorage = getBlobStorage()
 
     if not (url := getsignedurl()):
         return
@@ -236,9 +229,8 @@ def cloudfunction_thumbnailer(fileSkel, existingFiles, params):
     uploadUrls = {}
     for data in derivedData["values"]:
         fileName = sanitizeFileName(data["name"])
-        blob = bucket.blob("%s/derived/%s" % (fileSkel["dlkey"], fileName))
-        uploadUrls[fileSkel["dlkey"] + fileName] = blob.create_resumable_upload_session(timeout=60,
-                                                                                        content_type=data["mimeType"])
+        uploadUrls[fileSkel["dlkey"] + fileName] = blobStorage.uploadUrl(
+            "%s/derived/%s" % (fileSkel["dlkey"], fileName), data["mimeType"])
 
     if not (url := getsignedurl()):
         return
@@ -416,12 +408,11 @@ class File(Tree):
         """
         dl_key = utils.generateRandomString()
 
-        blob = bucket.blob("%s/source/%s" % (dl_key, filename))
-        blob.upload_from_file(BytesIO(content), content_type=mimetype)
+        getBlobStorage().put("%s/source/%s" % (dl_key, filename), content, mimetype)
 
         skel = self.addSkel("leaf")
         skel["name"] = filename
-        skel["size"] = blob.size
+        skel["size"] = len(content)
         skel["mimetype"] = mimetype
         skel["dlkey"] = dl_key
         skel["weak"] = True
@@ -430,21 +421,10 @@ class File(Tree):
 
         return skel.toDB()
 
-    @CallDeferred
-    def deleteRecursive(self, parentKey):
-        files = db.Query(self.leafSkelCls().kindName).filter("parentdir =", parentKey).iter()
-        for fileEntry in files:
-            utils.markFileForDeletion(fileEntry["dlkey"])
-            skel = self.leafSkelCls()
-
-            if skel.fromDB(str(fileEntry.key())):
-                skel.delete()
-        dirs = db.Query(self.nodeSkelCls().kindName).filter("parentdir", parentKey).iter()
-        for d in dirs:
-            self.deleteRecursive(d.key)
-            skel = self.nodeSkelCls()
-            if skel.fromDB(d.key):
-                skel.delete()
+    def deleteSubtreeEntry(self, skelType, entity):
+        if skelType == "leaf" and entity.get("dlkey"):
+            utils.markFileForDeletion(entity["dlkey"])
+        super().deleteSubtreeEntry(skelType, entity)
 
     def signUploadURL(self, mimeTypes: Union[List[str], None] = None, maxSize: Union[int, None] = None,
                       node: Union[str, None] = None):
@@ -487,12 +467,10 @@ class File(Tree):
         :param size: The *exact* filesize we're accepting in Bytes. Used to enforce a filesize limit by getUploadURL
         :return: Str-Key of the new file-leaf entry, the signed upload-url
         """
-        global bucket
         fileName = sanitizeFileName(fileName)
 
         targetKey = utils.generateRandomString()
-        blob = bucket.blob("%s/source/%s" % (targetKey, fileName))
-        uploadUrl = blob.create_resumable_upload_session(content_type=mimeType, size=size, timeout=60)
+        uploadUrl = getBlobStorage().uploadUrl("%s/source/%s" % (targetKey, fileName), mimeType, size)
         # Create a corresponding file-lock object early, otherwise we would have to ensure that the file-lock object
         # the user creates matches the file he had uploaded
         fileSkel = self.addSkel("leaf")
@@ -577,12 +555,13 @@ class File(Tree):
     @exposed
     def download(self, blobKey: str, fileName: str = "", download: str = "", sig: str = "", *args, **kwargs):
         """
-        Download a file.
+        Download a file. If it's served directly (instead of redirecting to the storage), it's streamed and
+        conditional (If-None-Match) and range requests (Range, If-Range) are supported.
         :param blobKey: The unique blob key of the file.
         :param fileName: Optional filename to provide in the header.
         :param download: Set header to attachment retrival, set explictly to "1" if download is wanted.
         """
-        global credentials, bucket
+        blobStorage = getBlobStorage()
         if not sig:
             # Check if the current user has the right to download *any* blob present in this application.
             # blobKey is then the path inside cloudstore - not a base64 encoded tuple
@@ -591,7 +570,7 @@ class File(Tree):
             if "root" not in usr["access"] and "file-view" not in usr["access"]:
                 raise errors.Forbidden()
             validUntil = "-1"  # Prevent this from being cached down below
-            blob = bucket.get_blob(blobKey)
+            dlPath = blobKey
             downloadFilename = ""
         else:
             # We got an request including a signature (probably a guest or a user without file-view access)
@@ -606,8 +585,7 @@ class File(Tree):
                 downloadFilename = ""
             if validUntil != "0" and datetime.strptime(validUntil, "%Y%m%d%H%M") < datetime.now():
                 raise errors.Gone()
-            blob = bucket.get_blob(dlPath)
-        if not blob:
+        if not (blob := blobStorage.stat(dlPath)):
             raise errors.Gone()
         if downloadFilename:
             contentDisposition = "attachment; filename=%s" % downloadFilename
@@ -617,35 +595,63 @@ class File(Tree):
         else:
             fileName = sanitizeFileName(blob.name.split("/")[-1])
             contentDisposition = "filename=%s" % fileName
+        request = current.request.get()
         if isinstance(credentials, ServiceAccountCredentials):  # We run locally with an service-account.json
-            expiresAt = datetime.now() + timedelta(seconds=60)
-            signedUrl = blob.generate_signed_url(expiresAt, response_disposition=contentDisposition, version="v4")
-            raise errors.Redirect(signedUrl)
+            signedUrl = blobStorage.signedUrl(dlPath, timedelta(seconds=60), contentDisposition)
         elif conf["viur.instance.is_dev_server"]:  # No Service-Account to sign with - Serve everything directly
-            response = current.request.get().response
-            response.headers["Content-Type"] = blob.content_type
-            if contentDisposition:
-                response.headers["Content-Disposition"] = contentDisposition
-            return blob.download_as_bytes()
-        else:  # We are inside the appengine
-            if validUntil == "0":  # Its an indefinitely valid URL
-                if blob.size < 5 * 1024 * 1024:  # Less than 5 MB - Serve directly and push it into the ede caches
-                    response = current.request.get().response
-                    response.headers["Content-Type"] = blob.content_type
-                    response.headers["Cache-Control"] = "public, max-age=604800"  # 7 Days
-                    if contentDisposition:
-                        response.headers["Content-Disposition"] = contentDisposition
-                    return blob.download_as_bytes()
-            # Default fallback - create a signed URL and redirect
-            authRequest = requests.Request()
-            expiresAt = datetime.now() + timedelta(seconds=60)
-            signing_credentials = compute_engine.IDTokenCredentials(authRequest, "")
-            signedUrl = blob.generate_signed_url(
-                expiresAt,
-                credentials=signing_credentials,
-                response_disposition=contentDisposition,
-                version="v4")
+            signedUrl = None
+        elif validUntil == "0" and blob.size < 5 * 1024 * 1024:
+            # Its an indefinitely valid URL and less than 5 MB - Serve directly and push it into the ede caches
+            signedUrl = None
+            request.response.headers["Cache-Control"] = "public, max-age=604800"  # 7 Days
+        else:  # Default fallback - create a signed URL and redirect
+            signedUrl = blobStorage.signedUrl(dlPath, timedelta(seconds=60), contentDisposition)
+        if signedUrl:
             raise errors.Redirect(signedUrl)
+        # The storage can't (or we shouldn't) redirect to it, so serve the blob ourselves
+        request.response.headers["Content-Type"] = blob.mimeType
+        if contentDisposition:
+            request.response.headers["Content-Disposition"] = contentDisposition
+        try:
+            return blobStorage.serve(dlPath, request.request, request.response, blob)
+        except FileNotFoundError:
+            raise errors.Gone()
+
+    @exposed
+    @forcePost
+    def upload(self, blobKey: str, sig: str, *args, **kwargs):
+        """
+        Receives an upload to a URL created by :meth:`LocalBlobStorage.uploadUrl`; the contents of the file are the
+        body of the request.
+
+        The size of the body is checked before it's read, against the size signed in the URL or
+        conf["viur.file.maxUploadSize"]. Each URL can only be used once, uploads to an existing blob are refused.
+        :param blobKey: The path of the blob, its expiry date and size as signed by the storage.
+        :param sig: The signature of blobKey.
+        """
+        blobStorage = getBlobStorage()
+        if not isinstance(blobStorage, LocalBlobStorage):  # Other storages receive uploads themselves
+            raise errors.NotFound()
+        if not (token := blobStorage.verifyUploadToken(blobKey, sig)):
+            raise errors.Forbidden()
+        dlPath, size, expired = token
+        if expired:
+            raise errors.Gone()
+        request = current.request.get().request
+        if size is not None:
+            if request.content_length != size:
+                raise errors.PreconditionFailed()
+        elif request.content_length is None:
+            raise errors.PreconditionFailed()  # We must know how much will be read
+        elif request.content_length > conf["viur.file.maxUploadSize"]:
+            raise errors.RequestTooLarge()
+        if blobStorage.stat(dlPath):
+            raise errors.Gone()  # This URL has already been used, like an expired one
+        try:
+            blobStorage.put(dlPath, request.body, request.content_type, overwrite=False)
+        except FileExistsError:  # Used by a concurrent request
+            raise errors.Gone()
+        return "OKAY"
 
     @exposed
     @forceSSL
@@ -677,13 +683,13 @@ class File(Tree):
                     raise errors.Forbidden()
                 session["pendingFileUploadKeys"].remove(targetKey)
                 session.markChanged()
-            blobs = list(bucket.list_blobs(prefix="%s/" % skel["dlkey"]))
+            blobs = getBlobStorage().list("%s/" % skel["dlkey"])
             if len(blobs) != 1:
                 logging.error("Invalid number of blobs in folder")
                 logging.error(targetKey)
                 raise errors.PreconditionFailed()
             blob = blobs[0]
-            skel["mimetype"] = utils.escapeString(blob.content_type)
+            skel["mimetype"] = utils.escapeString(blob.mimeType)
             if any([x in blob.name for x in "$<>'\""]):  # Prevent these Characters from being used in a fileName
                 raise errors.PreconditionFailed()
             skel["name"] = utils.escapeString(blob.name.replace("%s/source/" % skel["dlkey"], ""))
@@ -704,14 +710,12 @@ class File(Tree):
         if old_skel["name"] == skel["name"]:  # name not changed we can return
             return
         # Move Blob to new name
-        # https://cloud.google.com/storage/docs/copying-renaming-moving-objects
         old_path = f"{skel['dlkey']}/source/{html.unescape(old_skel['name'])}"
         new_path = f"{skel['dlkey']}/source/{html.unescape(skel['name'])}"
-        old_blob = bucket.get_blob(old_path)
-        if not old_blob:
+        blobStorage = getBlobStorage()
+        if not blobStorage.copy(old_path, new_path):
             raise errors.Gone()
-        bucket.copy_blob(old_blob, bucket, new_path, if_generation_match=0)
-        bucket.delete_blob(old_path)
+        blobStorage.delete([old_path])
 
     def onItemUploaded(self, skel):
         pass
@@ -729,37 +733,55 @@ def startCheckForUnreferencedBlobs():
     doCheckForUnreferencedBlobs()
 
 
+def referencedBlobKeys(dlKeys: Iterable[str]) -> Set[str]:
+    """
+        Returns the download-keys of *dlKeys* that are still referenced by any entry.
+
+        The keys are resolved in chunks; the IN-filter fans out to one query per key, which are all sent before
+        waiting for their results. One referencing lock-object is sufficient for each of them.
+    """
+    dlKeys = list(dict.fromkeys(dlKeys))
+    res = set()
+    for idx in range(0, len(dlKeys), 30):
+        for lockObj in db.Query("viur-blob-locks").filter("active_blob_references IN", dlKeys[idx:idx + 30]).run(1):
+            res.update(lockObj["active_blob_references"] or [])
+    return res.intersection(dlKeys)
+
+
 @CallDeferred
 def doCheckForUnreferencedBlobs(cursor=None):
-    def getOldBlobKeysTxn(dbKey):
-        obj = db.Get(dbKey)
-        res = obj["old_blob_references"] or []
-        if obj["is_stale"]:
-            db.Delete(dbKey)
-        else:
-            obj["has_old_blob_references"] = False
-            obj["old_blob_references"] = []
-            db.Put(obj)
+    def getOldBlobKeysTxn(dbKeys):
+        res = []
+        putList = []
+        deleteList = []
+        for obj in db.Get(dbKeys):
+            if not obj:  # Deleted in the meantime
+                continue
+            res.extend(obj["old_blob_references"] or [])
+            if obj["is_stale"]:
+                deleteList.append(obj.key)
+            else:
+                obj["has_old_blob_references"] = False
+                obj["old_blob_references"] = []
+                putList.append(obj)
+        if putList:
+            db.Put(putList)
+        if deleteList:
+            db.Delete(deleteList)
         return res
 
     query = db.Query("viur-blob-locks").filter("has_old_blob_references", True).setCursor(cursor)
-    for lockObj in query.run(100):
-        oldBlobKeys = db.RunInTransaction(getOldBlobKeysTxn, lockObj.key)
-        for blobKey in oldBlobKeys:
-            if db.Query("viur-blob-locks").filter("active_blob_references =", blobKey).getEntry():
-                # This blob is referenced elsewhere
-                logging.info("Stale blob is still referenced, %s" % blobKey)
-                continue
-            # Add a marker and schedule it for deletion
-            fileObj = db.Query("viur-deleted-files").filter("dlkey", blobKey).getEntry()
-            if fileObj:  # Its already marked
-                logging.info("Stale blob already marked for deletion, %s" % blobKey)
-                return
-            fileObj = db.Entity(db.Key("viur-deleted-files"))
-            fileObj["itercount"] = 0
-            fileObj["dlkey"] = str(blobKey)
-            logging.info("Stale blob marked dirty, %s" % blobKey)
-            db.Put(fileObj)
+    lockKeys = [lockObj.key for lockObj in query.run(100)]
+    oldBlobKeys = set()
+    # Lock-objects are written by every save of their entry, so keep the transactions small
+    for idx in range(0, len(lockKeys), 25):
+        oldBlobKeys.update(db.RunInTransaction(getOldBlobKeysTxn, lockKeys[idx:idx + 25]))
+    referenced = referencedBlobKeys(oldBlobKeys)
+    for blobKey in referenced:
+        # This blob is referenced elsewhere
+        logging.info("Stale blob is still referenced, %s" % blobKey)
+    # Add a marker and schedule it for deletion
+    utils.markFilesForDeletion(oldBlobKeys - referenced)
     newCursor = query.getCursor()
     if newCursor:
         doCheckForUnreferencedBlobs(newCursor)
@@ -780,26 +802,38 @@ def doCleanupDeletedFiles(cursor=None):
     query = db.Query("viur-deleted-files")
     if cursor:
         query.setCursor(cursor)
-    for file in query.run(100):
+    files = query.run(100)
+    referenced = referencedBlobKeys(file["dlkey"] for file in files if file.get("dlkey"))
+    putList = []
+    deleteList = []
+    finalDlKeys = []
+    for file in files:
         if not "dlkey" in file:
-            db.Delete(file.key)
-        elif db.Query("viur-blob-locks").filter("active_blob_references =", file["dlkey"]).getEntry():
+            deleteList.append(file.key)
+        elif file["dlkey"] in referenced:
             logging.info("is referenced, %s" % file["dlkey"])
-            db.Delete(file.key)
+            deleteList.append(file.key)
+        elif file["itercount"] > maxIterCount:
+            logging.info("Finally deleting, %s" % file["dlkey"])
+            finalDlKeys.append(file["dlkey"])
+            deleteList.append(file.key)
         else:
-            if file["itercount"] > maxIterCount:
-                logging.info("Finally deleting, %s" % file["dlkey"])
-                blobs = bucket.list_blobs(prefix="%s/" % file["dlkey"])
-                for blob in blobs:
-                    blob.delete()
-                db.Delete(file.key)
-                # There should be exactly 1 or 0 of these
-                for f in skeletonByKind("file")().all().filter("dlkey =", file["dlkey"]).fetch(99):
-                    f.delete()
-            else:
-                logging.debug("Increasing count, %s" % file["dlkey"])
-                file["itercount"] += 1
-                db.Put(file)
+            logging.debug("Increasing count, %s" % file["dlkey"])
+            file["itercount"] += 1
+            putList.append(file)
+    if finalDlKeys:
+        blobStorage = getBlobStorage()
+        with ThreadPoolExecutor(8) as executor:
+            blobLists = list(executor.map(lambda dlKey: blobStorage.list("%s/" % dlKey), finalDlKeys))
+        blobStorage.delete([blob.name for blobs in blobLists for blob in blobs])
+    if putList:
+        db.Put(putList)
+    if deleteList:
+        db.Delete(deleteList)
+    # There should be exactly 1 or 0 of these for each download-key
+    for idx in range(0, len(finalDlKeys), 30):
+        for f in skeletonByKind("file")().all().filter("dlkey IN", finalDlKeys[idx:idx + 30]).fetch(99):
+            f.delete()
     newCursor = query.getCursor()
     if newCursor:
         doCleanupDeletedFiles(newCursor)
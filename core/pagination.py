@@ -1,7 +1,11 @@
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
 from hashlib import sha256
-from typing import List, Optional
+from typing import List, Optional, Tuple
 
 from viur.core import db, utils
+from viur.core.tasks import CallDeferred
 
 
 class Pagination:
@@ -21,6 +25,11 @@ class Pagination:
     page. When the entities returned by the query change (eg a new post is added), call :meth:refresh_index for
     each affected query.
 
+    Refreshing an index doesn't discard it: If entities have only been appended to the end of the query, the
+    cursors of the new pages are appended to the index. Otherwise, the index gets rebuilt by a deferred task,
+    while the previous (stale) index is served in the meantime. Recently used indexes are also kept in memory
+    (up to cache_size of them, for at most cache_lifetime).
+
     .. Note::
 
         The refreshAll Method is missing - intentionally. Whenever data changes you have to call
@@ -30,16 +39,23 @@ class Pagination:
 
     _db_type = "viur_pagination"
 
-    def __init__(self, page_size: int = 10, max_pages: int = 100):
+    def __init__(self, page_size: int = 10, max_pages: int = 100, cache_size: int = 64,
+                 cache_lifetime: timedelta = timedelta(minutes=1)):
         """
         :param page_size: How many entities shall fit on one page
         :param max_pages: How many pages are build.
             Items become unreachable if the amount of items exceeds
             page_size*max_pages (i.e. if a forum-thread has more than
             page_size*max_pages Posts, Posts after that barrier won't show up).
+        :param cache_size: How many indexes are kept in memory. 0 disables this cache.
+        :param cache_lifetime: How long an index is served from memory before it's loaded again
+            (it might have been refreshed on another instance).
         """
         self.page_size = page_size
         self.max_pages = max_pages
+        self.cache_size = cache_size
+        self.cache_lifetime = cache_lifetime
+        self._cache: OrderedDict[str, Tuple[List[Optional[str]], datetime]] = OrderedDict()
 
     def key_from_query(self, query: db.Query) -> str:
         """
@@ -65,6 +81,59 @@ class Pagination:
         filter_key = "".join("%s%s" % (x, y) for x, y in orig_filter)
         return sha256(filter_key.encode()).hexdigest()
 
+    def _cache_get(self, key: str) -> Optional[List[Optional[str]]]:
+        if (cached := self._cache.get(key)) is None:
+            return None
+        cursors, loaded = cached
+        if loaded + self.cache_lifetime < utils.utcNow():
+            self._cache.pop(key, None)
+            return None
+        try:
+            self._cache.move_to_end(key)
+        except KeyError:  # Dropped by another thread in the meantime
+            pass
+        return cursors
+
+    def _cache_set(self, key: str, cursors: List[Optional[str]]) -> None:
+        if not self.cache_size:
+            return
+        self._cache[key] = (cursors, utils.utcNow())
+        try:
+            self._cache.move_to_end(key)
+        except KeyError:
+            pass
+        while len(self._cache) > self.cache_size:
+            try:
+                self._cache.popitem(last=False)
+            except KeyError:
+                break
+
+    def extend_cursors(self, query: db.Query, cursors: List[Optional[str]]) -> List[Optional[str]]:
+        """
+        Scans the query from the start of the last page in *cursors* onwards and appends the start-cursors
+        of all pages following it (up to max_pages).
+
+        :param query: Query to scan
+        :param cursors: The start-cursors of the pages known so far (starting with None for the first page)
+        :returns: The updated list of start-cursors
+        """
+        cursors = list(cursors) or [None]
+        query = query.clone()
+        if cursors[-1]:
+            query.setCursor(cursors[-1])
+        while len(cursors) <= self.max_pages:
+            query_res = query.run(limit=self.page_size)
+            if not query_res:
+                # This cursor returns no data, remove it
+                cursors.pop()
+                break
+            if query.getCursor() is None or len(cursors) == self.max_pages:
+                # We reached the end of our data
+                break
+            cursors.append(query.getCursor())
+            query.setCursor(query.getCursor())
+        return cursors
+
     def get_or_build_index(self, orig_query: db.Query) -> List[str]:
         """
         Builds a specific index based on origQuery
@@ -72,34 +141,35 @@ class Pagination:
         Returns a list of starting-cursors for each page.
         You probably shouldn't call this directly. Use cursor_for_query.
 
+        If the index has been refreshed and is being rebuilt, the previous index is returned.
+
         :param orig_query: Query to build the index for
         """
         key = self.key_from_query(orig_query)
 
+        if (cursors := self._cache_get(key)) is not None:
+            return cursors
+
         # We don't have it cached - try to load it from DB
         index = db.Get(db.Key(self._db_type, key))
         if index is not None:
+            if index.get("stale") and index.get("staledate") \
+                    and index["staledate"] + _rebuild_timeout < utils.utcNow() \
+                    and db.RunInTransaction(_txn_claim_rebuild, index.key):
+                # The rebuild should have been finished long ago - the task might got lost
+                logging.warning("Pagination index %s is stale since %s, rebuilding it", key, index["staledate"])
+                rebuild_pagination_index(key, self.page_size, self.max_pages)
+            self._cache_set(key, index["data"])
             return index["data"]
 
         # We don't have this index yet... Build it
-        query = orig_query.clone()
-        cursors = [None]
-        while len(cursors) < self.max_pages:
-            query_res = query.run(limit=self.page_size)
-            if not query_res:
-                # This cursor returns no data, remove it
-                cursors.pop()
-                break
-            if query.getCursor() is None:
-                # We reached the end of our data
-                break
-            cursors.append(query.getCursor())
-            query.setCursor(query.getCursor())
-
+        cursors = self.extend_cursors(orig_query, [None])
         entry = db.Entity(db.Key(self._db_type, key))
         entry["data"] = cursors
         entry["creationdate"] = utils.utcNow()
+        _store_query(entry, orig_query)
         db.Put(entry)
+        self._cache_set(key, cursors)
         return cursors
 
     def cursor_for_query(self, query: db.Query, page: int) -> Optional[str]:
@@ -131,12 +201,127 @@ class Pagination:
         """
         return self.get_or_build_index(query)
 
-    def refresh_index(self, query: db.Query) -> None:
+    def refresh_index(self, query: db.Query, appended_only: bool = False) -> None:
         """
-        Refreshes the Index for the given query
-        (Actually it removes it from the db, so it gets rebuild on next use)
+        Refreshes the Index for the given query.
+
+        If entities have only been added to the end of the query's order (like a new post in a thread, sorted by its
+        creation date), pass appended_only=True: Only the cursors of the new tail pages are scanned and appended.
+        Otherwise, the index is marked as stale and gets rebuilt by a deferred task; until then, the stale
+        index is still served.
 
         :param query: Query for which the index should be refreshed
+        :param appended_only: Entities have only been appended to the end of the query
         """
         key = self.key_from_query(query)
-        db.Delete(db.Key(self._db_type, key))
+        self._cache.pop(key, None)
+        db_key = db.Key(self._db_type, key)
+
+        if appended_only:
+            if not (index := db.Get(db_key)) or index.get("stale"):
+                return  # Will be built on next use or is being rebuilt anyway
+            cursors = self.extend_cursors(query, index["data"])
+
+            def txn_extend():
+                if (index := db.Get(db_key)) and not index.get("stale"):
+                    index["data"] = cursors
+                    db.Put(index)
+
+            db.RunInTransaction(txn_extend)
+            return
+
+        def txn_mark_stale() -> bool:
+            if not (index := db.Get(db_key)):
+                return False  # Will be built on next use
+            index["stale"] = True
+            index["staledate"] = utils.utcNow()
+            index["version"] = index.get("version", 0) + 1
+            if "query_kind" not in index:
+                _store_query(index, query)
+            db.Put(index)
+            return True
+
+        if db.RunInTransaction(txn_mark_stale):
+            rebuild_pagination_index(key, self.page_size, self.max_pages)
+
+
+# How long a stale index may wait for its rebuild before another one is started
+_rebuild_timeout = timedelta(minutes=15)
+
+
+def _txn_claim_rebuild(db_key: db.Key) -> bool:
+    """
+        Restarts the timeout of the stale index *db_key*, if it has expired. Only the caller succeeding in this
+        starts another rebuild, instead of every request missing the index in its cache.
+    """
+    if not (index := db.Get(db_key)) or not index.get("stale") \
+            or index["staledate"] + _rebuild_timeout >= utils.utcNow():
+        return False
+    index["staledate"] = utils.utcNow()
+    db.Put(index)
+    return True
+
+
+def _store_query(entry: db.Entity, query: db.Query) -> None:
+    """
+        Stores the definition of *query* on the index *entry*, so it can be rebuilt by a deferred task.
+
+        Filter and order hooks have already been applied to the filters and orders of the query, so these are
+        stored as they will be run.
+    """
+    entry["query_kind"] = query.queries.kind or query.kind
+    entry["query_orig_kind"] = query.origKind
+    entry["query_src_skel"] = query.srcSkel.kindName if query.srcSkel else None
+    entry["query_distinct"] = query.queries.distinct
+    entry["query_filter_names"] = list(query.queries.filters.keys())
+    entry["query_filter_values"] = list(query.queries.filters.values())
+    entry["query_order_fields"] = [field for field, _ in query.queries.orders]
+    entry["query_order_directions"] = [order.value for _, order in query.queries.orders]
+    entry.exclude_from_indexes.update({"data", "query_kind", "query_orig_kind", "query_src_skel", "query_distinct",
+                                       "query_filter_names", "query_filter_values", "query_order_fields",
+                                       "query_order_directions"})
+
+
+def _load_query(entry: db.Entity) -> db.Query:
+    """
+        Restores the query stored by :func:`_store_query`.
+    """
+    from viur.core.skeleton import skeletonByKind
+    query = db.Query(entry["query_kind"])
+    query.origKind = entry.get("query_orig_kind") or entry["query_kind"]
+    if entry.get("query_src_skel"):
+        query.srcSkel = skeletonByKind(entry["query_src_skel"])()
+    query.queries.distinct = entry.get("query_distinct")
+    query.queries.filters = dict(zip(entry["query_filter_names"] or [], entry["query_filter_values"] or []))
+    query.queries.orders = [
+        (field, db.SortOrder(direction))
+        for field, direction in zip(entry["query_order_fields"] or [], entry["query_order_directions"] or [])
+    ]
+    return query
+
+
+@CallDeferred
+def rebuild_pagination_index(key: str, page_size: int, max_pages: int) -> None:
+    """
+        Rebuilds a stale pagination index. The index is only replaced if it hasn't been refreshed again meanwhile.
+    """
+    db_key = db.Key(Pagination._db_type, key)
+    if not (index := db.Get(db_key)) or not index.get("stale"):
+        return
+    if "query_kind" not in index:
+        # Index from a previous version, which doesn't know its query - it gets rebuilt on next use
+        db.Delete(db_key)
+        return
+    version = index.get("version", 0)
+    cursors = Pagination(page_size=page_size, max_pages=max_pages, cache_size=0) \
+        .extend_cursors(_load_query(index), [None])
+
+    def txn_update():
+        if not (index := db.Get(db_key)) or index.get("version", 0) != version:
+            return  # Refreshed again, another rebuild will follow
+        index["data"] = cursors
+        index["stale"] = False
+        index["creationdate"] = utils.utcNow()
+        db.Put(index)
+
+    db.RunInTransaction(txn_update)
@@ -2,7 +2,7 @@ import logging
 from typing import Any, Optional
 from viur.core import current, db, errors, exposed, forcePost, forceSSL, securitykey, utils
 from viur.core.cache import flushCache
-from viur.core.skeleton import SkeletonInstance
+from viur.core.skeleton import SkeletonInstance, resolveSeoKeys
 from .skelmodule import SkelModule
 
 
@@ -302,8 +302,8 @@ class List(SkelModule):
         if args and args[0]:
             # We probably have a Database or SEO-Key here
             seoKey = str(args[0]).lower()
-            skel = self.viewSkel().all(_excludeFromAccessLog=True).filter("viur.viurActiveSeoKeys =", seoKey).getSkel()
-            if skel:
+            skel = self.viewSkel()
+            if (key := resolveSeoKeys(skel.kindName, [seoKey]).get(seoKey)) and skel.fromDB(key):
                 db.currentDbAccessLog.get(set()).add(skel["key"])
                 if not self.canView(skel):
                     raise errors.Forbidden()
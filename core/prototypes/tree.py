@@ -3,16 +3,111 @@ import logging
 from typing import Any, Dict, List, Literal, Optional, Type
 from viur.core import utils, errors, securitykey, db, current
 from viur.core import forcePost, forceSSL, exposed, internalExposed
-from viur.core.bones import KeyBone, SortIndexBone
+from viur.core.bones import KeyBone, SelectBone, SortIndexBone
 from viur.core.cache import flushCache
-from viur.core.skeleton import Skeleton, SkeletonInstance
-from viur.core.tasks import CallDeferred
+from viur.core.skeleton import BaseSkeleton, Skeleton, SkeletonInstance, listKnownSkeletons, skeletonByKind
+from viur.core.tasks import CallableTask, CallableTaskBase, CallDeferred
 from .skelmodule import SkelModule
 
 
 SkelType = Literal["node", "leaf"]
 
 
+def resolveAncestors(entities: List[db.Entity], maxDepth: int = 99) -> List[List[db.Key]]:
+    """
+    Determines the keys of all ancestors (from the root-node down to the parent) of each of the given tree entries.
+
+    The parents are walked up level by level, fetching the parents of all entries of a level at once, until an
+    ancestor having a materialized path ("viurAncestors") is reached; that path is verified by
+    :func:`getAncestorKeys`.
+
+    :param entities: The entries to resolve the ancestors for.
+    :param maxDepth: Safety level depth preventing infinitive loops.
+    :returns: The list of ancestor keys for each entry, in the order of *entities*.
+    """
+    fetched: Dict[db.Key, Optional[db.Entity]] = {}
+    verified: Dict[db.Key, List[db.Key]] = {}  # The verified ancestors of the ancestors reached
+    chains = [[] for _ in entities]  # The parents walked up so far, nearest first
+    heads = [entity.get("parententry") for entity in entities]
+    res: List[Optional[List[db.Key]]] = [None] * len(entities)
+
+    for _ in range(0, maxDepth):
+        pending = [idx for idx, ancestors in enumerate(res) if ancestors is None]
+        if not pending:
+            break
+        if missing := list({heads[idx] for idx in pending if heads[idx] and heads[idx] not in fetched}):
+            fetched.update(zip(missing, db.Get(missing)))
+        for idx in pending:
+            parentKey = heads[idx]
+            if not parentKey:  # Reached the root-node
+                res[idx] = chains[idx][::-1]
+                continue
+            if parentKey in chains[idx] or parentKey == entities[idx].key:
+                logging.critical("Loop in tree detected at %r", parentKey)
+                res[idx] = chains[idx][::-1]
+                continue
+            chains[idx].append(parentKey)
+            if (parent := fetched.get(parentKey)) is None:
+                logging.warning("Parent %r of %r does not exist", parentKey, entities[idx].key)
+                res[idx] = chains[idx][::-1]
+            elif parent.get("viurAncestors") is not None:
+                if parentKey not in verified:
+                    verified[parentKey] = getAncestorKeys(parent, maxDepth)
+                res[idx] = verified[parentKey] + chains[idx][::-1]
+            else:
+                heads[idx] = parent.get("parententry")
+    else:
+        logging.critical("Maximum recursion depth reached while resolving ancestors, your data is corrupt!")
+
+    return [ancestors if ancestors is not None else chain[::-1] for ancestors, chain in zip(res, chains)]
+
+
+def getAncestorKeys(entity: db.Entity, maxDepth: int = 99) -> List[db.Key]:
+    """
+    Returns the keys of all ancestors of the given tree entry, starting with its root-node.
+
+    The materialized path stored on an entry may be outdated, as the paths of the subtree of a moved node are
+    updated deferred. So the entries on the path are fetched at once, and it's only used as far as their parent
+    entries confirm it. Above the first entry that has been moved, its own path is checked the same way.
+
+    :param entity: The entry to determine the ancestors of.
+    :param maxDepth: Safety level depth preventing infinitive loops.
+    """
+    res = []  # The ancestors verified so far, nearest first
+    current = entity
+    for _ in range(0, maxDepth):
+        if not (parentKey := current.get("parententry")):
+            return res[::-1]
+        if parentKey in res or parentKey == entity.key:
+            logging.critical("Loop in tree detected at %r", parentKey)
+            return res[::-1]
+        path = current.get("viurAncestors")
+        if not path or path[-1] != parentKey:
+            # No usable path, so walk up a single level
+            res.append(parentKey)
+            if (current := db.Get(parentKey)) is None:
+                logging.warning("Parent %r of %r does not exist", parentKey, entity.key)
+                return res[::-1]
+            continue
+        path = list(path)
+        ancestors = db.Get(path)
+        # Verify the path bottom-up: each entry on it must still be the child of the entry before it
+        idx = len(path) - 1
+        while idx >= 0 and ancestors[idx] is not None \
+                and ancestors[idx].get("parententry") == (path[idx - 1] if idx else None):
+            idx -= 1
+        if idx < 0:
+            return path + res[::-1]
+        if ancestors[idx] is None:
+            logging.warning("Ancestor %r of %r does not exist", path[idx], entity.key)
+            return path[idx:] + res[::-1]
+        # The entry at idx has been moved; continue with its own path
+        res.extend(reversed(path[idx:]))
+        current = ancestors[idx]
+    logging.critical("Maximum recursion depth reached while resolving ancestors, your data is corrupt!")
+    return res[::-1]
+
+
 class TreeSkel(Skeleton):
     parententry = KeyBone(
         descr="Parent",
@@ -36,6 +131,17 @@ class TreeSkel(Skeleton):
             skelValues["parententry"] = utils.normalizeKey(
                 db.Key.from_legacy_urlsafe(skelValues.dbEntity["parentdir"]))
 
+    @classmethod
+    def preProcessSerializedData(cls, skelValues, entity):
+        """
+        Maintains the keys of all ancestors of this entry in "viurAncestors", so the root-node, the ancestry and
+        the whole subtree of an entry can be determined by a single lookup or query.
+        """
+        entity = super().preProcessSerializedData(skelValues, entity)
+        entity["viurAncestors"] = getAncestorKeys(entity)
+        entity.exclude_from_indexes.discard("viurAncestors")
+        return entity
+
 
 class Tree(SkelModule):
     """
@@ -168,44 +274,63 @@ class Tree(SkelModule):
         rootNodeSkel = self.nodeSkelCls()
         entryKey = db.keyHelper(entryKey, rootNodeSkel.kindName)
         repo = db.Get(entryKey)
-        while repo and "parententry" in repo:
-            repo = db.Get(repo["parententry"])
-        rootNodeSkel.fromDB(repo.key)
+        ancestors = getAncestorKeys(repo)
+        rootNodeSkel.fromDB(ancestors[0] if ancestors else repo.key)
         return rootNodeSkel
 
+    def subtreeQuery(self, skelType: SkelType, parentKey: db.Key) -> db.Query:
+        """
+        Returns a query for all entries of *skelType* below the node *parentKey*, regardless of their depth.
+        """
+        skel = self.viewSkel(skelType)
+        return skel.all().filter("viurAncestors =", db.keyHelper(parentKey, self.viewSkel("node").kindName))
+
+    subtreeBatchSize = 100  # Number of entries updated at once when processing a subtree
+
     @CallDeferred
-    def updateParentRepo(self, parentNode: str, newRepoKey: str, depth: int = 0):
+    def updateParentRepo(self, parentNode: str, newRepoKey: str, depth: int = 0, skelType: SkelType = "node",
+                         cursor: Optional[str] = None):
         """
-        Recursively fixes the parentrepo key after a move operation.
+        Fixes the parentrepo key and the ancestors of all entries below *parentNode* after a move operation.
 
-        This will delete all entries which are children of *nodeKey*, except *key* nodeKey.
+        The subtree is found by a single query on the ancestors and updated in batches of subtreeBatchSize,
+        each continued in a deferred call.
 
         :param parentNode: URL-safe key of the node which children should be fixed.
         :param newRepoKey: URL-safe key of the new repository.
-        :param depth: Safety level depth preventing infinitive loops.
-        """
-        if depth > 99:
-            logging.critical("Maximum recursion depth reached in %s/updateParentRepo", self.updateParentRepo.__module__)
-            logging.critical("Your data is corrupt!")
-            logging.critical("Params: parentNode: %s, newRepoKey: %s" % (parentNode, newRepoKey))
+        :param depth: Unused, kept for compatibility.
+        :param skelType: The type of entries processed by this call.
+        :param cursor: Cursor to continue from.
+        """
+        nodeKindName = self.viewSkel("node").kindName
+        parentNode = db.keyHelper(parentNode, nodeKindName)
+        newRepoKey = db.keyHelper(newRepoKey, nodeKindName) if newRepoKey else None
+        if not (movedNode := db.Get(parentNode)):
             return
-
-        def fixTxn(nodeKey, newRepoKey):
-            node = db.Get(nodeKey)
-            node["parentrepo"] = newRepoKey
-            db.Put(node)
-
-        # Fix all nodes
-        q = db.Query(self.viewSkel("node").kindName).filter("parententry =", parentNode)
-        for repo in q.iter():
-            self.updateParentRepo(repo.key, newRepoKey, depth=depth + 1)
-            db.RunInTransaction(fixTxn, repo.key, newRepoKey)
-
-        # Fix the leafs on this level
-        if self.leafSkelCls:
-            q = db.Query(self.viewSkel("leaf").kindName).filter("parententry =", parentNode)
-            for repo in q.iter():
-                db.RunInTransaction(fixTxn, repo.key, newRepoKey)
+        newAncestors = getAncestorKeys(movedNode) + [parentNode]
+
+        query = db.Query(self.viewSkel(skelType).kindName).filter("viurAncestors =", parentNode)
+        query.setCursor(cursor)
+        keys = [entity.key for entity in query.run(self.subtreeBatchSize)]
+
+        def fixTxn(keys):
+            changed = []
+            for entity in db.Get(keys):
+                if not entity or parentNode not in (ancestors := list(entity.get("viurAncestors") or [])):
+                    continue  # Deleted or moved somewhere else in the meantime
+                entity["viurAncestors"] = newAncestors + ancestors[ancestors.index(parentNode) + 1:]
+                entity["parentrepo"] = newRepoKey
+                changed.append(entity)
+            if changed:
+                db.Put(changed)
+
+        if keys:
+            db.RunInTransaction(fixTxn, keys)
+
+        if keys and (cursor := query.getCursor()):
+            self.updateParentRepo(parentNode, newRepoKey, skelType=skelType, cursor=cursor)
+        elif skelType == "node" and self.leafSkelCls:
+            self.updateParentRepo(parentNode, newRepoKey, skelType="leaf")
 
     ## Internal exposed functions
 
@@ -458,25 +583,99 @@ class Tree(SkelModule):
     @CallDeferred
     def deleteRecursive(self, parentKey: str):
         """
-        Recursively processes a delete request.
+        Deletes all entries below *parentKey*, except the node *parentKey* itself.
 
-        This will delete all entries which are children of *nodeKey*, except *key* nodeKey.
+        The subtree is processed in batches of subtreeBatchSize by :meth:`deleteRecursiveStep`. Its progress is
+        stored in an entity of kind "viur-tree-deletions", and each node whose children are still to be deleted in
+        an entity of kind "viur-tree-deletion-nodes" referring to it, so a retried task resumes where the previous
+        attempt stopped, regardless of the size of the subtree.
 
         :param parentKey: URL-safe key of the node which children should be deleted.
         """
-        nodeKey = db.keyHelper(parentKey, self.viewSkel("node").kindName)
-        if self.leafSkelCls:
-            for leaf in db.Query(self.viewSkel("leaf").kindName).filter("parententry =", nodeKey).iter():
-                leafSkel = self.viewSkel("leaf")
-                if not leafSkel.fromDB(leaf.key):
-                    continue
-                leafSkel.delete()
-        for node in db.Query(self.viewSkel("node").kindName).filter("parententry =", nodeKey).iter():
-            self.deleteRecursive(node.key)
-            nodeSkel = self.viewSkel("node")
-            if not nodeSkel.fromDB(node.key):
-                continue
-            nodeSkel.delete()
+        job = db.Entity(db.Key("viur-tree-deletions", utils.generateRandomString(13)))
+        job["deleted"] = 0
+        job["creationdate"] = job["changedate"] = utils.utcNow()
+        db.Put(job)
+        db.Put(self._deletionNode(job.key, db.keyHelper(parentKey, self.viewSkel("node").kindName)))
+        self.deleteRecursiveStep(job.key)
+
+    def _deletionNode(self, jobKey: db.Key, nodeKey: db.Key) -> db.Entity:
+        """
+        Creates the entity of a pending node of the deletion job *jobKey*.
+
+        Its key is derived from the job and the node, so recording a node twice is harmless.
+        """
+        entity = db.Entity(
+            db.Key("viur-tree-deletion-nodes", "%s:%s" % (jobKey.id_or_name, nodeKey.id_or_name)),
+            exclude_from_indexes={"node", "skelType", "cursor"}
+        )
+        entity["job"] = jobKey
+        entity["node"] = nodeKey
+        entity["skelType"] = "leaf" if self.leafSkelCls else "node"
+        entity["cursor"] = None
+        return entity
+
+    @CallDeferred
+    def deleteRecursiveStep(self, jobKey: db.Key):
+        """
+        Deletes the next batch of children of a pending node of the deletion job *jobKey*.
+
+        Child nodes are recorded as pending nodes before they are deleted; their own children are still found by
+        their parententry afterwards.
+
+        :param jobKey: Key of the "viur-tree-deletions" entity holding the progress.
+        """
+        if not (job := db.Get(jobKey)):
+            return
+        if not (pending := db.Query("viur-tree-deletion-nodes").filter("job =", jobKey).getEntry()):
+            logging.info("Finished deleting %d entries of subtree %s", job["deleted"], jobKey.id_or_name)
+            db.Delete(jobKey)
+            return
+
+        skelType = pending["skelType"]
+        query = db.Query(self.viewSkel(skelType).kindName).filter("parententry =", pending["node"])
+        query.setCursor(pending["cursor"])
+        entities = query.run(self.subtreeBatchSize)
+        cursor = query.getCursor() if len(entities) >= self.subtreeBatchSize else None
+
+        if skelType == "node" and entities:
+            # Record the child nodes first, so their children are still processed if this task is retried
+            db.Put([self._deletionNode(jobKey, entity.key) for entity in entities])
+
+        for entity in entities:
+            self.deleteSubtreeEntry(skelType, entity)
+
+        if cursor:
+            pending["cursor"] = cursor
+            db.Put(pending)
+        elif skelType == "leaf":
+            pending["skelType"] = "node"
+            pending["cursor"] = None
+            db.Put(pending)
+        else:
+            db.Delete(pending.key)
+
+        job["deleted"] += len(entities)
+        job["changedate"] = utils.utcNow()
+        db.Put(job)
+        self.deleteRecursiveStep(jobKey)
+
+    def deleteSubtreeEntry(self, skelType: SkelType, entity: db.Entity):
+        """
+        Deletes a single entry of a subtree processed by :meth:`deleteRecursiveStep`.
+
+        Entries which can't be deleted as they're still referenced are skipped.
+
+        :param skelType: The type of the entry, either "node" or "leaf".
+        :param entity: The entity of the entry, as returned by the query on its parententry.
+        """
+        skel = self.viewSkel(skelType)
+        skel.setEntity(entity)
+        skel["key"] = entity.key
+        try:
+            skel.delete()
+        except errors.Locked:
+            logging.warning("Skipping %s while deleting its subtree, as it's still referenced", entity.key)
 
     @exposed
     @forceSSL
@@ -523,16 +722,8 @@ class Tree(SkelModule):
             raise errors.NotAcceptable("Cannot move a node into itself")
 
         ## Test for recursion
-        currLevel = db.Get(parentNodeSkel["key"])
-        for _ in range(0, 99):
-            if currLevel.key == skel["key"]:
-                break
-            if currLevel.get("rootNode"):
-                # We reached a rootNode, so this is okay
-                break
-            currLevel = db.Get(currLevel["parententry"])
-        else:  # We did not "break" - recursion-level exceeded or loop detected
-            raise errors.NotAcceptable("Unable to find a root node in recursion?")
+        if skel["key"] in getAncestorKeys(parentNodeSkel.dbEntity):
+            raise errors.NotAcceptable("Cannot move a node into its own subtree")
 
         # Test if we try to move a rootNode
         tmp = skel.dbEntity
@@ -542,9 +733,9 @@ class Tree(SkelModule):
         if not securitykey.validate(kwargs.get("skey", ""), useSessionKey=True):
             raise errors.PreconditionFailed()
 
-        currentParentRepo = skel["parentrepo"]
         skel["parententry"] = parentNodeSkel["key"]
-        skel["parentrepo"] = parentNodeSkel["parentrepo"]  # Fixme: Need to recursive fixing to parentrepo?
+        # parentrepo may not exist in parentNodeSkel as it may be an rootNode
+        skel["parentrepo"] = parentNodeSkel["parentrepo"] or parentNodeSkel["key"]
         if "sortindex" in kwargs:
             try:
                 skel["sortindex"] = float(kwargs["sortindex"])
@@ -555,9 +746,9 @@ class Tree(SkelModule):
         skel.toDB()
         self.onEdited(skelType, skel)
 
-        # Ensure a changed parentRepo get's proagated
-        if currentParentRepo != parentNodeSkel["parentrepo"]:
-            self.updateParentRepo(key, parentNodeSkel["parentrepo"])
+        # Ensure the new ancestors and parentRepo get propagated to the subtree
+        if skelType == "node":
+            self.updateParentRepo(skel["key"], skel["parentrepo"])
 
         return self.render.editSuccess(skel)
 
@@ -826,3 +1017,68 @@ class Tree(SkelModule):
 
 Tree.vi = True
 Tree.admin = True
+
+
+@CallableTask
+class TaskBackfillTreeAncestors(CallableTaskBase):
+    """
+    Stores the keys of their ancestors on all entries of the given tree kind, which have been written before
+    :class:`TreeSkel` maintained them.
+    """
+    key = "backfillTreeAncestors"
+    name = "Backfill tree ancestors"
+    descr = "Stores the materialized ancestor path on existing tree nodes and leafs."
+
+    def canCall(self) -> bool:
+        """Checks wherever the current user can execute this task"""
+        user = current.user.get()
+        return user is not None and "root" in user["access"]
+
+    def dataSkel(self):
+        kinds = ["*"] + [x for x in listKnownSkeletons() if issubclass(skeletonByKind(x), TreeSkel)]
+        skel = BaseSkeleton().clone()
+        skel.module = SelectBone(descr="Module", values={x: x for x in kinds}, required=True)
+        return skel
+
+    def execute(self, module, *args, **kwargs):
+        if module == "*":
+            kinds = [x for x in listKnownSkeletons() if issubclass(skeletonByKind(x), TreeSkel)]
+        elif (skelCls := skeletonByKind(module)) and issubclass(skelCls, TreeSkel):
+            kinds = [module]
+        else:
+            logging.error("TaskBackfillTreeAncestors: Invalid module")
+            return
+        for kindName in kinds:
+            backfillTreeAncestors(kindName)
+
+
+@CallDeferred
+def backfillTreeAncestors(kindName: str, cursor: Optional[str] = None, totalCount: int = 0):
+    """
+        Processes one batch of entries of *kindName* and calls the next batch.
+    """
+    query = db.Query(kindName)
+    query.setCursor(cursor)
+    entities = query.run(Tree.subtreeBatchSize)
+    ancestorsByKey = {
+        entity.key: ancestors for entity, ancestors in zip(entities, resolveAncestors(entities))
+    }
+
+    def fixTxn(keys):
+        changed = []
+        for entity in db.Get(keys):
+            if entity and entity.get("viurAncestors") != ancestorsByKey[entity.key]:
+                entity["viurAncestors"] = ancestorsByKey[entity.key]
+                entity.exclude_from_indexes.discard("viurAncestors")
+                changed.append(entity)
+        if changed:
+            db.Put(changed)
+
+    if entities:
+        db.RunInTransaction(fixTxn, list(ancestorsByKey.keys()))
+
+    totalCount += len(entities)
+    if entities and (cursor := query.getCursor()):
+        backfillTreeAncestors(kindName, cursor, totalCount)
+    else:
+        logging.info("Finished backfilling the ancestors of %d entries of %s", totalCount, kindName)
@@ -1,12 +1,16 @@
 import codecs
 import enum
 import functools
+import hashlib
 import logging
 import os
-from collections import namedtuple
-from typing import Any, Dict, List, Literal, Tuple, Union
+from collections import OrderedDict, namedtuple
+from pathlib import Path
+from typing import Any, Dict, List, Literal, Optional, Tuple, Union
 
-from jinja2 import ChoiceLoader, Environment, FileSystemLoader, Template
+from jinja2 import BytecodeCache, ChoiceLoader, Environment, FileSystemBytecodeCache, FileSystemLoader, \
+    ModuleLoader, Template
+from jinja2.bccache import Bucket
 
 from viur.core import conf, current, db, errors, securitykey
 from viur.core.bones import *
@@ -16,6 +20,77 @@ from . import utils as jinjaUtils
 
 KeyValueWrapper = namedtuple("KeyValueWrapper", ["key", "descr"])
 
+# Resolved template filenames, mapping of (htmlpath, template, style postfix, language) -> filename.
+# The style is chosen by the client, so only found templates are cached and the least recently used are dropped.
+_templateFileNameCache: "OrderedDict[Tuple[str, str, str, Optional[str]], str]" = OrderedDict()
+_templateFileNameCacheSize = 2048
+
+
+class MemoryBytecodeCache(BytecodeCache):
+    """
+        Keeps compiled templates in memory, so they're shared by the environments of all modules.
+
+        The code compiled for a template depends on the extensions, syntax and filters of its environment, which
+        may be altered by the jinjaEnv hook of a module. Templates are therefore cached per configuration of
+        their environment.
+    """
+
+    def __init__(self):
+        self._cache = {}
+
+    @staticmethod
+    def environmentKey(environment: Environment) -> str:
+        """
+            Returns a fingerprint of everything in *environment* that affects the code compiled for a template.
+        """
+        settings = (
+            sorted(environment.extensions),
+            environment.block_start_string, environment.block_end_string,
+            environment.variable_start_string, environment.variable_end_string,
+            environment.comment_start_string, environment.comment_end_string,
+            environment.line_statement_prefix, environment.line_comment_prefix,
+            environment.trim_blocks, environment.lstrip_blocks, environment.newline_sequence,
+            environment.keep_trailing_newline, environment.optimized, bool(environment.autoescape),
+            environment.finalize is not None,
+            # The compiler checks how filters and tests want to be called
+            sorted((name, str(getattr(func, "jinja_pass_arg", None))) for name, func in environment.filters.items()),
+            sorted((name, str(getattr(func, "jinja_pass_arg", None))) for name, func in environment.tests.items()),
+        )
+        return hashlib.sha1(repr(settings).encode("UTF-8")).hexdigest()
+
+    def get_bucket(self, environment: Environment, name: str, filename: Optional[str], source: str) -> Bucket:
+        key = "%s/%s" % (self.environmentKey(environment), self.get_cache_key(name, filename))
+        bucket = Bucket(environment, key, self.get_source_checksum(source))
+        self.load_bytecode(bucket)
+        return bucket
+
+    def load_bytecode(self, bucket: Bucket) -> None:
+        if (code := self._cache.get(bucket.key)) is not None:
+            bucket.bytecode_from_string(code)
+
+    def dump_bytecode(self, bucket: Bucket) -> None:
+        self._cache[bucket.key] = bucket.bytecode_to_string()
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+
+_memoryBytecodeCache = MemoryBytecodeCache()
+
+
+def getBytecodeCache() -> Optional[BytecodeCache]:
+    """
+        Returns the bytecode cache configured by conf["viur.render.html.bytecodeCache"].
+    """
+    setting = conf["viur.render.html.bytecodeCache"]
+    if not setting:
+        return None
+    elif setting is True:
+        return _memoryBytecodeCache
+    elif isinstance(setting, BytecodeCache):
+        return setting
+    return FileSystemBytecodeCache(str(setting))
+
 
 class Render(object):
     """
@@ -92,6 +167,34 @@ class Render(object):
         else:
             stylePostfix = ""
         lang = current.language.get()  # session.current.getLanguage()
+
+        # Templates don't change after deployment, so it's sufficient to look them up once
+        cacheKey = (htmlpath, template, stylePostfix, lang)
+        useCache = not conf["viur.instance.is_dev_server"]
+        if useCache and (fileName := _templateFileNameCache.get(cacheKey)):
+            try:
+                _templateFileNameCache.move_to_end(cacheKey)
+            except KeyError:  # Dropped by another thread in the meantime
+                pass
+            return fileName
+
+        fileName = self._findTemplateFile(htmlpath, template, stylePostfix, lang)
+        if fileName is None:
+            raise errors.NotFound("Template %s not found." % template)
+        if useCache:
+            _templateFileNameCache[cacheKey] = fileName
+            while len(_templateFileNameCache) > _templateFileNameCacheSize:
+                try:
+                    _templateFileNameCache.popitem(last=False)
+                except KeyError:
+                    break
+        return fileName
+
+    def _findTemplateFile(self, htmlpath: str, template: str, stylePostfix: str,
+                          lang: Optional[str]) -> Optional[str]:
+        """
+            Looks up the file used by :meth:`getTemplateFileName` on the disk.
+        """
         fnames = [template + stylePostfix + ".html", template + ".html"]
         if lang:
             fnames = [os.path.join(lang, template + stylePostfix + ".html"),
@@ -108,7 +211,7 @@ class Render(object):
         for fn in fnames:  # Check the fallback
             if conf["viur.instance.core_base_path"].joinpath("template", fn).is_file():
                 return fn
-        raise errors.NotFound("Template %s not found." % template)
+        return None
 
     def getLoaders(self) -> ChoiceLoader:
         """
@@ -153,10 +256,12 @@ class Render(object):
                         res[language] = self.renderBoneValue(bone, skel, key, boneValue[language], True)
             return res
         elif bone.type == "select" or bone.type.startswith("select."):
+            values = bone.values
+
             def get_label(value) -> str:
                 if isinstance(value, enum.Enum):
-                    return bone.values.get(value.value, value.name)
-                return bone.values.get(value, str(value))
+                    return values.get(value.value, value.name)
+                return values.get(value, str(value))
 
             if isinstance(boneValue, list):
                 return {val: get_label(val) for val in boneValue}
@@ -261,7 +366,7 @@ class Render(object):
 
         return template.render(
             skel={
-                "structure": skel.structure(),
+                "structure": skel.cachedStructure(),
                 "errors": skel.errors,
                 "value": skel
             },
@@ -473,8 +578,12 @@ class Render(object):
         """
         if "env" not in dir(self):
             loaders = self.getLoaders()
+            if (precompiled := self.getPrecompiledTemplatesPath()) and precompiled.exists():
+                # Prefer the templates compiled by precompileTemplates() during deployment
+                loaders = ChoiceLoader([ModuleLoader(str(precompiled)), loaders])
             self.env = Environment(loader=loaders,
-                                   extensions=["jinja2.ext.do", "jinja2.ext.loopcontrols", TranslationExtension])
+                                   extensions=["jinja2.ext.do", "jinja2.ext.loopcontrols", TranslationExtension],
+                                   bytecode_cache=getBytecodeCache())
             self.env.trCache = {}
 
             # Import functions.
@@ -498,3 +607,29 @@ class Render(object):
                 self.env = self.parent.jinjaEnv(self.env)
 
         return self.env
+
+    def getPrecompiledTemplatesPath(self, target: Union[str, Path, None] = None) -> Optional[Path]:
+        """
+            Returns where the precompiled templates of this renderer are stored below *target* (defaults to
+            conf["viur.render.html.precompiledTemplates"]). Each htmlpath gets its own zip-file, as templates of the
+            same name may differ between them.
+        """
+        if not (target := target or conf["viur.render.html.precompiledTemplates"]):
+            return None
+        htmlpath = self.htmlpath if "htmlpath" in dir(self) else "html"
+        return Path(target) / ("%s.zip" % (htmlpath.strip("/").replace("/", "_") or "html"))
+
+    def precompileTemplates(self, target: Union[str, Path], compression: str = "deflated") -> None:
+        """
+            Compiles all templates available to this renderer into a zip-file in the directory *target*.
+
+            This is intended to run during deployment for each renderer with a distinct htmlpath; set
+            conf["viur.render.html.precompiledTemplates"] to *target* afterwards, so instances don't have to parse
+            the templates on startup.
+
+            :param target: The directory to write the compiled templates to.
+            :param compression: The compression method of the zip-file ("deflated" or "stored").
+        """
+        Path(target).mkdir(parents=True, exist_ok=True)
+        env = self.getEnv().overlay(loader=self.getLoaders(), bytecode_cache=None)
+        env.compile_templates(str(self.getPrecompiledTemplatesPath(target)), zip=compression, ignore_errors=False)
@@ -354,7 +354,7 @@ def getStructure(render: Render,
                     logging.exception(e)
                     return False
 
-            return skel.structure()
+            return skel.cachedStructure()
 
     return False
 
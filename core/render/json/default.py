@@ -1,3 +1,4 @@
+import contextvars
 import json
 from enum import Enum
 
@@ -6,7 +7,27 @@ from viur.core.skeleton import SkeletonInstance
 from viur.core.i18n import translate
 from viur.core.config import conf
 from datetime import datetime
-from typing import Any, Dict, List, Optional, Tuple, Union
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _jsonDefault(o: Any) -> Any:
+    """
+        Converts the types not supported by the json encoders into JSON-serializable values.
+    """
+    if isinstance(o, translate):
+        return str(o)
+    elif isinstance(o, datetime):
+        return o.isoformat()
+    elif isinstance(o, db.Key):
+        return db.encodeKey(o)
+    elif isinstance(o, Enum):
+        return o.value
+    raise TypeError(f"Object of type {o.__class__.__name__} is not JSON serializable")
 
 
 class CustomJsonEncoder(json.JSONEncoder):
@@ -15,15 +36,19 @@ class CustomJsonEncoder(json.JSONEncoder):
     """
 
     def default(self, o: Any) -> Any:
-        if isinstance(o, translate):
-            return str(o)
-        elif isinstance(o, datetime):
-            return o.isoformat()
-        elif isinstance(o, db.Key):
-            return db.encodeKey(o)
-        elif isinstance(o, Enum):
-            return o.value
-        return json.JSONEncoder.default(self, o)
+        try:
+            return _jsonDefault(o)
+        except TypeError:
+            return json.JSONEncoder.default(self, o)
+
+
+def dumps(obj: Any) -> str:
+    """
+        Serializes *obj* to JSON, using orjson if conf["viur.render.json.fastEncoder"] is set and it's installed.
+    """
+    if orjson is not None and conf["viur.render.json.fastEncoder"]:
+        return orjson.dumps(obj, default=_jsonDefault, option=orjson.OPT_NON_STR_KEYS).decode("UTF-8")
+    return json.dumps(obj, cls=CustomJsonEncoder)
 
 
 class DefaultRender(object):
@@ -37,9 +62,13 @@ class DefaultRender(object):
     def render_structure(structure: dict):
         """
         Performs structure rewriting according to VIUR2/3 compatibility flags.
+        The given structure is left untouched, as it might be a cached one.
         # fixme: Remove this entire function with VIUR4
         """
-        for struct in structure.values():
+        res = {}
+        for key, struct in structure.items():
+            struct = dict(struct)
+
             # Optionally replace new-key by a copy of the value under the old-key
             if "json.bone.structure.camelcasenames" in conf["viur.compatibility"]:
                 for find, replace in {
@@ -62,12 +91,23 @@ class DefaultRender(object):
                 if substruct in struct and struct[substruct]:
                     struct[substruct] = DefaultRender.render_structure(struct[substruct])
 
+            res[key] = struct
+
         # Optionally return list of tuples instead of dict
         if "json.bone.structure.keytuples" in conf["viur.compatibility"]:
-            return [(key, struct) for key, struct in structure.items()]
+            return [(key, struct) for key, struct in res.items()]
 
-        return structure
+        return res
 
+    @staticmethod
+    def renderSkelStructure(skel: SkeletonInstance) -> Union[Dict, List]:
+        """
+        Returns the rendered structure of *skel*, cached along with the structure of the skeleton.
+        """
+        return skel.cachedStructure(
+            DefaultRender.render_structure,
+            ("json", tuple(sorted(x for x in conf["viur.compatibility"] if x.startswith("json."))))
+        )
 
     def renderSingleBoneValue(self, value: Any,
                               bone: bones.BaseBone,
@@ -100,6 +140,10 @@ class DefaultRender(object):
         return None
 
     def renderBoneValue(self, bone: bones.BaseBone, skel: SkeletonInstance, key: str) -> Union[List, Dict, None]:
+        if isinstance(bone, bones.JsonBone) and orjson is not None and hasattr(orjson, "Fragment") \
+                and conf["viur.render.json.fastEncoder"]:
+            # Embed the stored JSON as it is, instead of parsing and encoding it again
+            return orjson.Fragment(raw) if (raw := bone.rawValue(skel, key)) is not None else None
         boneVal = skel[key]
         if bone.languages and bone.multiple:
             res = {}
@@ -143,12 +187,12 @@ class DefaultRender(object):
         if isinstance(skel, list):
             vals = [self.renderSkelValues(x) for x in skel]
             if isinstance(skel[0], SkeletonInstance):
-                struct = DefaultRender.render_structure(skel[0].structure())
+                struct = DefaultRender.renderSkelStructure(skel[0])
             errors = None
 
         elif isinstance(skel, SkeletonInstance):
             vals = self.renderSkelValues(skel)
-            struct = DefaultRender.render_structure(skel.structure())
+            struct = DefaultRender.renderSkelStructure(skel)
             errors = [{"severity": x.severity.value, "fieldPath": x.fieldPath, "errorMessage": x.errorMessage,
                        "invalidatedFields": x.invalidatedFields} for x in skel.errors]
 
@@ -166,33 +210,54 @@ class DefaultRender(object):
         }
 
         current.request.get().response.headers["Content-Type"] = "application/json"
-        return json.dumps(res, cls=CustomJsonEncoder)
+        return dumps(res)
 
     def view(self, skel: SkeletonInstance, action: str = "view", params=None, **kwargs):
         return self.renderEntry(skel, action, params)
 
     def list(self, skellist, action: str = "list", params=None, **kwargs):
         res = {}
-        skels = []
 
         if skellist:
-            for skel in skellist:
-                skels.append(self.renderSkelValues(skel))
-
             res["cursor"] = skellist.getCursor()
             if isinstance(skellist[0], SkeletonInstance):
-                res["structure"] = DefaultRender.render_structure(skellist[0].structure())
+                res["structure"] = DefaultRender.renderSkelStructure(skellist[0])
         else:
             res["structure"] = None
             res["cursor"] = None
 
-        res["skellist"] = skels
         res["action"] = action
         res["params"] = params
         res["orders"] = skellist.get_orders()
 
         current.request.get().response.headers["Content-Type"] = "application/json"
-        return json.dumps(res, cls=CustomJsonEncoder)
+
+        if skellist and conf["viur.render.json.streamLists"]:
+            return self.streamList(skellist, res)
+
+        res["skellist"] = [self.renderSkelValues(skel) for skel in skellist]
+        return dumps(res)
+
+    def streamList(self, skellist, res: Dict[str, Any]) -> Iterator[str]:
+        """
+        Renders *skellist* into a JSON object like :meth:`list`, but yields the entries one by one.
+
+        The skeletons are rendered while the response is sent, so they're rendered in a copy of the context
+        of the current request.
+
+        :param skellist: The skeletons to render.
+        :param res: The other members of the resulting object.
+        """
+        context = contextvars.copy_context()
+        head = dumps(res)
+
+        def generator():
+            yield head[:-1] + (", " if res else "") + "\"skellist\": ["
+            for idx, skel in enumerate(skellist):
+                yield (", " if idx else "") + dumps(context.run(self.renderSkelValues, skel))
+            yield "]}"
+
+        return generator()
 
     def add(self, skel: SkeletonInstance, action: str = "add", params=None, **kwargs):
         return self.renderEntry(skel, action, params)
@@ -5,6 +5,7 @@ from viur.core.render.json.default import DefaultRender, CustomJsonEncoder
 from viur.core.render.vi.user import UserRender as user
 from viur.core import Module, conf, current, exposed, securitykey, errors
 from viur.core.skeleton import SkeletonInstance
+from collections import OrderedDict
 import datetime
 import json
 
@@ -23,16 +24,24 @@ def timestamp(*args, **kwargs):
     return json.dumps(d.strftime("%Y-%m-%dT%H-%M-%S"))
 
 
+# Rendered responses of getStructure, mapping of (module, structure cache keys of its skeletons) -> JSON.
+# The least recently used are dropped, as there's one per module, language and set of bones.
+_structureResponseCache = OrderedDict()
+_structureResponseCacheSize = 512
+
+
 @exposed
 def getStructure(module):
     """
     Returns all available skeleton structures for a given module.
+
+    The JSON is cached as long as the skeletons of the module have cacheable structures.
     """
     moduleObj = getattr(conf["viur.mainApp"].vi, module, None)
     if not isinstance(moduleObj, Module) or not moduleObj.describe():
         return json.dumps(None)
 
-    res = {}
+    skels = {}
 
     # check for tree prototype
     if "nodeSkelCls" in dir(moduleObj):
@@ -47,7 +56,7 @@ def getStructure(module):
 
                     if isinstance(skel, SkeletonInstance):
                         storeType = stype.replace("Skel", "") + ("LeafSkel" if treeType == "leaf" else "NodeSkel")
-                        res[storeType] = DefaultRender.render_structure(skel.structure())
+                        skels[storeType] = skel
     else:
         # every other prototype
         for stype in ("viewSkel", "editSkel", "addSkel"):  # Unknown skel type
@@ -57,10 +66,36 @@ def getStructure(module):
                 except (TypeError, ValueError):
                     continue
                 if isinstance(skel, SkeletonInstance):
-                    res[stype] = DefaultRender.render_structure(skel.structure())
+                    skels[stype] = skel
 
     current.request.get().response.headers["Content-Type"] = "application/json"
-    return json.dumps(res or None, cls=CustomJsonEncoder)
+
+    cacheKey = (
+        module,
+        tuple((stype, skel._structureCacheKey()) for stype, skel in skels.items()),
+        tuple(sorted(x for x in conf["viur.compatibility"] if x.startswith("json."))),
+    )
+    isCacheable = all(skelCacheKey is not None for _, skelCacheKey in cacheKey[1])
+    if isCacheable and (res := _structureResponseCache.get(cacheKey)):
+        try:
+            _structureResponseCache.move_to_end(cacheKey)
+        except KeyError:  # Dropped by another thread in the meantime
+            pass
+        return res
+
+    res = json.dumps({
+        stype: DefaultRender.renderSkelStructure(skel) for stype, skel in skels.items()
+    } or None, cls=CustomJsonEncoder)
+
+    if isCacheable:
+        _structureResponseCache[cacheKey] = res
+        while len(_structureResponseCache) > _structureResponseCacheSize:
+            try:
+                _structureResponseCache.popitem(last=False)
+            except KeyError:
+                break
+
+    return res
 
 
 @exposed
@@ -1,4 +1,4 @@
-from .default import DefaultRender as default, serializeXML
+from .default import DefaultRender as default, iterXML, serializeXML
 from .user import UserRender as user
 from viur.core import Module, conf, securitykey, exposed
 import datetime
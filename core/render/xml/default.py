@@ -1,57 +1,135 @@
-from typing import Any, Dict
+import contextvars
+import itertools
+from collections.abc import Iterator
+from typing import Any, Callable, Dict, Optional, Tuple
 
 from viur.core.bones import *
-from viur.core import db
-from xml.dom import minidom
+from viur.core import conf, db
 from datetime import datetime, date, time
 
 from viur.core.skeleton import SkeletonInstance
 
-
-def serializeXML(data):
-    def recursiveSerializer(data, element):
-        if isinstance(data, dict):
-            element.setAttribute('ViurDataType', 'dict')
-            for key in data.keys():
-                docElem = doc.createElement("entry")
-                docElem.setAttribute('KeyName', str(key))
-                childElement = recursiveSerializer(data[key], docElem)
-                element.appendChild(childElement)
-        elif isinstance(data, (tuple, list)):
-            element.setAttribute('ViurDataType', 'list')
-            for value in data:
-                childElement = recursiveSerializer(value, doc.createElement('entry'))
-                element.appendChild(childElement)
+# ViurDataType of the scalar types which can be looked up by their exact type
+_scalarTypes = {str: "string", bool: "boolean", int: "numeric", float: "numeric"}
+
+
+def _escape(value: str) -> str:
+    return value.replace("&", "&amp;").replace("<", "&lt;").replace("\"", "&quot;").replace(">", "&gt;")
+
+
+def _serializeScalar(data: Any) -> Tuple[str, str]:
+    """
+        Returns the ViurDataType and the text representing *data*.
+    """
+    if (dataType := _scalarTypes.get(type(data))) is not None:
+        return dataType, str(data)
+    elif data is None:
+        return "none", ""
+    elif isinstance(data, bool):
+        return "boolean", str(data)
+    elif isinstance(data, (float, int)):
+        return "numeric", str(data)
+    elif isinstance(data, str):
+        return "string", str(data)
+    elif isinstance(data, datetime):
+        return "datetime", data.isoformat()
+    elif isinstance(data, date):
+        return "date", data.isoformat()
+    elif isinstance(data, time):
+        return "time", data.isoformat()
+    elif isinstance(data, db.KeyClass):
+        return "dbkey", data.to_legacy_urlsafe().decode("ASCII")
+    raise NotImplementedError("Type %s is not supported!" % type(data))
+
+
+def _writeXML(data: Any, write: Callable[[str], Any], tagName: str, attrs: str, indent: str, addIndent: str,
+              newl: str) -> None:
+    """
+        Writes *data* as element *tagName* (having the attributes *attrs*) using *write*.
+    """
+    if isinstance(data, dict):
+        if not data:
+            write("%s<%s%s ViurDataType=\"dict\"/>%s" % (indent, tagName, attrs, newl))
+            return
+        write("%s<%s%s ViurDataType=\"dict\">%s" % (indent, tagName, attrs, newl))
+        childIndent = indent + addIndent
+        for key, value in data.items():
+            _writeXML(value, write, "entry", " KeyName=\"%s\"" % _escape(str(key)), childIndent, addIndent, newl)
+        write("%s</%s>%s" % (indent, tagName, newl))
+    elif isinstance(data, (list, tuple, Iterator)):
+        if isinstance(data, Iterator):
+            data = list(data)
+        if not data:
+            write("%s<%s%s ViurDataType=\"list\"/>%s" % (indent, tagName, attrs, newl))
+            return
+        write("%s<%s%s ViurDataType=\"list\">%s" % (indent, tagName, attrs, newl))
+        childIndent = indent + addIndent
+        for value in data:
+            _writeXML(value, write, "entry", "", childIndent, addIndent, newl)
+        write("%s</%s>%s" % (indent, tagName, newl))
+    else:
+        dataType, text = _serializeScalar(data)
+        write("%s<%s%s ViurDataType=\"%s\">%s</%s>%s" % (
+            indent, tagName, attrs, dataType, _escape(text), tagName, newl))
+
+
+def serializeXML(data: Any, pretty: Optional[bool] = None) -> bytes:
+    """
+        Serializes *data* into a ViurResult XML document.
+
+        Dicts and lists (or iterators) are written as entries of type dict or list, all other values by
+        their ViurDataType.
+
+        :param data: The data to serialize.
+        :param pretty: Indent the document; defaults to conf["viur.render.xml.prettyPrint"].
+    """
+    if pretty is None:
+        pretty = conf["viur.render.xml.prettyPrint"]
+    buf = []
+    _writeXML(data, buf.append, "ViurResult", "", "", "\t" if pretty else "", "\n" if pretty else "")
+    return "".join(buf).encode("UTF-8", "xmlcharrefreplace")
+
+
+def iterXML(data: Any, pretty: Optional[bool] = None, streamDepth: int = 2) -> Iterator[bytes]:
+    """
+        Serializes *data* like :func:`serializeXML`, but yields the document in chunks.
+
+        Dicts and lists up to *streamDepth* levels below the root element are written entry by entry, so a list
+        given as iterator is consumed while the document is sent.
+
+        :param data: The data to serialize.
+        :param pretty: Indent the document; defaults to conf["viur.render.xml.prettyPrint"].
+        :param streamDepth: The number of levels written entry by entry.
+    """
+    if pretty is None:
+        pretty = conf["viur.render.xml.prettyPrint"]
+    addIndent = "\t" if pretty else ""
+    newl = "\n" if pretty else ""
+
+    def generator(data: Any, tagName: str, attrs: str, indent: str, depth: int) -> Iterator[bytes]:
+        if depth < streamDepth and isinstance(data, dict):
+            dataType = "dict"
+            entries = ((" KeyName=\"%s\"" % _escape(str(key)), value) for key, value in data.items())
+        elif depth < streamDepth and isinstance(data, (list, tuple, Iterator)):
+            dataType = "list"
+            entries = (("", value) for value in data)
         else:
-            if isinstance(data, bool):
-                element.setAttribute('ViurDataType', 'boolean')
-            elif isinstance(data, float) or isinstance(data, int):
-                element.setAttribute('ViurDataType', 'numeric')
-            elif isinstance(data, str):
-                element.setAttribute('ViurDataType', 'string')
-            elif isinstance(data, datetime) or isinstance(data, date) or isinstance(data, time):
-                if isinstance(data, datetime):
-                    element.setAttribute('ViurDataType', 'datetime')
-                elif isinstance(data, date):
-                    element.setAttribute('ViurDataType', 'date')
-                else:
-                    element.setAttribute('ViurDataType', 'time')
-                data = data.isoformat()
-            elif isinstance(data, db.KeyClass):
-                element.setAttribute('ViurDataType', 'dbkey')
-                data = data.to_legacy_urlsafe().decode("ASCII")
-            elif data is None:
-                element.setAttribute('ViurDataType', 'none')
-                data = ""
-            else:
-                raise NotImplementedError("Type %s is not supported!" % type(data))
-            element.appendChild(doc.createTextNode(str(data)))
-        return element
-
-    dom = minidom.getDOMImplementation()
-    doc = dom.createDocument(None, u"ViurResult", None)
-    elem = doc.childNodes[0]
-    return recursiveSerializer(data, elem).toprettyxml(encoding="UTF-8")
+            buf = []
+            _writeXML(data, buf.append, tagName, attrs, indent, addIndent, newl)
+            yield "".join(buf).encode("UTF-8", "xmlcharrefreplace")
+            return
+
+        if (first := next(entries, None)) is None:
+            yield ("%s<%s%s ViurDataType=\"%s\"/>%s" % (indent, tagName, attrs, dataType, newl)) \
+                .encode("UTF-8", "xmlcharrefreplace")
+            return
+        yield ("%s<%s%s ViurDataType=\"%s\">%s" % (indent, tagName, attrs, dataType, newl)) \
+            .encode("UTF-8", "xmlcharrefreplace")
+        for childAttrs, value in itertools.chain((first,), entries):
+            yield from generator(value, "entry", childAttrs, indent + addIndent, depth + 1)
+        yield ("%s</%s>%s" % (indent, tagName, newl)).encode("UTF-8")
+
+    return generator(data, "ViurResult", "", "", 0)
 
 
 class DefaultRender(object):
@@ -65,7 +143,7 @@ class DefaultRender(object):
         e = ext()
         return ({"name": e.name,
                  "descr": str(e.descr),
-                 "skel": e.dataSkel().structure()})
+                 "skel": e.dataSkel().cachedStructure()})
 
     def renderBoneValue(self, bone, skel, key):
         boneVal = skel[key]
@@ -150,7 +228,7 @@ class DefaultRender(object):
             "action": action,
             "params": params,
             "values": self.renderSkelValues(skel),
-            "structure": skel.structure(),
+            "structure": skel.cachedStructure(),
             "errors": [{"severity": x.severity.value, "fieldPath": x.fieldPath, "errorMessage": x.errorMessage,
                         "invalidatedFields": x.invalidatedFields} for x in skel.errors]
         }
@@ -168,15 +246,15 @@ class DefaultRender(object):
 
     def list(self, skellist, action="list", tpl=None, params=None, **kwargs):
         res = {}
-        skels = []
-
-        for skel in skellist:
-            skels.append(self.renderSkelValues(skel))
-
-        res["skellist"] = skels
+        if conf["viur.render.xml.streamLists"] and len(skellist) > 0:
+            # Render the skeletons while they're sent, within a copy of the context of the current request
+            context = contextvars.copy_context()
+            res["skellist"] = (context.run(self.renderSkelValues, skel) for skel in skellist)
+        else:
+            res["skellist"] = [self.renderSkelValues(skel) for skel in skellist]
 
         if (len(skellist) > 0):
-            res["structure"] = skellist[0].structure()
+            res["structure"] = skellist[0].cachedStructure()
         else:
             res["structure"] = None
 
@@ -184,6 +262,8 @@ class DefaultRender(object):
         res["params"] = params
         res["cursor"] = skellist.getCursor()
 
+        if isinstance(res["skellist"], Iterator):
+            return iterXML(res)
         return serializeXML(res)
 
     def editSuccess(self, skel, params=None, **kwargs):
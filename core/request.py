@@ -2,6 +2,7 @@ import json
 import logging
 import os
 import traceback
+import types
 import typing
 import inspect
 import unicodedata
@@ -634,8 +635,14 @@ class BrowseHandler():  # webapp.RequestHandler
                 "viur.debug.traceInternalCallRouting"]:
                 logging.debug("Calling %s with args=%s and kwargs=%s" % (str(caller), str(newArgs), str(newKwargs)))
             res = caller(*newArgs, **newKwargs)
-            res = str(res).encode("UTF-8") if not isinstance(res, bytes) else res
-            self.response.write(res)
+            if res is not None and res is self.response.app_iter:
+                pass  # The caller has set up the body of the response itself, like a stream of a known length
+            elif isinstance(res, types.GeneratorType):
+                # Stream the response chunk by chunk
+                self.response.app_iter = (x if isinstance(x, bytes) else str(x).encode("UTF-8") for x in res)
+            else:
+                res = str(res).encode("UTF-8") if not isinstance(res, bytes) else res
+                self.response.write(res)
         except TypeError as e:
             if self.internalRequest:  # We provide that "service" only for requests originating from outside
                 raise
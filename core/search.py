@@ -0,0 +1,324 @@
+"""
+    Ranked fulltext search on top of the datastore.
+
+    The :class:`BM25SearchAdapter` maintains an inverted index of its own: For each term and entry containing it,
+    a posting entity of kind "viur-search-postings" stores the term frequency and the length of the entry. So the
+    size of the index grows with the number of entries instead of the size of a single entity, and postings can be
+    written without reading them first. The statistics (kind "viur-search-stats") are sharded by the key of the
+    entry, so they don't become a bottleneck on writes.
+
+    Searches only read posting entities and rank the matching keys by BM25. Only the entities on the requested
+    page are fetched in the end.
+"""
+import logging
+import math
+import re
+import zlib
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Union
+
+from viur.core import conf, db
+from viur.core.bones import StringBone, TextBone
+from viur.core.skeleton import CustomDatabaseAdapter, Skeleton, skeletonByKind
+from viur.core.tasks import CallDeferred
+
+__all__ = ["BM25SearchAdapter"]
+
+_htmlTagRegex = re.compile(r"<[^>]*>")
+
+
+class BM25SearchAdapter(CustomDatabaseAdapter):
+    """
+    Fulltext search ranking its results by BM25, based on an inverted index maintained by this adapter.
+
+    Words are indexed with their term frequency; a searched word also matches indexed words starting with it,
+    which are weighted by *prefix_weight*. Results can be paginated with the cursor of the query.
+
+    The index gets updated by a deferred task after an entry had been written, so changes become searchable with
+    a short delay. To use it, set it as customDatabaseAdapter of a skeleton:
+
+    .. code-block:: python
+
+        class ArticleSkel(Skeleton):
+            customDatabaseAdapter = BM25SearchAdapter()
+
+    As the postings don't know about any other property, this adapter can't guarantee further constraints of the
+    query; results not matching these are dropped from the page afterwards.
+    """
+    providesFulltextSearch = True
+    fulltextSearchGuaranteesQueryConstrains = False
+
+    def __init__(self, min_length: int = 2, max_length: int = 99, shards: int = 8, k1: float = 1.2,
+                 b: float = 0.75, prefix_weight: float = 0.5, max_prefix_terms: int = 20, max_postings: int = 5000):
+        """
+        :param min_length: Words shorter than this are not indexed.
+        :param max_length: Words longer than this are not indexed.
+        :param shards: Number of statistics entities. Changing this requires rebuilding the index.
+        :param k1: BM25 term frequency saturation.
+        :param b: BM25 document length normalization.
+        :param prefix_weight: Weight of indexed words only starting with a searched word.
+        :param max_prefix_terms: Maximum number of indexed words considered for each searched word.
+        :param max_postings: Maximum number of postings read for each searched word. Entries beyond are not found,
+            and the document frequency of the last indexed word read is underestimated.
+        """
+        super().__init__()
+        self.min_length = min_length
+        self.max_length = max_length
+        self.shards = shards
+        self.k1 = k1
+        self.b = b
+        self.prefix_weight = prefix_weight
+        self.max_prefix_terms = max_prefix_terms
+        self.max_postings = max_postings
+
+    def _termsFromString(self, value: str) -> List[str]:
+        """
+        Extract all indexable words (including duplicates) from given string
+        """
+        res = []
+        validChars = conf["viur.searchValidChars"]
+
+        for word in value.split():
+            word = "".join([x for x in word.lower() if x in validChars])
+
+            if self.min_length <= len(word) <= self.max_length:
+                res.append(word)
+
+        return res
+
+    def _termsFromSkel(self, skel: Skeleton) -> Dict[str, int]:
+        """
+        Collect the words of all searchable bones with their term frequency
+        """
+        res = Counter()
+
+        for boneName, bone in skel.items():
+            if not bone.searchable:
+                continue
+
+            if isinstance(bone, (StringBone, TextBone)):
+                for _, _, value in bone.iter_bone_value(skel, boneName):
+                    if value:
+                        res.update(self._termsFromString(_htmlTagRegex.sub(" ", str(value))))
+            else:
+                for tag in bone.getSearchTags(skel, boneName):
+                    res.update(self._termsFromString(tag))
+
+        return dict(res)
+
+    def _shardOf(self, docId: Union[str, int]) -> int:
+        return zlib.crc32(str(docId).encode("UTF-8")) % self.shards
+
+    @staticmethod
+    def _postingKey(kindName: str, term: str, docId: Union[str, int]) -> db.Key:
+        return db.Key("viur-search-postings", "%s:%s:%s" % (kindName, term, docId))
+
+    @staticmethod
+    def _statsKey(kindName: str, shard: int) -> db.Key:
+        return db.Key("viur-search-stats", "%s:%d" % (kindName, shard))
+
+    def preprocessEntry(self, entry: db.Entity, skel: Skeleton, changeList: List[str], isAdd: bool) -> db.Entity:
+        """
+        Store the terms of this entry; the postings are updated after the transaction
+        """
+        entry["viurSearchTerms"] = self._termsFromSkel(skel)
+        entry.exclude_from_indexes.update({"viurSearchTerms", "viurSearchIndexedTerms"})
+        return entry
+
+    def updateEntry(self, dbObj: db.Entity, skel: Skeleton, changeList: List[str], isAdd: bool) -> None:
+        if (dbObj.get("viurSearchTerms") or {}) != (dbObj.get("viurSearchIndexedTerms") or {}):
+            updateSearchIndex(skel.kindName, dbObj.key)
+
+    def deleteEntry(self, entry: db.Entity, skel: Skeleton) -> None:
+        if indexedTerms := entry.get("viurSearchIndexedTerms"):
+            removeFromSearchIndex(skel.kindName, entry.key.id_or_name, dict(indexedTerms))
+
+    @staticmethod
+    def changedTerms(oldTerms: Dict[str, int], newTerms: Dict[str, int]) -> Set[str]:
+        """
+        Returns the terms whose postings differ between *oldTerms* and *newTerms*.
+
+        These are the terms that have been added, removed or changed their frequency (or all, if the length of the
+        entry has changed).
+        """
+        lengthChanged = sum(oldTerms.values()) != sum(newTerms.values())
+        return {
+            term for term in set(oldTerms) | set(newTerms)
+            if lengthChanged or oldTerms.get(term) != newTerms.get(term)
+        }
+
+    def writePostings(self, kindName: str, docId: Union[str, int], terms: Iterable[str],
+                      newTerms: Dict[str, int]) -> None:
+        """
+        Overwrites the postings of the entry *docId* for *terms* with their state in *newTerms*.
+
+        Postings of terms contained in *newTerms* are written, all others are deleted. As nothing is read, this
+        can be repeated safely; it's up to the caller to ensure the result is consistent with the entry.
+        """
+        length = sum(newTerms.values())
+        putList = []
+        deleteList = []
+
+        for term in terms:
+            postingKey = self._postingKey(kindName, term, docId)
+            if term not in newTerms:
+                deleteList.append(postingKey)
+                continue
+            posting = db.Entity(postingKey, exclude_from_indexes={"doc", "tf", "length"})
+            posting["term"] = "%s:%s" % (kindName, term)
+            posting["doc"] = docId
+            posting["tf"] = newTerms[term]
+            posting["length"] = length
+            putList.append(posting)
+
+        for idx in range(0, len(putList), 500):
+            db.Put(putList[idx:idx + 500])
+        for idx in range(0, len(deleteList), 500):
+            db.Delete(deleteList[idx:idx + 500])
+
+    def updateStats(self, kindName: str, docId: Union[str, int], oldTerms: Dict[str, int],
+                    newTerms: Dict[str, int]) -> None:
+        """
+        Updates the number of entries and their total length used for ranking. Must run inside a transaction.
+        """
+        statsKey = self._statsKey(kindName, self._shardOf(docId))
+        if not (stats := db.Get(statsKey)):
+            stats = db.Entity(statsKey)
+            stats["documents"] = 0
+            stats["length"] = 0
+        stats["documents"] += (1 if newTerms else 0) - (1 if oldTerms else 0)
+        stats["length"] += sum(newTerms.values()) - sum(oldTerms.values())
+        db.Put(stats)
+
+    def fulltextSearch(self, queryString: str, databaseQuery: db.Query) -> List[db.Entity]:
+        """
+        Rank all entries matching *queryString* by BM25 and fetch the page selected by the query's cursor
+        """
+        kindName = databaseQuery.kind
+        queryDefinition = databaseQuery.queries
+        if isinstance(queryDefinition, list):
+            queryDefinition = queryDefinition[0]
+
+        queryTerms = list(dict.fromkeys(self._termsFromString(queryString)))[:10]
+        if not queryTerms:
+            queryDefinition.currentCursor = None
+            return []
+
+        documents = 0
+        totalLength = 0
+        for stats in db.Get([self._statsKey(kindName, shard) for shard in range(0, self.shards)]):
+            if stats:
+                documents += stats["documents"]
+                totalLength += stats["length"]
+        averageLength = (totalLength / documents) if documents > 0 else 1
+
+        scores = {}  # Mapping of docId -> score
+        for queryTerm in queryTerms:
+            postingsByTerm = {}
+            qry = db.Query("viur-search-postings") \
+                .filter("term >=", "%s:%s" % (kindName, queryTerm)) \
+                .filter("term <", "%s:%s\ufffd" % (kindName, queryTerm))
+            for posting in qry.run(self.max_postings):
+                term = posting["term"].split(":", 1)[1]
+                if term not in postingsByTerm and len(postingsByTerm) >= self.max_prefix_terms:
+                    break
+                postingsByTerm.setdefault(term, []).append(posting)
+
+            termScores = {}  # Best score of this query term for each docId
+            for term, postings in postingsByTerm.items():
+                df = len(postings)
+                idf = math.log(1 + (max(documents, df) - df + 0.5) / (df + 0.5))
+                weight = 1 if term == queryTerm else self.prefix_weight
+                for posting in postings:
+                    tf = posting["tf"]
+                    score = weight * idf * tf * (self.k1 + 1) / (
+                        tf + self.k1 * (1 - self.b + self.b * posting["length"] / averageLength))
+                    if score > termScores.get(posting["doc"], 0):
+                        termScores[posting["doc"]] = score
+
+            for docId, score in termScores.items():
+                scores[docId] = scores.get(docId, 0) + score
+
+        ranking = sorted(scores.items(), key=lambda x: (-x[1], str(x[0])))
+
+        offset = 0
+        if (startCursor := queryDefinition.startCursor) and startCursor.startswith("bm25:"):
+            try:
+                offset = max(int(startCursor[5:]), 0)
+            except ValueError:
+                logging.warning("Ignoring invalid cursor %r", startCursor)
+        limit = queryDefinition.limit
+        page = ranking[offset:offset + limit]
+        queryDefinition.currentCursor = "bm25:%d" % (offset + limit) if offset + limit < len(ranking) else None
+
+        if not page:
+            return []
+        return [x for x in db.Get([db.Key(kindName, docId) for docId, _ in page]) if x]
+
+
+def _searchAdapterOf(kindName: str) -> Optional[BM25SearchAdapter]:
+    skelCls = skeletonByKind(kindName)
+    if not skelCls or not isinstance(adapter := skelCls.customDatabaseAdapter, BM25SearchAdapter):
+        logging.error("Kind %r doesn't use the BM25SearchAdapter anymore", kindName)
+        return None
+    return adapter
+
+
+@CallDeferred
+def updateSearchIndex(kindName: str, key: db.Key) -> None:
+    """
+        Brings the postings of the entry *key* up to date with the terms stored on it.
+
+        The postings are written first and confirmed by marking their terms as indexed on the entry afterwards.
+        If another task marked the entry in the meantime, our postings might be outdated or have overwritten newer
+        ones, so all postings written so far are rewritten from the current state of the entry and confirmed again.
+    """
+    if not (adapter := _searchAdapterOf(kindName)):
+        return
+    docId = key.id_or_name
+
+    def txnMarkIndexed(oldTerms: Dict[str, int], newTerms: Dict[str, int]) -> Optional[bool]:
+        if not (entry := db.Get(key)):
+            return None
+        if dict(entry.get("viurSearchIndexedTerms") or {}) != oldTerms:
+            return False  # Indexed by another task in the meantime
+        if oldTerms != newTerms:
+            adapter.updateStats(kindName, docId, oldTerms, newTerms)
+            entry["viurSearchIndexedTerms"] = newTerms
+            entry.exclude_from_indexes.update({"viurSearchTerms", "viurSearchIndexedTerms"})
+            db.Put(entry)
+        return True
+
+    unconfirmedTerms = set()  # Terms whose postings have been written, but not confirmed yet
+    for _ in range(0, 10):
+        if not (entry := db.Get(key)):
+            # The entry has been deleted; removeFromSearchIndex only knows about its confirmed terms
+            adapter.writePostings(kindName, docId, unconfirmedTerms, {})
+            return
+        oldTerms = dict(entry.get("viurSearchIndexedTerms") or {})
+        newTerms = dict(entry.get("viurSearchTerms") or {})
+        terms = adapter.changedTerms(oldTerms, newTerms) | unconfirmedTerms
+        if not terms:
+            return
+        unconfirmedTerms |= terms
+        adapter.writePostings(kindName, docId, terms, newTerms)
+
+        res = db.RunInTransaction(txnMarkIndexed, oldTerms, newTerms)
+        if res is None:
+            adapter.writePostings(kindName, docId, unconfirmedTerms, {})
+            return
+        elif res:
+            return
+
+    logging.error("Failed to update the search index of %r; it's changing too often", key)
+
+
+@CallDeferred
+def removeFromSearchIndex(kindName: str, docId: Union[str, int], indexedTerms: Dict[str, int]) -> None:
+    """
+        Removes the postings of a deleted entry.
+    """
+    if not (adapter := _searchAdapterOf(kindName)):
+        return
+    adapter.writePostings(kindName, docId, indexedTerms, {})
+    db.RunInTransaction(adapter.updateStats, kindName, docId, indexedTerms, {})
@@ -8,12 +8,14 @@ import string
 import warnings
 from functools import partial
 from itertools import chain
+from datetime import date, datetime, time as datetime_time
 from time import time
-from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, Type, Union
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple, Type, Union
 from viur.core import conf, db, email, errors, utils, current
-from viur.core.bones import BaseBone, DateBone, KeyBone, RelationalBone, RelationalUpdateLevel, SelectBone, StringBone
-from viur.core.bones.base import ReadFromClientError, ReadFromClientErrorSeverity, getSystemInitialized
-from viur.core.tasks import CallableTask, CallableTaskBase, QueryIter, CallDeferred
+from viur.core.bones import BaseBone, BooleanBone, DateBone, KeyBone, RelationalBone, RelationalUpdateLevel, \
+    SelectBone, StringBone
+from viur.core.bones.base import ClientData, ReadFromClientError, ReadFromClientErrorSeverity, getSystemInitialized
+from viur.core.tasks import CallableTask, CallableTaskBase, PeriodicTask, QueryIter, CallDeferred
 
 __undefindedC__ = object()
 
@@ -120,6 +122,17 @@ def iterAllSkelClasses() -> Iterable["Skeleton"]:
         yield cls
 
 
+# Cached structures, mapping of (skeleton class, bone names, language) -> variant -> structure
+_structureCache: Dict[Tuple, Dict[Hashable, Any]] = {}
+
+
+def clearStructureCache() -> None:
+    """
+        Drops all cached skeleton structures.
+    """
+    _structureCache.clear()
+
+
 class SkeletonInstance:
     """
         The actual wrapper around a Skeleton-Class. An object of this class is what's actually returned when you
@@ -127,7 +140,10 @@ class SkeletonInstance:
         class. This is much faster as this is a small class.
     """
     __slots__ = {"dbEntity", "accessedValues", "renderAccessedValues", "boneMap", "errors", "skeletonCls",
-                 "renderPreparation"}
+                 "renderPreparation", "dirtyBones"}
+
+    # Values of these types cannot be modified in-place, so reading them never makes a bone dirty
+    _immutableValueTypes = frozenset({str, int, float, bool, bytes, type(None), datetime, date, datetime_time, db.Key})
 
     def __init__(self, skelCls, subSkelNames=None, fullClone=False, clonedBoneMap=None):
         if clonedBoneMap:
@@ -151,6 +167,7 @@ class SkeletonInstance:
         self.dbEntity = None
         self.accessedValues = {}
         self.renderAccessedValues = {}
+        self.dirtyBones = set()
         self.errors = []
         self.skeletonCls = skelCls
         self.renderPreparation = None
@@ -186,6 +203,7 @@ class SkeletonInstance:
             raise AttributeError("Don't assign this bone object as skel[\"%s\"] = ... anymore to the skeleton. "
                                  "Use skel.%s = ... for bone to skeleton assignment!" % (key, key))
         self.accessedValues[key] = value
+        self.dirtyBones.add(key)
 
     def __getitem__(self, key):
         if self.renderPreparation:
@@ -198,8 +216,13 @@ class SkeletonInstance:
                     boneInstance.unserialize(self, key)
                 else:
                     self.accessedValues[key] = boneInstance.getDefaultValue(self)
+                    self.dirtyBones.add(key)
         if not self.renderPreparation:
-            return self.accessedValues.get(key)
+            value = self.accessedValues.get(key)
+            if type(value) not in self._immutableValueTypes:
+                # Containers (lists, dicts, RelSkels) handed out may be modified in-place by the caller
+                self.dirtyBones.add(key)
+            return value
         value = self.renderPreparation(getattr(self, key), self, key, self.accessedValues.get(key))
         self.renderAccessedValues[key] = value
         return value
@@ -211,12 +234,13 @@ class SkeletonInstance:
             return getattr(self.skeletonCls, item)
         elif item in {"fromDB", "toDB", "all", "unserialize", "serialize", "fromClient", "getCurrentSEOKeys",
                       "preProcessSerializedData", "preProcessBlobLocks", "postSavedHandler", "setBoneValue",
-                      "delete", "postDeletedHandler", "refresh"}:
+                      "delete", "postDeletedHandler", "refresh", "reindex"}:
             return partial(getattr(self.skeletonCls, item), self)
         return self.boneMap[item]
 
     def __delattr__(self, item):
         del self.boneMap[item]
+        self.dirtyBones.discard(item)
         if item in self.accessedValues:
             del self.accessedValues[item]
         if item in self.renderAccessedValues:
@@ -247,14 +271,55 @@ class SkeletonInstance:
         res.dbEntity = copy.deepcopy(self.dbEntity)
         res.accessedValues = copy.deepcopy(self.accessedValues)
         res.renderAccessedValues = copy.deepcopy(self.renderAccessedValues)
+        res.dirtyBones = self.dirtyBones.copy()
         return res
 
     def setEntity(self, entity: db.Entity):
         self.dbEntity = entity
         self.accessedValues = {}
         self.renderAccessedValues = {}
+        self.dirtyBones = set()
 
     def structure(self) -> dict:
+        """
+            Returns the structure of this skeleton. It's a copy, so it can be modified by the caller; callers only
+            reading it should use :meth:`cachedStructure` instead.
+        """
+        return copy.deepcopy(self.cachedStructure())
+
+    def cachedStructure(self, render: Optional[Callable[[dict], Any]] = None, variant: Hashable = None) -> Any:
+        """
+            Returns the structure of this skeleton, optionally converted by *render*.
+
+            Structures are static per skeleton class, set of bones and language, so the results are cached unless
+            this skeleton uses cloned bones or bones computing their structure at runtime. The cached results are
+            shared and must not be modified.
+
+            :param render: Converts the structure into the representation of a renderer. Must not modify its input.
+            :param variant: Identifies *render* and its settings in the cache.
+        """
+        if (cacheKey := self._structureCacheKey()) is None:
+            structure = self._buildStructure()
+            return render(structure) if render else structure
+
+        cached = _structureCache.setdefault(cacheKey, {})
+        if None not in cached:
+            cached[None] = self._buildStructure()
+        if render is None:
+            return cached[None]
+        if variant not in cached:
+            cached[variant] = render(cached[None])
+        return cached[variant]
+
+    def _structureCacheKey(self) -> Optional[Tuple]:
+        if not getSystemInitialized():
+            return None
+        for bone in self.boneMap.values():
+            if bone.isClonedInstance or not bone.isStructureStatic():
+                return None
+        return self.skeletonCls, tuple(self.boneMap.keys()), current.language.get()
+
+    def _buildStructure(self) -> dict:
         return {
             key: bone.structure() | {"sortindex": i}
             for i, (key, bone) in enumerate(self.items())
@@ -361,6 +426,8 @@ class BaseSkeleton(object, metaclass=MetaBaseSkel):
             False otherwise (eg. some required fields where missing or invalid).
         """
         assert not allowEmptyRequired, "allowEmptyRequired is only valid on RelSkels"
+        if not isinstance(data, ClientData):
+            data = ClientData(data)  # Index the parameters once, instead of scanning them for each bone
         complete = len(data) > 0  # Empty values are never valid
         skelValues.errors = []
 
@@ -540,32 +607,68 @@ class ViurTagsSearchAdapter(CustomDatabaseAdapter):
         When queried with "hel" we'll match the prefix for "hello"
         When queried with "ell" we'll prefix-match "ello" - this is only enabled when substring_matching is True.
 
+    Long words produce lots of postfixes. Their number can be limited by *max_postfixes* (matching within a word
+    then only works near its beginning), or the n-gram mode can be used by setting *ngram_length*: Each word is
+    stored with all its substrings of that length instead ("hello" becomes "hello", "ell" and "llo" for an
+    *ngram_length* of 3). If *ngram_length* exceeds *min_length*, the postfixes of a word shorter than an n-gram
+    are stored as well ("bobcat" becomes "bobcat", "obca", "bcat" and "cat" for an *ngram_length* of 4), so words
+    can still be found by their end. As these n-grams are shared between many words, this results in far less index
+    entries, but requires one query per n-gram of each searched word.
+
+    The search tags of each bone are cached in the (unindexed) property `viurTagsByBone`, so only bones that have
+    been changed have to be re-evaluated when an entry gets updated.
+
     We'll automatically add this adapter if a skeleton has no other database adapter defined.
     """
     providesFulltextSearch = True
     fulltextSearchGuaranteesQueryConstrains = True
 
-    def __init__(self, min_length: int = 3, max_length: int = 99, substring_matching: bool = True):
+    def __init__(self, min_length: int = 3, max_length: int = 99, substring_matching: bool = True,
+                 max_postfixes: Optional[int] = None, ngram_length: Optional[int] = None):
         super().__init__()
         self.min_length = min_length
         self.max_length = max_length
         self.substring_matching = substring_matching
+        self.max_postfixes = max_postfixes
+        self.ngram_length = ngram_length if substring_matching else None
 
-    def _tagsFromString(self, value: str) -> Set[str]:
+    def _wordsFromString(self, value: str) -> Set[str]:
         """
-        Extract all words including all min_length postfixes from given string
+        Extract all words with at least min_length valid characters from given string
         """
         res = set()
+        validChars = conf["viur.searchValidChars"]
 
         for tag in value.split(" "):
-            tag = "".join([x for x in tag.lower() if x in conf["viur.searchValidChars"]])
+            tag = "".join([x for x in tag.lower() if x in validChars])
 
             if len(tag) >= self.min_length:
                 res.add(tag)
 
-                if self.substring_matching:
-                    for i in range(1, 1 + len(tag) - self.min_length):
-                        res.add(tag[i:])
+        return res
+
+    def _tagsFromString(self, value: str) -> Set[str]:
+        """
+        Extract all words including all min_length postfixes (or n-grams) from given string
+        """
+        res = set()
+
+        for tag in self._wordsFromString(value):
+            res.add(tag)
+
+            if self.ngram_length:
+                # The first n-gram is a prefix of the word itself, so it's matched already
+                for i in range(1, 1 + len(tag) - self.ngram_length):
+                    res.add(tag[i:i + self.ngram_length])
+                # Near the end of the word, the remaining postfixes are shorter than an n-gram
+                for i in range(max(1, 1 + len(tag) - self.ngram_length), 1 + len(tag) - self.min_length):
+                    res.add(tag[i:])
+            elif self.substring_matching:
+                count = len(tag) - self.min_length
+                if self.max_postfixes is not None:
+                    count = min(count, self.max_postfixes)
+                for i in range(1, 1 + count):
+                    res.add(tag[i:])
 
         return res
 
@@ -573,32 +676,57 @@ class ViurTagsSearchAdapter(CustomDatabaseAdapter):
         """
         Collect searchTags from skeleton and build viurTags
         """
-        tags = set()
+        cachedTags = {} if isAdd else (entry.get("viurTagsByBone") or {})
+        tagsByBone = {}
 
         for boneName, bone in skel.items():
-            if bone.searchable:
-                tags = tags.union(bone.getSearchTags(skel, boneName))
+            if not bone.searchable:
+                continue
+
+            if boneName in changeList or boneName not in cachedTags:
+                tagsByBone[boneName] = sorted(bone.getSearchTags(skel, boneName))
+            else:  # Bone is unchanged, its search tags can be taken from the last write
+                tagsByBone[boneName] = cachedTags[boneName] or []
 
+        tags = set(chain(*tagsByBone.values()))
         entry["viurTags"] = list(chain(*[self._tagsFromString(x) for x in tags if len(x) <= self.max_length]))
+        entry["viurTagsByBone"] = tagsByBone
+        entry.exclude_from_indexes.add("viurTagsByBone")
         return entry
 
     def fulltextSearch(self, queryString: str, databaseQuery: db.Query) -> List[db.Entity]:
         """
         Run a fulltext search
         """
-        keywords = list(self._tagsFromString(queryString))[:10]
+        if self.ngram_length:
+            keywords = list(self._wordsFromString(queryString))[:10]
+        else:
+            keywords = list(self._tagsFromString(queryString))[:10]
         resultScoreMap = {}
         resultEntryMap = {}
 
         for keyword in keywords:
-            qryBase = databaseQuery.clone()
-            for entry in qryBase.filter("viurTags >=", keyword).filter("viurTags <", keyword + "\ufffd").run():
-                if not entry.key in resultScoreMap:
-                    resultScoreMap[entry.key] = 1
+            # In n-gram mode, longer keywords must match each of their n-grams
+            if self.ngram_length and len(keyword) > self.ngram_length:
+                probes = {keyword[i:i + self.ngram_length] for i in range(0, 1 + len(keyword) - self.ngram_length)}
+            else:
+                probes = {keyword}
+
+            keywordMatches = None
+            for probe in probes:
+                qryBase = databaseQuery.clone()
+                probeMatches = set()
+                for entry in qryBase.filter("viurTags >=", probe).filter("viurTags <", probe + "\ufffd").run():
+                    probeMatches.add(entry.key)
+                    if not entry.key in resultEntryMap:
+                        resultEntryMap[entry.key] = entry
+                keywordMatches = probeMatches if keywordMatches is None else keywordMatches & probeMatches
+
+            for key in keywordMatches:
+                if not key in resultScoreMap:
+                    resultScoreMap[key] = 1
                 else:
-                    resultScoreMap[entry.key] += 1
-                if not entry.key in resultEntryMap:
-                    resultEntryMap[entry.key] = entry
+                    resultScoreMap[key] += 1
 
         resultList = [(k, v) for k, v in resultScoreMap.items()]
         resultList.sort(key=lambda x: x[1], reverse=True)
@@ -630,6 +758,171 @@ class seoKeyBone(StringBone):
             skel.dbEntity["viur"]["viurCurrentSeoKeys"] = res
         return True
 
+
+def _uniquePropertyIndexKey(kindName: str, boneName: str, lockValue: str) -> db.Key:
+    """
+        Returns the key of the lock-object guarding *lockValue* of the unique bone *boneName*.
+    """
+    return db.Key("%s_%s_uniquePropertyIndex" % (kindName, boneName), lockValue)
+
+
+def _findUniqueValueCollisions(skelValues: SkeletonInstance) -> List[str]:
+    """
+        Checks the values of all unique bones of *skelValues* against their lock-objects.
+
+        All lock-objects are fetched with one single db.Get, regardless of how many unique bones (or values of
+        multiple bones) are involved. This check is not transaction-safe; it's used to reject already claimed
+        values early, the final check is done inside the transaction of :meth:`Skeleton.toDB`.
+
+        :returns: The names of the bones having a value that has already been claimed by another entry.
+            A bone is listed once for each value that has been taken.
+    """
+    lockKeys = []
+    for boneName, boneInstance in skelValues.items():
+        if boneInstance.unique:
+            for lockValue in boneInstance.getUniquePropertyIndexValues(skelValues, boneName):
+                lockKeys.append((boneName, _uniquePropertyIndexKey(skelValues.kindName, boneName, lockValue)))
+
+    if not lockKeys:
+        return []
+
+    ownKey = skelValues["key"]
+    res = []
+    for (boneName, _), lockObj in zip(lockKeys, db.Get([lockKey for _, lockKey in lockKeys])):
+        if lockObj and (not ownKey or lockObj["references"] != ownKey.id_or_name):
+            res.append(boneName)
+
+    return res
+
+
+def _normalizeSeoKeys(seoKeys: Optional[Dict[str, str]]) -> Optional[Dict[str, str]]:
+    """
+        Converts the SEO-keys returned by :meth:`Skeleton.getCurrentSEOKeys` to lower-case and removes
+        characters that are not allowed in an url path component.
+    """
+    if not seoKeys:
+        return seoKeys
+
+    for lang, value in list(seoKeys.items()):
+        value = value.lower()
+        value = value.replace("<", "") \
+            .replace(">", "") \
+            .replace("\"", "") \
+            .replace("'", "") \
+            .replace("\n", "") \
+            .replace("\0", "") \
+            .replace("/", "") \
+            .replace("\\", "") \
+            .replace("?", "") \
+            .replace("&", "") \
+            .replace("#", "").strip()
+        seoKeys[lang] = value
+
+    return seoKeys
+
+
+def _seoKeyReservationKey(kindName: str, seoKey: str) -> db.Key:
+    """
+        Returns the key of the object reserving *seoKey* for an entry of kind *kindName*.
+    """
+    return db.Key("viur-seo-keys", "%s/%s" % (kindName, seoKey))
+
+
+def _releaseSeoKeys(kindName: str, seoKeys: List[str], ownerKey: db.Key) -> None:
+    """
+        Deletes the reservations of *seoKeys* held by the entry *ownerKey*.
+    """
+    reservationKeys = [_seoKeyReservationKey(kindName, x) for x in seoKeys]
+    if flushList := [
+        reservationKey for reservationKey, reservation in zip(reservationKeys, db.Get(reservationKeys))
+        if reservation and reservation["references"] == ownerKey.id_or_name
+    ]:
+        db.Delete(flushList)
+
+
+def _resolveOwnSeoKeys(kindName: str, seoKeys: Iterable[str]) -> Dict[str, db.Key]:
+    """
+        Resolves SEO-keys that are the key of the entry using them (each entry uses its own key as SEO-key,
+        which isn't reserved).
+
+        :returns: A mapping of SEO-key -> key of the entry, for the SEO-keys which are the key of an entry.
+    """
+    keys = {}
+    for seoKey in seoKeys:
+        if seoKey.isdigit():
+            if str(keyId := int(seoKey)) == seoKey and 0 < keyId < 2 ** 63:
+                keys[seoKey] = db.Key(kindName, keyId)
+        elif seoKey and not (seoKey.startswith("__") and seoKey.endswith("__")) and len(seoKey) <= 500:
+            keys[seoKey] = db.Key(kindName, seoKey)
+    if not keys:
+        return {}
+    res = {}
+    for seoKey, entry in zip(keys, db.Get(list(keys.values()))):
+        if entry and seoKey in ((entry.get("viur") or {}).get("viurActiveSeoKeys") or []):
+            res[seoKey] = entry.key
+    return res
+
+
+def resolveSeoKeys(kindName: str, seoKeys: Iterable[str]) -> Dict[str, db.Key]:
+    """
+        Resolves SEO-keys to the keys of the entries of kind *kindName* currently using them.
+
+        All SEO-keys are looked up in one batch by their reservation objects, the remaining ones by the entries
+        having them as key. SEO-keys still not found may belong to an entry that has been written before
+        reservations had been introduced; these are looked up by query, and their reservation is backfilled by
+        a deferred task. This function doesn't write anything itself.
+
+        :param kindName: The kind of the entries.
+        :param seoKeys: The (already lower-cased) SEO-keys to resolve.
+        :returns: A mapping of SEO-key -> key of the entry. SEO-keys that are not in use are missing.
+    """
+    seoKeys = list(dict.fromkeys(seoKeys))
+    if not seoKeys:
+        return {}
+
+    res = {}
+    for seoKey, reservation in zip(seoKeys, db.Get([_seoKeyReservationKey(kindName, x) for x in seoKeys])):
+        if reservation:
+            res[seoKey] = db.Key(kindName, reservation["references"])
+    res |= _resolveOwnSeoKeys(kindName, [x for x in seoKeys if x not in res])
+
+    legacySeoKeys = []
+    for seoKey in seoKeys:
+        if seoKey not in res and (entry := db.Query(kindName).filter("viur.viurActiveSeoKeys =", seoKey).getEntry()):
+            res[seoKey] = entry.key
+            legacySeoKeys.append(seoKey)
+    if legacySeoKeys:
+        backfillSeoKeyReservations(kindName, legacySeoKeys)
+
+    return res
+
+
+def _backfillSeoKeyReservations(kindName: str, seoKeys: Iterable[str]) -> None:
+    """
+        Creates the missing reservations of *seoKeys* used by entries written before reservations had been
+        introduced.
+    """
+    seoKeys = list(dict.fromkeys(seoKeys))
+    if not seoKeys:
+        return
+    reservations = db.Get([_seoKeyReservationKey(kindName, x) for x in seoKeys])
+    for seoKey in [x for x, reservation in zip(seoKeys, reservations) if not reservation]:
+        if not (entry := db.Query(kindName).filter("viur.viurActiveSeoKeys =", seoKey).getEntry()):
+            continue
+        if seoKey == str(entry.key.id_or_name):
+            continue  # An entry's own key doesn't need a reservation
+        # Never overwrite a reservation that has been created in the meantime
+        db.GetOrInsert(_seoKeyReservationKey(kindName, seoKey), references=entry.key.id_or_name)
+
+
+@CallDeferred
+def backfillSeoKeyReservations(kindName: str, seoKeys: List[str]) -> None:
+    """
+        Deferred variant of :func:`_backfillSeoKeyReservations`, so requests resolving SEO-keys don't write.
+    """
+    _backfillSeoKeyReservations(kindName, seoKeys)
+
+
 class Skeleton(BaseSkeleton, metaclass=MetaSkel):
     kindName: str = __undefindedC__  # To which kind we save our data to
     customDatabaseAdapter: Union[CustomDatabaseAdapter, None] = __undefindedC__
@@ -706,17 +999,12 @@ class Skeleton(BaseSkeleton, metaclass=MetaSkel):
         complete = super().fromClient(skelValues, data)
 
         # Check if all unique values are available
-        for boneName, boneInstance in skelValues.items():
-            if boneInstance.unique:
-                lockValues = boneInstance.getUniquePropertyIndexValues(skelValues, boneName)
-                for lockValue in lockValues:
-                    dbObj = db.Get(db.Key("%s_%s_uniquePropertyIndex" % (skelValues.kindName, boneName), lockValue))
-                    if dbObj and (not skelValues["key"] or dbObj["references"] != skelValues["key"].id_or_name):
-                        # This value is taken (sadly, not by us)
-                        complete = False
-                        errorMsg = boneInstance.unique.message
-                        skelValues.errors.append(
-                            ReadFromClientError(ReadFromClientErrorSeverity.Invalid, errorMsg, [boneName]))
+        for boneName in _findUniqueValueCollisions(skelValues):
+            # This value is taken (sadly, not by us)
+            complete = False
+            errorMsg = getattr(skelValues, boneName).unique.message
+            skelValues.errors.append(
+                ReadFromClientError(ReadFromClientErrorSeverity.Invalid, errorMsg, [boneName]))
 
         # Check inter-Bone dependencies
         for checkFunc in skelValues.interBoneValidations:
@@ -762,7 +1050,8 @@ class Skeleton(BaseSkeleton, metaclass=MetaSkel):
         return True
 
     @classmethod
-    def toDB(cls, skelValues: SkeletonInstance, update_relations: bool = True, **kwargs) -> db.Key:
+    def toDB(cls, skelValues: SkeletonInstance, update_relations: bool = True, forceAll: bool = False,
+             **kwargs) -> db.Key:
         """
             Store current Skeleton entity to data store.
 
@@ -770,10 +1059,17 @@ class Skeleton(BaseSkeleton, metaclass=MetaSkel):
             If an *key* value is set to the object, this entity will ne updated;
             Otherwise an new entity will be created.
 
+            Only bones that have been modified on this instance since it has been loaded or last saved (or that are
+            missing in the entity) are serialized; all others keep the values stored in the entity, including
+            read-only bones. So a plain re-save no longer migrates the stored values of untouched bones to a
+            changed serialization of their bone; *forceAll=True* is required for that.
+
             To read a Skeleton object from the data store, see :func:`~viur.core.skeleton.Skeleton.fromDB`.
 
             :param update_relations: If False, this entity won't be marked dirty;
                 This avoids from being fetched by the background task updating relations.
+            :param forceAll: Serialize all bones, regardless of whether they have been modified. Required to
+                migrate existing entries after the serialization of a bone has changed.
 
             :returns: The datastore key of the entity.
         """
@@ -796,7 +1092,6 @@ class Skeleton(BaseSkeleton, metaclass=MetaSkel):
                 # We'll generate the key we'll be stored under early so we can use it for locks etc
                 dbKey = db.AllocateIDs(db.Key(skel.kindName))
                 dbObj = db.Entity(dbKey)
-                oldCopy = {}
                 dbObj["viur"] = {}
                 skel.dbEntity = dbObj
                 oldBlobLockObj = None
@@ -807,11 +1102,9 @@ class Skeleton(BaseSkeleton, metaclass=MetaSkel):
                 dbObj = db.Get(dbKey)
                 if not dbObj:
                     dbObj = db.Entity(dbKey)
-                    oldCopy = {}
                     skel.dbEntity = dbObj
                 else:
                     skel.setEntity(dbObj)
-                    oldCopy = {k: v for k, v in dbObj.items()}
                 oldBlobLockObj = db.Get(db.Key("viur-blob-locks", dbKey.id_or_name))
                 isAdd = False
             if not "viur" in dbObj:
@@ -820,6 +1113,10 @@ class Skeleton(BaseSkeleton, metaclass=MetaSkel):
             # Move accessed Values from srcSkel over to skel
             skel.accessedValues = mergeFrom.accessedValues
             skel["key"] = dbKey  # Ensure key stayes set
+            # Referenced blobs of the previous save, per bone; reused for bones that have not been touched
+            oldBoneBlobs = (oldBlobLockObj.get("bone_blob_references") if oldBlobLockObj else None) or {}
+            boneBlobs = {}
+            uniqueLocks = {}  # Mapping of boneName -> (lock values requested, lock values to be released)
             for key, bone in skel.items():
                 if key == "key":  # Explicitly skip key on top-level - this had been set above
                     continue
@@ -829,123 +1126,155 @@ class Skeleton(BaseSkeleton, metaclass=MetaSkel):
                     if "%s_uniqueIndexValue" % key in dbObj["viur"]:
                         oldUniqueValues = dbObj["viur"]["%s_uniqueIndexValue" % key]
 
+                # Bones that have not been modified on mergeFrom keep what's already in the database
+                isDirty = forceAll or key in mergeFrom.dirtyBones or key not in skel.dbEntity
+
                 # Merge the values from mergeFrom in
-                if key in skel.accessedValues:
-                    # bone.mergeFrom(skel.valuesCache, key, mergeFrom)
-                    bone.serialize(skel, key, True)
-                elif key not in skel.dbEntity:  # It has not been written and is not in the database
-                    _ = skel[key]  # Ensure the datastore is filled with the default value
+                if isDirty:
+                    oldValue = dbObj.get(key)
+                    _ = skel[key]  # Ensure the datastore is filled with the default value if it has not been written
                     bone.serialize(skel, key, True)
 
-                ## Serialize bone into entity
-                # dbObj = bone.serialize(skel.valuesCache, key, dbObj)
+                    # Check if the value has actually changed
+                    if dbObj.get(key) != oldValue:
+                        changeList.append(key)
 
                 # Obtain referenced blobs
-                blobList.update(bone.getReferencedBlobs(skel, key))
-
-                # Check if the value has actually changed
-                if dbObj.get(key) != oldCopy.get(key):
-                    changeList.append(key)
+                if type(bone).getReferencedBlobs is not BaseBone.getReferencedBlobs:
+                    if isDirty or key not in oldBoneBlobs:
+                        boneBlobs[key] = list(bone.getReferencedBlobs(skel, key))
+                    else:
+                        boneBlobs[key] = oldBoneBlobs[key] or []
+                    blobList.update(boneBlobs[key])
 
-                # Lock hashes from bones that must have unique values
+                # Collect hashes from bones that must have unique values; they're locked in one batch below
                 if bone.unique:
-                    # Check if the property is really unique
                     newUniqueValues = bone.getUniquePropertyIndexValues(skel, key)
+                    uniqueLocks[key] = (newUniqueValues, [x for x in oldUniqueValues if x not in newUniqueValues])
+                    dbObj["viur"]["%s_uniqueIndexValue" % key] = newUniqueValues
+
+            # Lock hashes from bones that must have unique values
+            if uniqueLocks:
+                lockKeys = {}  # Mapping of (boneName, lockValue) -> lockKey
+                for key, (newUniqueValues, staleUniqueValues) in uniqueLocks.items():
+                    for lockValue in chain(newUniqueValues, staleUniqueValues):
+                        lockKeys[(key, lockValue)] = _uniquePropertyIndexKey(skel.kindName, key, lockValue)
+
+                # Fetch all lock-objects involved with one single request
+                lockObjs = dict(zip(lockKeys.keys(), db.Get(list(lockKeys.values()))))
+                newLockObjs = {}
+                staleLockKeys = []
+
+                for key, (newUniqueValues, staleUniqueValues) in uniqueLocks.items():
+                    # Check if the property is really unique
                     for newLockValue in newUniqueValues:
-                        lockObj = db.Get(db.Key("%s_%s_uniquePropertyIndex" % (skel.kindName, key), newLockValue))
-                        if lockObj:
+                        lockKey = lockKeys[(key, newLockValue)]
+                        if lockObj := lockObjs[(key, newLockValue)]:
                             # There's already a lock for that value, check if we hold it
                             if lockObj["references"] != dbObj.key.id_or_name:
                                 # This value has already been claimed, and not by us
                                 raise ValueError(
                                     "The unique value '%s' of bone '%s' has been recently claimed!" %
                                     (skelValues[key], key))
-                        else:
+                        elif lockKey not in newLockObjs:
                             # This value is locked for the first time, create a new lock-object
-                            newLockObj = db.Entity(db.Key(
-                                "%s_%s_uniquePropertyIndex" % (skel.kindName, key),
-                                newLockValue))
+                            newLockObj = db.Entity(lockKey)
                             newLockObj["references"] = dbObj.key.id_or_name
-                            db.Put(newLockObj)
-                        if newLockValue in oldUniqueValues:
-                            oldUniqueValues.remove(newLockValue)
-                    dbObj["viur"]["%s_uniqueIndexValue" % key] = newUniqueValues
+                            newLockObjs[lockKey] = newLockObj
+
                     # Remove any lock-object we're holding for values that we don't have anymore
-                    for oldValue in oldUniqueValues:
-                        # Try to delete the old lock
-                        oldLockKey = db.Key("%s_%s_uniquePropertyIndex" % (skel.kindName, key), oldValue)
-                        oldLockObj = db.Get(oldLockKey)
-                        if oldLockObj:
+                    for oldValue in staleUniqueValues:
+                        if oldLockObj := lockObjs[(key, oldValue)]:
                             if oldLockObj["references"] != dbObj.key.id_or_name:
                                 # We've been supposed to have that lock - but we don't.
                                 # Don't remove that lock as it now belongs to a different entry
                                 logging.critical("Detected Database corruption! A Value-Lock had been reassigned!")
                             else:
                                 # It's our lock which we don't need anymore
-                                db.Delete(oldLockKey)
+                                staleLockKeys.append(lockKeys[(key, oldValue)])
                         else:
                             logging.critical("Detected Database corruption! Could not delete stale lock-object!")
 
+                if newLockObjs:
+                    db.Put(list(newLockObjs.values()))
+                if staleLockKeys:
+                    db.Delete(staleLockKeys)
+
             # Ensure the SEO-Keys are up2date
             lastRequestedSeoKeys = dbObj["viur"].get("viurLastRequestedSeoKeys") or {}
             lastSetSeoKeys = dbObj["viur"].get("viurCurrentSeoKeys") or {}
             # Filter garbage serialized into this field by the seoKeyBone
             lastSetSeoKeys = {k: v for k, v in lastSetSeoKeys.items() if not k.startswith("_") and v}
-            currentSeoKeys = skel.getCurrentSEOKeys()
-            if not isinstance(dbObj["viur"].get("viurCurrentSeoKeys"), dict):
-                dbObj["viur"]["viurCurrentSeoKeys"] = {}
-            if currentSeoKeys:
-                # Convert to lower-case and remove certain characters
-                for lang, value in list(currentSeoKeys.items()):
-                    value = value.lower()
-                    value = value.replace("<", "") \
-                        .replace(">", "") \
-                        .replace("\"", "") \
-                        .replace("'", "") \
-                        .replace("\n", "") \
-                        .replace("\0", "") \
-                        .replace("/", "") \
-                        .replace("\\", "") \
-                        .replace("?", "") \
-                        .replace("&", "") \
-                        .replace("#", "").strip()
-                    currentSeoKeys[lang] = value
-            for language in (conf["viur.availableLanguages"] or [conf["viur.defaultLanguage"]]):
-                if currentSeoKeys and language in currentSeoKeys:
-                    currentKey = currentSeoKeys[language]
-                    if currentKey != lastRequestedSeoKeys.get(language):  # This one is new or has changed
-                        newSeoKey = currentSeoKeys[language]
-                        for _ in range(0, 3):
-                            entryUsingKey = db.Query(skelValues.kindName).filter("viur.viurActiveSeoKeys =",
-                                                                                 newSeoKey).getEntry()
-                            if entryUsingKey and entryUsingKey.key != dbObj.key:
-                                # It's not unique; append a random string and try again
-                                newSeoKey = "%s-%s" % (currentSeoKeys[language], utils.generateRandomString(5).lower())
-                            else:
-                                break
+            currentSeoKeys = _normalizeSeoKeys(skel.getCurrentSEOKeys())
+            languages = conf["viur.availableLanguages"] or [conf["viur.defaultLanguage"]]
+            ownSeoKey = str(dbObj.key.id_or_name)
+            oldActiveSeoKeys = dbObj["viur"].get("viurActiveSeoKeys") or []
+
+            # Nothing to do if the requested keys are the same as on the last write
+            if ((currentSeoKeys or {}) != lastRequestedSeoKeys
+                or not isinstance(dbObj["viur"].get("viurCurrentSeoKeys"), dict)
+                or any(language not in lastSetSeoKeys for language in languages)
+                or ownSeoKey not in oldActiveSeoKeys):
+                if not isinstance(dbObj["viur"].get("viurCurrentSeoKeys"), dict):
+                    dbObj["viur"]["viurCurrentSeoKeys"] = {}
+                requestedSeoKeys = {}  # Mapping of language -> new seo key that has yet to be checked
+                for language in languages:
+                    if currentSeoKeys and language in currentSeoKeys:
+                        # This one is new or has changed
+                        if currentSeoKeys[language] != lastRequestedSeoKeys.get(language):
+                            requestedSeoKeys[language] = currentSeoKeys[language]
                         else:
-                            raise ValueError("Could not generate an unique seo key in 3 attempts")
+                            lastSetSeoKeys[language] = lastSetSeoKeys.get(language) or currentSeoKeys[language]
                     else:
-                        newSeoKey = currentKey
-                    lastSetSeoKeys[language] = newSeoKey
-                else:
-                    # We'll use the database-key instead
-                    lastSetSeoKeys[language] = str(dbObj.key.id_or_name)
-                # Store the current, active key for that language
-                dbObj["viur"]["viurCurrentSeoKeys"][language] = lastSetSeoKeys[language]
-            if not dbObj["viur"].get("viurActiveSeoKeys"):
-                dbObj["viur"]["viurActiveSeoKeys"] = []
-            for language, seoKey in lastSetSeoKeys.items():
-                if dbObj["viur"]["viurCurrentSeoKeys"][language] not in dbObj["viur"]["viurActiveSeoKeys"]:
-                    # Ensure the current, active seo key is in the list of all seo keys
-                    dbObj["viur"]["viurActiveSeoKeys"].insert(0, seoKey)
-            if str(dbObj.key.id_or_name) not in dbObj["viur"]["viurActiveSeoKeys"]:
-                # Ensure that key is also in there
-                dbObj["viur"]["viurActiveSeoKeys"].insert(0, str(dbObj.key.id_or_name))
-            # Trim to the last 200 used entries
-            dbObj["viur"]["viurActiveSeoKeys"] = dbObj["viur"]["viurActiveSeoKeys"][:200]
-            # Store lastRequestedKeys so further updates can run more efficient
-            dbObj["viur"]["viurLastRequestedSeoKeys"] = currentSeoKeys
+                        # We'll use the database-key instead
+                        lastSetSeoKeys[language] = ownSeoKey
+
+                # Check the reservations of all requested keys with one db.Get per attempt
+                for _ in range(0, 3):
+                    if not requestedSeoKeys:
+                        break
+                    reservations = db.Get([_seoKeyReservationKey(skel.kindName, x) for x in requestedSeoKeys.values()])
+                    # Keys of other entries are taken as well, as each entry uses its own key as SEO-key
+                    otherEntries = _resolveOwnSeoKeys(
+                        skel.kindName, [x for x in requestedSeoKeys.values() if x != ownSeoKey])
+                    for (language, seoKey), reservation in zip(list(requestedSeoKeys.items()), reservations):
+                        if (reservation and reservation["references"] != dbObj.key.id_or_name) \
+                                or seoKey in otherEntries:
+                            # It's not unique; append a random string and try again
+                            requestedSeoKeys[language] = "%s-%s" % (
+                                currentSeoKeys[language], utils.generateRandomString(5).lower())
+                        else:
+                            lastSetSeoKeys[language] = seoKey
+                            del requestedSeoKeys[language]
+                if requestedSeoKeys:
+                    raise ValueError("Could not generate an unique seo key in 3 attempts")
+
+                # Store the current, active key for each language
+                for language in languages:
+                    dbObj["viur"]["viurCurrentSeoKeys"][language] = lastSetSeoKeys[language]
+                activeSeoKeys = list(oldActiveSeoKeys)
+                for seoKey in lastSetSeoKeys.values():
+                    if seoKey not in activeSeoKeys:
+                        # Ensure the current, active seo key is in the list of all seo keys
+                        activeSeoKeys.insert(0, seoKey)
+                if ownSeoKey not in activeSeoKeys:
+                    # Ensure that key is also in there
+                    activeSeoKeys.insert(0, ownSeoKey)
+                # Trim to the last 200 used entries
+                dbObj["viur"]["viurActiveSeoKeys"] = activeSeoKeys[:200]
+                # Store lastRequestedKeys so further updates can run more efficient
+                dbObj["viur"]["viurLastRequestedSeoKeys"] = currentSeoKeys
+
+                # Reserve the keys we've just started using, and release the ones that have been trimmed
+                newReservations = []
+                for seoKey in set(dbObj["viur"]["viurActiveSeoKeys"]) - set(oldActiveSeoKeys) - {ownSeoKey}:
+                    reservation = db.Entity(_seoKeyReservationKey(skel.kindName, seoKey))
+                    reservation["references"] = dbObj.key.id_or_name
+                    newReservations.append(reservation)
+                if newReservations:
+                    db.Put(newReservations)
+                if releasedSeoKeys := list(set(oldActiveSeoKeys) - set(dbObj["viur"]["viurActiveSeoKeys"])):
+                    _releaseSeoKeys(skel.kindName, releasedSeoKeys, dbObj.key)
 
             # mark entity as "dirty" when update_relations is set, to zero otherwise.
             dbObj["viur"]["delayedUpdateTag"] = time() if update_relations else 0
@@ -988,6 +1317,8 @@ class Skeleton(BaseSkeleton, metaclass=MetaSkel):
                 oldBlobs = set(oldBlobLockObj.get("active_blob_references") or [])
                 removedBlobs = oldBlobs - blobList
                 oldBlobLockObj["active_blob_references"] = list(blobList)
+                oldBlobLockObj["bone_blob_references"] = boneBlobs
+                oldBlobLockObj.exclude_from_indexes.add("bone_blob_references")
                 if oldBlobLockObj["old_blob_references"] is None:
                     oldBlobLockObj["old_blob_references"] = [x for x in removedBlobs]
                 else:
@@ -999,8 +1330,10 @@ class Skeleton(BaseSkeleton, metaclass=MetaSkel):
                 oldBlobLockObj["is_stale"] = False
                 db.Put(oldBlobLockObj)
             else:  # We need to create a new blob-lock-object
-                blobLockObj = db.Entity(db.Key("viur-blob-locks", dbObj.key.id_or_name))
+                blobLockObj = db.Entity(db.Key("viur-blob-locks", dbObj.key.id_or_name),
+                                        exclude_from_indexes={"bone_blob_references"})
                 blobLockObj["active_blob_references"] = list(blobList)
+                blobLockObj["bone_blob_references"] = boneBlobs
                 blobLockObj["old_blob_references"] = []
                 blobLockObj["has_old_blob_references"] = False
                 blobLockObj["is_stale"] = False
@@ -1017,14 +1350,35 @@ class Skeleton(BaseSkeleton, metaclass=MetaSkel):
         for bkey, _bone in skelValues.items():
             _bone.performMagic(skelValues, bkey, isAdd=isAdd)
 
+        # Backfill the reservations of new SEO-keys before entering the transaction. This ensures entries holding
+        # one of these keys from before SEO-key reservations were introduced got their reservation, so txnUpdate
+        # can rely on these.
+        if currentSeoKeys := _normalizeSeoKeys(skelValues.getCurrentSEOKeys()):
+            viurData = skelValues.dbEntity.get("viur") if skelValues.dbEntity else None
+            lastRequestedSeoKeys = (viurData or {}).get("viurLastRequestedSeoKeys") or {}
+            _backfillSeoKeyReservations(
+                skelValues.kindName,
+                [seoKey for lang, seoKey in currentSeoKeys.items() if seoKey != lastRequestedSeoKeys.get(lang)]
+            )
+
         # Run our SaveTxn
-        if db.IsInTransaction():
+        if isInTransaction := db.IsInTransaction():
             key, dbObj, skel, changeList = txnUpdate(key, skelValues)
         else:
+            # Fail fast on unique values that are obviously taken, before locking anything in the transaction
+            if collisions := _findUniqueValueCollisions(skelValues):
+                raise ValueError(
+                    "The unique value '%s' of bone '%s' has been recently claimed!" %
+                    (skelValues[collisions[0]], collisions[0]))
+
             key, dbObj, skel, changeList = db.RunInTransaction(txnUpdate, key, skelValues)
 
         # Perform post-save operations (postProcessSerializedData Hook, Searchindex, ..)
         skelValues["key"] = key
+        if not isInTransaction:
+            # Everything has been written; saving this instance again only writes what is modified from now on.
+            # Inside a transaction of the caller, the bones stay dirty in case that transaction is retried.
+            skelValues.dirtyBones.clear()
 
         for boneName, bone in skel.items():
             bone.postSavedHandler(skel, boneName, key)
@@ -1044,6 +1398,64 @@ class Skeleton(BaseSkeleton, metaclass=MetaSkel):
 
         return key
 
+    @classmethod
+    def reindex(cls, skelValues: SkeletonInstance) -> bool:
+        """
+            Lightweight alternative to :meth:`refresh` followed by :meth:`toDB`, used to rebuild search indexes.
+
+            Refreshes the bones of the entry, writes the bones changed by this and lets the customDatabaseAdapter
+            recompute its data (like the viurTags). Outgoing relations are rewritten afterwards. Unique values,
+            SEO-keys and blob locks are left untouched, and no updates of referencing entries are triggered.
+
+            The entry is refreshed outside of a transaction, as this may fetch referenced entries. It's only
+            written if its serialized values have changed, and only if it hasn't been modified in the meantime;
+            otherwise this is retried.
+
+            :returns: True if the entry had to be written, False if it was already up to date or doesn't exist.
+        """
+        key = skelValues["key"]
+
+        def txnCompareAndPut(oldValues, dbObj):
+            currentObj = db.Get(key)
+            if not currentObj or dict(currentObj) != oldValues:
+                return False  # Deleted or modified in the meantime
+            db.Put(dbObj)
+            return True
+
+        for _ in range(0, 3):
+            if not (dbObj := db.Get(key)):
+                return False
+            skel = skelValues.skeletonCls()
+            skel.setEntity(dbObj)
+            # Bones may modify nested values of the entity in-place, so the comparison needs a deep copy
+            oldValues = copy.deepcopy(dict(dbObj))
+            skel.refresh()
+            for boneName, bone in skel.items():
+                if boneName != "key" and (boneName in skel.dirtyBones or boneName not in dbObj):
+                    bone.serialize(skel, boneName, True)
+            dbObj = skel.preProcessSerializedData(dbObj)
+            if skel.customDatabaseAdapter:
+                dbObj = skel.customDatabaseAdapter.preprocessEntry(dbObj, skel, list(skel.keys()), False)
+            if dict(dbObj) == oldValues:
+                dbObj = None
+                break
+            if db.IsInTransaction():
+                if txnCompareAndPut(oldValues, dbObj):
+                    break
+            elif db.RunInTransaction(txnCompareAndPut, oldValues, dbObj):
+                break
+        else:
+            logging.warning("Failed to reindex %r, as it's been modified concurrently", key)
+            return False
+
+        for boneName, bone in skel.items():
+            if isinstance(bone, RelationalBone):
+                bone.postSavedHandler(skel, boneName, key)
+        if dbObj is not None and skel.customDatabaseAdapter:
+            skel.customDatabaseAdapter.updateEntry(dbObj, skel, list(skel.keys()), False)
+
+        return dbObj is not None
+
     @classmethod
     def preProcessBlobLocks(cls, skelValues, locks):
         """
@@ -1098,23 +1510,29 @@ class Skeleton(BaseSkeleton, metaclass=MetaSkel):
             viurData = dbObj.get("viur") or {}
             if dbObj.get("viur_incomming_relational_locks"):
                 raise errors.Locked("This entry is locked!")
+            lockKeys = []
             for boneName, bone in skel.items():
                 # Ensure that we delete any value-lock objects remaining for this entry
                 bone.delete(skel, boneName)
                 if bone.unique:
-                    flushList = []
                     for lockValue in viurData.get("%s_uniqueIndexValue" % boneName) or []:
-                        lockKey = db.Key("%s_%s_uniquePropertyIndex" % (skel.kindName, boneName), lockValue)
-                        lockObj = db.Get(lockKey)
-                        if not lockObj:
-                            logging.error("Programming error detected: Lockobj %s missing!" % lockKey)
-                        elif lockObj["references"] != dbObj.key.id_or_name:
-                            logging.error(
-                                "Programming error detected: %s did not hold lock for %s" % (skel["key"], lockKey))
-                        else:
-                            flushList.append(lockObj)
-                    if flushList:
-                        db.Delete(flushList)
+                        lockKeys.append(_uniquePropertyIndexKey(skel.kindName, boneName, lockValue))
+            if lockKeys:
+                # Fetch and remove the value-lock objects of all unique bones in one batch
+                flushList = []
+                for lockKey, lockObj in zip(lockKeys, db.Get(lockKeys)):
+                    if not lockObj:
+                        logging.error("Programming error detected: Lockobj %s missing!" % lockKey)
+                    elif lockObj["references"] != dbObj.key.id_or_name:
+                        logging.error(
+                            "Programming error detected: %s did not hold lock for %s" % (skel["key"], lockKey))
+                    else:
+                        flushList.append(lockKey)
+                if flushList:
+                    db.Delete(flushList)
+            # Release the SEO-keys reserved by this entry
+            if viurData.get("viurActiveSeoKeys"):
+                _releaseSeoKeys(skel.kindName, viurData["viurActiveSeoKeys"], dbObj.key)
             # Delete the blob-key lock object
             lockObjectKey = db.Key("viur-blob-locks", dbObj.key.id_or_name)
             lockObj = db.Get(lockObjectKey)
@@ -1181,6 +1599,8 @@ class RelSkel(BaseSkeleton):
             :param data: Dictionary from which the data is read
             :returns: True if the data was successfully read; False otherwise (eg. some required fields where missing or invalid)
         """
+        if not isinstance(data, ClientData):
+            data = ClientData(data)  # Index the parameters once, instead of scanning them for each bone
         complete = len(data) > 0  # Empty values are never valid
         skelValues.errors = []
         allBonesEmpty = True  # Indicates if all bones in this skeleton are empty
@@ -1241,6 +1661,7 @@ class RelSkel(BaseSkeleton):
 
         self.accessedValues = {}
         self.renderAccessedValues = {}
+        self.dirtyBones = set()
         # self.valuesCache = {"entity": values, "changedValues": {}, "cachedRenderValues": {}}
         return
         for bkey, _bone in self.items():
@@ -1396,6 +1817,11 @@ class TaskUpdateSearchIndex(CallableTaskBase):
     """
     This tasks loads and saves *every* entity of the given module.
     This ensures an updated searchIndex and verifies consistency of this data.
+
+    Each kind is split into conf["viur.searchIndex.rebuild.shards"] (+2) key-ranges, of which up to
+    conf["viur.searchIndex.rebuild.parallelism"] are processed at the same time. The progress is tracked in an
+    entity of kind "viur-search-index-rebuilds". Key-ranges not finished within
+    conf["viur.searchIndex.rebuild.shardTimeout"] are counted as failed by :func:`checkSearchIndexRebuilds`.
     """
     key = "rebuildSearchIndex"
     name = "Rebuild search index"
@@ -1410,9 +1836,10 @@ class TaskUpdateSearchIndex(CallableTaskBase):
         modules = ["*"] + listKnownSkeletons()
         skel = BaseSkeleton().clone()
         skel.module = SelectBone(descr="Module", values={x: x for x in modules}, required=True)
+        skel.reindexOnly = BooleanBone(descr="Only update search index and relations", defaultValue=True)
         return skel
 
-    def execute(self, module, *args, **kwargs):
+    def execute(self, module, reindexOnly=True, *args, **kwargs):
         usr = current.user.get()
         if not usr:
             logging.warning("Don't know who to inform after rebuilding finished")
@@ -1421,30 +1848,196 @@ class TaskUpdateSearchIndex(CallableTaskBase):
             notify = usr["name"]
 
         if module == "*":
-            for module in listKnownSkeletons():
-                logging.info("Rebuilding search index for module %r", module)
-                self._run(module, notify)
+            modules = listKnownSkeletons()
+        elif skeletonByKind(module):
+            modules = [module]
         else:
-            self._run(module, notify)
-
-    @staticmethod
-    def _run(module: str, notify: str):
-        Skel = skeletonByKind(module)
-        if not Skel:
             logging.error("TaskUpdateSearchIndex: Invalid module")
             return
-        RebuildSearchIndex.startIterOnQuery(Skel().all(), {"notify": notify, "module": module})
+
+        shards = max(conf["viur.searchIndex.rebuild.shards"], 1)
+        rebuild = db.Entity(db.Key("viur-search-index-rebuilds", utils.generateRandomString(13)),
+                            exclude_from_indexes={"pendingShards", "runningLeases", "processedByModule"})
+        rebuild["creationdate"] = rebuild["changedate"] = utils.utcNow()
+        rebuild["notify"] = notify
+        rebuild["reindexOnly"] = bool(reindexOnly)
+        rebuild["parallelism"] = max(conf["viur.searchIndex.rebuild.parallelism"], 1)
+        rebuild["pendingShards"] = list(chain(*[_searchIndexShards(x, shards) for x in modules]))
+        rebuild["totalShards"] = len(rebuild["pendingShards"])
+        rebuild["runningShards"] = 0
+        rebuild["runningLeases"] = []  # The shards currently processed, with their id and start time
+        rebuild["finishedShards"] = 0
+        rebuild["failedShards"] = 0
+        rebuild["processedEntries"] = 0
+        rebuild["processedByModule"] = {}
+        rebuild["isFinished"] = False
+        db.Put(rebuild)
+        logging.info("Rebuilding search index for %s in %d shards, tracked by %r",
+                     ", ".join(modules), rebuild["totalShards"], rebuild.key)
+        _startSearchIndexShards(rebuild.key)
+
+
+# The datastore scatters auto-allocated ids evenly between these values
+_minAllocatedId = 2 ** 52
+_maxAllocatedId = 2 ** 53
+
+
+def _searchIndexShards(kindName: str, shards: int) -> List[Dict[str, Any]]:
+    """
+        Splits the key-space of *kindName* into *shards* ranges of ids, plus two ranges of their own for keys
+        below the scattered ids (allocated sequentially or by a legacy allocator) and for keys having a name.
+
+        As allocated ids are scattered over [2**52, 2**53), these *shards* ranges contain roughly the same number
+        of entries.
+    """
+    step = (_maxAllocatedId - _minAllocatedId) // shards
+    bounds = [None] + [_minAllocatedId + idx * step for idx in range(0, shards)] + [_maxAllocatedId, None]
+    return [{
+        "module": kindName,
+        "startKey": db.Key(kindName, startId) if startId is not None else None,
+        "endKey": db.Key(kindName, endId) if endId is not None else None,
+    } for startId, endId in zip(bounds, bounds[1:])]
+
+
+def _startSearchIndexShards(rebuildKey: db.Key) -> None:
+    """
+        Starts pending shards of the search index rebuild *rebuildKey* until its parallelism limit is reached.
+    """
+
+    def txnStart():
+        rebuild = db.Get(rebuildKey)
+        if not rebuild:
+            return None, []
+        slots = max(rebuild["parallelism"] - rebuild["runningShards"], 0)
+        shards = rebuild["pendingShards"][:slots]
+        rebuild["pendingShards"] = rebuild["pendingShards"][slots:]
+        now = utils.utcNow()
+        for shard in shards:
+            shard["id"] = utils.generateRandomString(13)
+            rebuild["runningLeases"].append({"id": shard["id"], "module": shard["module"], "startdate": now})
+        rebuild["runningShards"] = len(rebuild["runningLeases"])
+        db.Put(rebuild)
+        return rebuild, shards
+
+    rebuild, shards = db.RunInTransaction(txnStart)
+    for shard in shards:
+        query = skeletonByKind(shard["module"])().all()
+        if shard["startKey"]:
+            query.filter("__key__ >=", shard["startKey"])
+        if shard["endKey"]:
+            query.filter("__key__ <", shard["endKey"])
+        RebuildSearchIndex.startIterOnQuery(query, {
+            "rebuildKey": rebuildKey,
+            "module": shard["module"],
+            "shardId": shard["id"],
+            "notify": rebuild["notify"],
+            "reindexOnly": rebuild["reindexOnly"],
+        })
+
+
+def _finishSearchIndexShard(rebuildKey: db.Key, module: str, shardId: str, totalCount: int) -> None:
+    """
+        Records a finished shard of the search index rebuild *rebuildKey*, and starts the next pending one.
+    """
+
+    def txnFinish():
+        rebuild = db.Get(rebuildKey)
+        if not rebuild:
+            return None
+        leases = [x for x in rebuild["runningLeases"] if x["id"] != shardId]
+        if len(leases) == len(rebuild["runningLeases"]):
+            logging.warning("Shard %s of %s finished after it had been given up", shardId, module)
+            return None
+        rebuild["runningLeases"] = leases
+        rebuild["runningShards"] = len(leases)
+        rebuild["finishedShards"] += 1
+        rebuild["processedEntries"] += totalCount
+        processedByModule = dict(rebuild["processedByModule"] or {})
+        processedByModule[module] = processedByModule.get(module, 0) + totalCount
+        rebuild["processedByModule"] = processedByModule
+        rebuild["isFinished"] = not rebuild["pendingShards"] and not leases
+        rebuild["changedate"] = utils.utcNow()
+        db.Put(rebuild)
+        return rebuild
+
+    if not (rebuild := db.RunInTransaction(txnFinish)):
+        return
+    logging.info("Rebuilding search index %r: %d of %d shards finished, %d entries processed",
+                 rebuildKey, rebuild["finishedShards"], rebuild["totalShards"], rebuild["processedEntries"])
+    _continueSearchIndexRebuild(rebuild)
+
+
+def _continueSearchIndexRebuild(rebuild: db.Entity) -> None:
+    """
+        Starts the next pending shards of the search index rebuild *rebuild*, or informs about its end.
+    """
+    if not rebuild["isFinished"]:
+        _startSearchIndexShards(rebuild.key)
+    elif rebuild["notify"]:
+        try:
+            txt = f"Subject: Rebuild search index finished\n\n" \
+                  f"ViUR finished to rebuild the search index.\n" \
+                  f"{rebuild['processedEntries']} records updated in total.\n\n" + \
+                  "\n".join(f"{k}: {v}" for k, v in sorted(rebuild["processedByModule"].items()))
+            if rebuild.get("failedShards"):
+                txt += f"\n\n{rebuild['failedShards']} key-ranges did not finish in time and were given up."
+            email.sendEMail(dests=rebuild["notify"], stringTemplate=txt, skel=None)
+        except:  # OverQuota, whatever
+            pass
+
+
+@PeriodicTask(30)
+def checkSearchIndexRebuilds():
+    """
+        Gives up the shards of running search index rebuilds which did not finish within
+        conf["viur.searchIndex.rebuild.shardTimeout"], like shards failing permanently. Otherwise, these would
+        block their rebuild from ever finishing.
+    """
+
+    def txnExpire(rebuildKey):
+        rebuild = db.Get(rebuildKey)
+        if not rebuild or rebuild["isFinished"]:
+            return None
+        deadline = utils.utcNow() - conf["viur.searchIndex.rebuild.shardTimeout"]
+        leases = [x for x in rebuild.get("runningLeases") or [] if x["startdate"] >= deadline]
+        if len(leases) == len(rebuild.get("runningLeases") or []):
+            return None
+        for lease in rebuild["runningLeases"]:
+            if lease not in leases:
+                logging.error("Giving up shard %s of %s of search index rebuild %r, started %s",
+                              lease["id"], lease["module"], rebuildKey, lease["startdate"])
+        rebuild["failedShards"] = rebuild.get("failedShards", 0) + len(rebuild["runningLeases"]) - len(leases)
+        rebuild["runningLeases"] = leases
+        rebuild["runningShards"] = len(leases)
+        rebuild["isFinished"] = not rebuild["pendingShards"] and not leases
+        rebuild["changedate"] = utils.utcNow()
+        db.Put(rebuild)
+        return rebuild
+
+    for rebuild in db.Query("viur-search-index-rebuilds").filter("isFinished =", False).run(100):
+        if rebuild := db.RunInTransaction(txnExpire, rebuild.key):
+            _continueSearchIndexRebuild(rebuild)
 
 
 class RebuildSearchIndex(QueryIter):
+    batchSize = 25
+
     @classmethod
     def handleEntry(cls, skel: SkeletonInstance, customData: Dict[str, str]):
-        skel.refresh()
-        skel.toDB(update_relations=False)
+        if customData.get("reindexOnly"):
+            skel.reindex()
+        else:
+            skel.refresh()
+            skel.toDB(update_relations=False, forceAll=True)
 
     @classmethod
     def handleFinish(cls, totalCount: int, customData: Dict[str, str]):
         QueryIter.handleFinish(totalCount, customData)
+        if customData.get("rebuildKey"):
+            # This has been one shard of a rebuild started by TaskUpdateSearchIndex
+            _finishSearchIndexShard(customData["rebuildKey"], customData["module"], customData["shardId"],
+                                    totalCount)
+            return
         try:
             if customData["notify"]:
                 txt = f"Subject: Rebuild search index finished for {customData['module']}\n\n" \
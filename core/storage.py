@@ -0,0 +1,357 @@
+"""
+    Access to the blobs (uploaded files and their derivatives) of the File module.
+
+    Blobs are addressed by their path inside the bucket, like "<dlkey>/source/<filename>".
+    :class:`GCSBlobStorage` stores them in a Google Cloud Storage bucket, :class:`LocalBlobStorage` in a directory
+    on the local disk, which allows running the file processing without access to Cloud Storage.
+
+    The storage used by the File module is selected by conf["viur.file.blobStorage"].
+"""
+import mimetypes
+import mmap
+import os
+import threading
+import binascii
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
+
+import webob
+
+from viur.core import utils
+
+__all__ = ["BlobInfo", "BlobStorage", "GCSBlobStorage", "LocalBlobStorage"]
+
+
+@dataclass
+class BlobInfo:
+    """
+        Metadata of a blob.
+    """
+    name: str  # The full path of the blob
+    size: int
+    mimeType: str
+    etag: str  # Changes whenever the blob is written
+
+
+class BlobStorage:
+    """
+        Interface of a blob storage.
+    """
+    chunkSize = 1024 * 1024  # Size of the chunks a blob is served in
+
+    def get(self, path: str) -> Optional[bytes]:
+        """
+            Returns the contents of the blob *path* or None if it doesn't exist.
+        """
+        raise NotImplementedError()
+
+    def put(self, path: str, data: bytes, mimeType: Optional[str] = None, overwrite: bool = True) -> None:
+        """
+            Writes *data* into the blob *path*, replacing it if it exists.
+
+            :param overwrite: If False, FileExistsError is raised instead of replacing an existing blob.
+        """
+        raise NotImplementedError()
+
+    def stat(self, path: str) -> Optional[BlobInfo]:
+        """
+            Returns the metadata of the blob *path* or None if it doesn't exist.
+        """
+        raise NotImplementedError()
+
+    def list(self, prefix: str) -> List[BlobInfo]:
+        """
+            Returns the metadata of all blobs whose path starts with *prefix*.
+        """
+        raise NotImplementedError()
+
+    def copy(self, srcPath: str, dstPath: str) -> bool:
+        """
+            Copies the blob *srcPath* to *dstPath*, which must not exist yet.
+
+            :return: False if *srcPath* doesn't exist.
+        """
+        raise NotImplementedError()
+
+    def delete(self, paths: Iterable[str]) -> None:
+        """
+            Deletes the blobs *paths*, ignoring those that don't exist.
+        """
+        raise NotImplementedError()
+
+    def signedUrl(self, path: str, expires: timedelta, contentDisposition: Optional[str] = None) -> Optional[str]:
+        """
+            Returns a URL the blob *path* can be downloaded from without further authentication for *expires*,
+            or None if this storage can't provide one; the blob has to be served by :meth:`serve` then.
+        """
+        return None
+
+    def uploadUrl(self, path: str, mimeType: str, size: Optional[int] = None) -> str:
+        """
+            Returns a URL the client can upload the contents of the blob *path* to.
+        """
+        raise NotImplementedError()
+
+    def iterRange(self, info: BlobInfo, start: int, stop: int) -> Iterator[bytes]:
+        """
+            Yields the bytes *start* to *stop* (exclusive) of the blob described by *info* in chunks.
+        """
+        if (data := self.get(info.name)) is None:
+            raise FileNotFoundError(info.name)
+        for offset in range(start, stop, self.chunkSize):
+            yield data[offset:min(offset + self.chunkSize, stop)]
+
+    def iterFile(self, info: BlobInfo, request: webob.Request) -> Iterable[bytes]:
+        """
+            Returns the body of a response delivering the whole blob described by *info*.
+        """
+        return self.iterRange(info, 0, info.size)
+
+    def serve(self, path: str, request: webob.Request, response: webob.Response,
+              info: Optional[BlobInfo] = None) -> Union[bytes, Iterable[bytes]]:
+        """
+            Sets up *response* to deliver the blob *path* (described by *info*, if it's already known) and returns
+            its body. Unless it's empty, the body is set as app_iter of *response*.
+
+            The blob is streamed in chunks of chunkSize. Requests are answered with 304 if the ETag of the blob
+            matches If-None-Match, and with 206 for a single byte range (if If-Range is absent or matches).
+
+            :raises FileNotFoundError: If the blob doesn't exist.
+        """
+        if info is None and (info := self.stat(path)) is None:
+            raise FileNotFoundError(path)
+        response.etag = info.etag
+        response.accept_ranges = "bytes"
+        if info.etag in request.if_none_match:
+            response.status = 304
+            return b""
+        if request.range is not None and response in request.if_range:
+            if not (byteRange := request.range.range_for_length(info.size)):
+                response.status = 416
+                response.headers["Content-Range"] = "bytes */%s" % info.size
+                return b""
+            start, stop = byteRange
+            response.status = 206
+            response.content_range = (start, stop, info.size)
+            response.app_iter = self.iterRange(info, start, stop)
+            response.content_length = stop - start
+            return response.app_iter
+        if not info.size:
+            return b""
+        response.app_iter = self.iterFile(info, request)
+        response.content_length = info.size  # Assigning the app_iter has reset it
+        return response.app_iter
+
+
+class GCSBlobStorage(BlobStorage):
+    """
+        Stores the blobs in a Google Cloud Storage bucket.
+
+        URLs are signed with *credentials* if they belong to a service account, otherwise (inside the App Engine) by
+        the IAM credentials of the compute engine.
+    """
+
+    def __init__(self, bucket: "google.cloud.storage.Bucket",
+                 credentials: Optional["google.auth.credentials.Credentials"] = None):
+        self.bucket = bucket
+        self.credentials = credentials
+
+    @staticmethod
+    def _blobInfo(blob: "google.cloud.storage.Blob") -> BlobInfo:
+        return BlobInfo(blob.name, blob.size, blob.content_type, str(blob.generation))
+
+    def get(self, path: str) -> Optional[bytes]:
+        if not (blob := self.bucket.get_blob(path)):
+            return None
+        return blob.download_as_bytes()
+
+    def put(self, path: str, data: bytes, mimeType: Optional[str] = None, overwrite: bool = True) -> None:
+        from google.api_core.exceptions import PreconditionFailed
+        try:
+            self.bucket.blob(path).upload_from_string(
+                data, content_type=mimeType, if_generation_match=None if overwrite else 0)
+        except PreconditionFailed:
+            raise FileExistsError(path)
+
+    def stat(self, path: str) -> Optional[BlobInfo]:
+        if not (blob := self.bucket.get_blob(path)):
+            return None
+        return self._blobInfo(blob)
+
+    def list(self, prefix: str) -> List[BlobInfo]:
+        return [self._blobInfo(blob) for blob in self.bucket.list_blobs(prefix=prefix)]
+
+    def copy(self, srcPath: str, dstPath: str) -> bool:
+        # https://cloud.google.com/storage/docs/copying-renaming-moving-objects
+        if not (srcBlob := self.bucket.get_blob(srcPath)):
+            return False
+        self.bucket.copy_blob(srcBlob, self.bucket, dstPath, if_generation_match=0)
+        return True
+
+    def delete(self, paths: Iterable[str]) -> None:
+        from google.api_core.exceptions import NotFound
+        paths = list(paths)
+        # Cloud Storage accepts up to 100 calls in one batch request
+        for idx in range(0, len(paths), 100):
+            try:
+                with self.bucket.client.batch():
+                    for path in paths[idx:idx + 100]:
+                        self.bucket.delete_blob(path)
+            except NotFound:  # All calls of the batch have been processed, some blobs just didn't exist anymore
+                pass
+
+    def signedUrl(self, path: str, expires: timedelta, contentDisposition: Optional[str] = None) -> Optional[str]:
+        from google.auth import compute_engine
+        from google.auth.transport import requests
+        from google.oauth2.service_account import Credentials as ServiceAccountCredentials
+        if isinstance(self.credentials, ServiceAccountCredentials):  # We run locally with an service-account.json
+            signingCredentials = None
+        else:
+            signingCredentials = compute_engine.IDTokenCredentials(requests.Request(), "")
+        return self.bucket.blob(path).generate_signed_url(
+            datetime.now() + expires,
+            credentials=signingCredentials,
+            response_disposition=contentDisposition,
+            version="v4")
+
+    def uploadUrl(self, path: str, mimeType: str, size: Optional[int] = None) -> str:
+        return self.bucket.blob(path).create_resumable_upload_session(content_type=mimeType, size=size, timeout=60)
+
+    def iterRange(self, info: BlobInfo, start: int, stop: int) -> Iterator[bytes]:
+        # Pin the generation, so all chunks are read from the same version of the blob
+        blob = self.bucket.blob(info.name, generation=int(info.etag))
+        return (
+            blob.download_as_bytes(start=offset, end=min(offset + self.chunkSize, stop) - 1)
+            for offset in range(start, stop, self.chunkSize)
+        )
+
+
+class LocalBlobStorage(BlobStorage):
+    """
+        Stores the blobs as files below the directory *root*.
+
+        The mimetype of a blob is guessed from its name. Uploads are POSTed to file/upload, downloads are served
+        by file/download, using sendfile (if the WSGI server supports it) or mmap for ranges.
+    """
+    chunkSize = 256 * 1024
+
+    def __init__(self, root: Union[str, Path]):
+        self.root = Path(root).resolve()
+
+    def _filePath(self, path: str) -> Path:
+        res = (self.root / path.lstrip("/")).resolve()
+        if self.root not in res.parents:
+            raise ValueError(f"Invalid blob path {path!r}")
+        return res
+
+    def _blobInfo(self, filePath: Path, stat: os.stat_result) -> BlobInfo:
+        return BlobInfo(
+            filePath.relative_to(self.root).as_posix(),
+            stat.st_size,
+            mimetypes.guess_type(filePath.name)[0] or "application/octet-stream",
+            "%x-%x" % (stat.st_mtime_ns, stat.st_size)
+        )
+
+    def get(self, path: str) -> Optional[bytes]:
+        try:
+            return self._filePath(path).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def put(self, path: str, data: bytes, mimeType: Optional[str] = None, overwrite: bool = True) -> None:
+        filePath = self._filePath(path)
+        filePath.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first, so readers never see a partially written blob
+        tmpPath = filePath.with_name(f".{filePath.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmpPath.write_bytes(data)
+        if overwrite:
+            os.replace(tmpPath, filePath)
+            return
+        try:
+            os.link(tmpPath, filePath)  # Fails if the blob exists, even if it has just been created by another writer
+        finally:
+            tmpPath.unlink()
+
+    def stat(self, path: str) -> Optional[BlobInfo]:
+        filePath = self._filePath(path)
+        try:
+            return self._blobInfo(filePath, filePath.stat())
+        except FileNotFoundError:
+            return None
+
+    def list(self, prefix: str) -> List[BlobInfo]:
+        # The prefix may end within a directory- or filename, so we start listing at the directory containing it
+        directory, _, _ = prefix.lstrip("/").rpartition("/")
+        res = []
+        for dirPath, _, fileNames in os.walk(self._filePath(directory) if directory else self.root):
+            for fileName in fileNames:
+                filePath = Path(dirPath) / fileName
+                if fileName.startswith(".") and fileName.endswith(".tmp"):  # Incomplete write
+                    continue
+                if filePath.relative_to(self.root).as_posix().startswith(prefix.lstrip("/")):
+                    try:
+                        res.append(self._blobInfo(filePath, filePath.stat()))
+                    except FileNotFoundError:  # Deleted in the meantime
+                        pass
+        return sorted(res, key=lambda x: x.name)
+
+    def copy(self, srcPath: str, dstPath: str) -> bool:
+        if (data := self.get(srcPath)) is None:
+            return False
+        self.put(dstPath, data, overwrite=False)
+        return True
+
+    def delete(self, paths: Iterable[str]) -> None:
+        for path in paths:
+            filePath = self._filePath(path)
+            filePath.unlink(missing_ok=True)
+            # Remove directories left empty, like the folder of a download-key
+            for directory in filePath.parents:
+                if directory == self.root:
+                    break
+                try:
+                    directory.rmdir()
+                except OSError:  # Not empty (or already gone)
+                    break
+
+    def uploadUrl(self, path: str, mimeType: str, size: Optional[int] = None) -> str:
+        validUntil = (datetime.now() + timedelta(hours=1)).strftime("%Y%m%d%H%M")
+        # The prefix keeps signed download-urls (using the same hmac-key) from being accepted as upload tokens
+        sigStr = urlsafe_b64encode(("upload\0%s\0%s\0%s" % (path, validUntil, size or "")).encode("UTF-8"))
+        return "/file/upload/%s?sig=%s" % (sigStr.decode("ASCII"), utils.hmacSign(sigStr))
+
+    @staticmethod
+    def verifyUploadToken(blobKey: str, sig: str) -> Optional[Tuple[str, Optional[int], bool]]:
+        """
+            Checks an upload token created by :meth:`uploadUrl`.
+
+            :return: The path and size of the blob, and if the token has expired; None if it's invalid.
+        """
+        if not utils.hmacVerify(blobKey.encode("ASCII"), sig):
+            return None
+        try:
+            prefix, path, validUntil, size = urlsafe_b64decode(blobKey).decode("UTF-8").split("\0")
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            return None
+        if prefix != "upload":
+            return None
+        expired = datetime.strptime(validUntil, "%Y%m%d%H%M") < datetime.now()
+        return path, int(size) if size else None, expired
+
+    def _iterMapped(self, fh, start: int, stop: int) -> Iterator[bytes]:
+        with fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for offset in range(start, stop, self.chunkSize):
+                yield mm[offset:min(offset + self.chunkSize, stop)]
+
+    def iterRange(self, info: BlobInfo, start: int, stop: int) -> Iterator[bytes]:
+        # Open the file right away, so a missing blob is reported before the response is started
+        return self._iterMapped(open(self._filePath(info.name), "rb"), start, stop)
+
+    def iterFile(self, info: BlobInfo, request: webob.Request) -> Iterable[bytes]:
+        if fileWrapper := request.environ.get("wsgi.file_wrapper"):
+            # Let the WSGI server send the file itself (using sendfile, if it's supported)
+            return fileWrapper(open(self._filePath(info.name), "rb"), self.chunkSize)
+        return self.iterRange(info, 0, info.size)
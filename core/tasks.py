@@ -659,6 +659,7 @@ class QueryIter(object, metaclass=MetaQueryIter):
         call startIterOnQuery with an instance of a database Query (and possible some custom data to pass along)
     """
     queueName = "default"  # Name of the taskqueue we will run on
+    batchSize = 5  # Number of entries processed in one task
 
     @classmethod
     def startIterOnQuery(cls, query: db.Query, customData: Any = None) -> None:
@@ -716,7 +717,7 @@ class QueryIter(object, metaclass=MetaQueryIter):
     @classmethod
     def _qryStep(cls, qryDict: Dict[str, Any]) -> None:
         """
-            Internal use only. Processes one block of five entries from the query defined in qryDict and
+            Internal use only. Processes one block of batchSize entries from the query defined in qryDict and
             reschedules the next block.
         """
         from viur.core.skeleton import skeletonByKind
@@ -728,9 +729,9 @@ class QueryIter(object, metaclass=MetaQueryIter):
         qry.origKind = qryDict["origKind"]
         qry.queries.distinct = qryDict["distinct"]
         if qry.srcSkel:
-            qryIter = qry.fetch(5)
+            qryIter = qry.fetch(cls.batchSize)
         else:
-            qryIter = qry.run(5)
+            qryIter = qry.run(cls.batchSize)
         for item in qryIter:
             try:
                 cls.handleEntry(item, qryDict["customData"])
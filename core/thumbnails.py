@@ -0,0 +1,80 @@
+"""
+    Rendering of the thumbnails derived from images by :func:`viur.core.modules.file.thumbnailer`.
+
+    This module only depends on PIL, so it can be imported by the processes of the thumbnailer's pool cheaply.
+"""
+import logging
+from io import BytesIO
+from typing import Dict, List, Tuple
+
+from PIL import Image, ImageCms
+
+__all__ = ["renderThumbnails"]
+
+
+def renderThumbnails(fileData: bytes, params: List[Dict]) -> Tuple[List[Tuple], List[bytes]]:
+    """
+    Decodes the image *fileData* and renders the thumbnails described by *params*.
+
+    Runs in the process pool of the thumbnailer (if any), so only the compressed source and the encoded thumbnails
+    are passed between the processes. This module must therefore not import anything having side effects, like
+    creating clients of Google Cloud APIs, as each worker process imports it.
+
+    :returns: The targets (tuples of width, height, targetName, fileExtension, mimeType and if it keeps the
+        aspect ratio) and the encoded thumbnail for each of them.
+    """
+    try:
+        img = Image.open(BytesIO(fileData))
+    except Image.UnidentifiedImageError:  # We can't load this image; so there's no need to try other resolutions
+        return [], []
+    targets = []
+    for sizeDict in params:
+        fileExtension = sizeDict.get("fileExtension", "webp")
+        if "width" in sizeDict and "height" in sizeDict:
+            width = sizeDict["width"]
+            height = sizeDict["height"]
+            targetName = "thumbnail-%s-%s.%s" % (width, height, fileExtension)
+        elif "width" in sizeDict:
+            width = sizeDict["width"]
+            height = int((float(img.size[1]) * float(width / float(img.size[0]))))
+            targetName = "thumbnail-w%s.%s" % (width, fileExtension)
+        else:  # No default fallback - ignore
+            continue
+        mimeType = sizeDict.get("mimeType", "image/webp")
+        targets.append((width, height, targetName, fileExtension, mimeType, "height" not in sizeDict))
+    if not targets:
+        return [], []
+    if img.format == "JPEG":
+        # Let the decoder scale down by a power of two, as long as the image stays larger than all targets
+        img.draft(None, (max(x[0] for x in targets), max(x[1] for x in targets)))
+    iccProfile = img.info.get('icc_profile')
+    if iccProfile:
+        # JPEGs might be encoded with a non-standard color-profile; we need to compensate for this if we convert
+        # to WEBp as we'll loose this color-profile information
+        f = BytesIO(iccProfile)
+        src_profile = ImageCms.ImageCmsProfile(f)
+        dst_profile = ImageCms.createProfile('sRGB')
+        try:
+            img = ImageCms.profileToProfile(img,
+                                            inputProfile=src_profile,
+                                            outputProfile=dst_profile,
+                                            outputMode="RGB")
+        except Exception as e:
+            logging.exception(e)
+            return [], []
+    # Scale down successively, starting with the largest target: Each one is resized from the smallest image
+    # already scaled down (with the same aspect ratio) that's still large enough
+    images = [None] * len(targets)
+    scaled = []
+    for idx in sorted(range(len(targets)), key=lambda i: -targets[i][0] * targets[i][1]):
+        width, height, keepsAspectRatio = targets[idx][0], targets[idx][1], targets[idx][5]
+        source = next((x for x in reversed(scaled) if x.width >= width and x.height >= height), img)
+        images[idx] = source.resize((width, height), Image.LANCZOS, reducing_gap=3.0)
+        if keepsAspectRatio:
+            scaled.append(images[idx])
+    encoded = []
+    for image, target in zip(images, targets):
+        outData = BytesIO()
+        image.save(outData, target[3])
+        encoded.append(outData.getvalue())
+    return targets, encoded
@@ -5,7 +5,7 @@ import secrets
 import string
 from base64 import urlsafe_b64encode
 from datetime import datetime, timedelta, timezone
-from typing import Any, Union, Optional
+from typing import Any, Iterable, Union, Optional
 from urllib.parse import quote
 
 from viur.core import current, db
@@ -57,15 +57,43 @@ def markFileForDeletion(dlkey: str) -> None:
 
     :param dlkey: Unique download-key of the file that shall be marked for deletion.
     """
-    fileObj = db.Query("viur-deleted-files").filter("dlkey", dlkey).getEntry()
+    markFilesForDeletion([dlkey])
 
-    if fileObj:  # Its allready marked
+
+def markFilesForDeletion(dlkeys: Iterable[str]) -> None:
+    """
+    Marks all files specified by *dlkeys* for deletion, see :func:`markFileForDeletion`.
+
+    The marks are keyed by the download-key, so existing ones are looked up and new ones written in one batch.
+    Marks written by previous versions have a random id and are found by a query on their download-key.
+
+    :param dlkeys: Unique download-keys of the files that shall be marked for deletion.
+    """
+    dlkeys = list(dict.fromkeys(str(x) for x in dlkeys))
+    if not dlkeys:
         return
 
-    fileObj = db.Entity(db.Key("viur-deleted-files"))
-    fileObj["itercount"] = 0
-    fileObj["dlkey"] = str(dlkey)
-    db.Put(fileObj)
+    missing = [
+        dlkey for dlkey, fileObj in zip(dlkeys, db.Get([db.Key("viur-deleted-files", x) for x in dlkeys]))
+        if not fileObj  # Otherwise, its allready marked
+    ]
+    legacyMarked = set()
+    for idx in range(0, len(missing), 30):
+        for fileObj in db.Query("viur-deleted-files").filter("dlkey IN", missing[idx:idx + 30]).run(99):
+            legacyMarked.add(fileObj["dlkey"])
+
+    putList = []
+    for dlkey in missing:
+        if dlkey in legacyMarked:
+            continue
+
+        fileObj = db.Entity(db.Key("viur-deleted-files", dlkey))
+        fileObj["itercount"] = 0
+        fileObj["dlkey"] = dlkey
+        putList.append(fileObj)
+
+    if putList:
+        db.Put(putList)
 
 
 def escapeString(val: str, maxLength: int = 254) -> str:
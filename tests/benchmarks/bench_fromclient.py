@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+    Benchmarks `Skeleton.fromClient()` on a form with 2000 parameters, most of them belonging to several multiple
+    `RecordBone`s with a nested `RecordBone`.
+
+    Compares the parameters indexed by bone name (`ClientData`) against scanning all parameters for each bone,
+    as `BaseBone.collectRawClientData` did before; both must read the same values.
+
+    Run with: python tests/benchmarks/bench_fromclient.py
+"""
+import pathlib
+import sys
+import timeit
+from unittest import mock
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from main import monkey_patch  # noqa: E402
+
+monkey_patch()
+
+from viur.core import conf  # noqa: E402
+
+ROUNDS = 5
+FLAT_BONES = 80
+RECORD_BONES = 20
+ADDRESSES = 16  # Per RecordBone
+
+# Allow skeletons from the core and from this file, regardless of where the repository has been checked out
+for path in (pathlib.Path(__file__).resolve().parents[2] / "core", pathlib.Path(__file__).resolve().parent):
+    conf["viur.skeleton.searchPath"].append(str(path).replace(str(conf["viur.instance.project_base_path"]), ""))
+
+from viur.core.bones import RecordBone, StringBone  # noqa: E402
+from viur.core.bones.base import ClientData  # noqa: E402
+from viur.core.skeleton import RelSkel, Skeleton  # noqa: E402
+
+
+class GeoSkel(RelSkel):
+    lat = StringBone(descr="Latitude")
+    lng = StringBone(descr="Longitude")
+
+
+class AddressSkel(RelSkel):
+    street = StringBone(descr="Street")
+    zipcode = StringBone(descr="Zipcode")
+    city = StringBone(descr="City")
+    country = StringBone(descr="Country")
+    note = StringBone(descr="Note")
+    geo = RecordBone(descr="Geo", using=GeoSkel, format="$(lat)")
+
+
+CustomerSkel = type("CustomerSkel", (Skeleton,), {
+    "kindName": "customer",
+    "__module__": __name__,
+    **{f"field{idx}": StringBone(descr=f"Field {idx}") for idx in range(FLAT_BONES)},
+    **{
+        f"addresses{idx}": RecordBone(descr=f"Addresses {idx}", using=AddressSkel, format="$(city)", multiple=True)
+        for idx in range(RECORD_BONES)
+    },
+})
+
+
+def formData() -> dict:
+    data = {f"field{idx}": f"value {idx}" for idx in range(FLAT_BONES)}
+    for bone in range(RECORD_BONES):
+        for idx in range(ADDRESSES):
+            for field in ("street", "zipcode", "city", "country", "note"):
+                data[f"addresses{bone}.{idx}.{field}"] = f"{field} {idx}"
+            data[f"addresses{bone}.{idx}.geo.lat"] = str(idx)
+    return data
+
+
+def readValues(data: dict, indexed: bool) -> dict:
+    skel = CustomerSkel()
+    if indexed:
+        skel.fromClient(data)
+    else:
+        with mock.patch.object(ClientData, "fieldsOf", lambda self, name: self):
+            skel.fromClient(data)
+    return {key: skel[key] for key in skel.keys()}
+
+
+def main():
+    data = formData()
+    print(f"{len(data)} parameters")
+    indexed = readValues(data, True)
+    assert indexed[f"addresses{RECORD_BONES - 1}"][-1]["geo"]["lat"] == str(ADDRESSES - 1)
+    assert str(indexed) == str(readValues(data, False))
+    for label, flag in (("scan all parameters", False), ("indexed by bone", True)):
+        duration = timeit.timeit(lambda: readValues(data, flag), number=ROUNDS) / ROUNDS
+        print(f"{label:>20}: {duration * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
+
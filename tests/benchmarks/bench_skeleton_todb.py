@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+    Benchmarks `Skeleton.toDB()` on a wide skeleton where only a single bone gets modified per save.
+
+    Untouched bones are neither re-serialized nor compared nor scanned for referenced blobs anymore; the
+    "all bones dirty" run re-assigns every bone before saving, which is what every save used to cost.
+
+    Run with: python tests/benchmarks/bench_skeleton_todb.py
+"""
+import pathlib
+import sys
+import timeit
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from main import monkey_patch  # noqa: E402
+
+monkey_patch()
+
+from viur.core import conf  # noqa: E402
+from viur.core.bones import BaseBone, StringBone, TextBone  # noqa: E402
+from benchmarks.memdb import MemoryDatastore  # noqa: E402
+
+STRING_BONES = 60
+TEXT_BONES = 10
+ROUNDS = 200
+
+# Allow skeletons from the core and from this file, regardless of where the repository has been checked out
+for path in (pathlib.Path(__file__).resolve().parents[2] / "core", pathlib.Path(__file__).resolve().parent):
+    conf["viur.skeleton.searchPath"].append(str(path).replace(str(conf["viur.instance.project_base_path"]), ""))
+
+from viur.core.skeleton import Skeleton  # noqa: E402
+
+
+class BenchSkel(Skeleton):
+    kindName = "bench"
+
+
+for i in range(STRING_BONES):
+    setattr(BenchSkel, f"string{i}", StringBone(descr=f"String {i}"))
+for i in range(TEXT_BONES):
+    setattr(BenchSkel, f"text{i}", TextBone(descr=f"Text {i}"))
+BenchSkel.__boneMap__ = BenchSkel.generate_bonemap(BenchSkel)
+
+html = "<p>" + " ".join(f"Lorem ipsum <b>dolor</b> sit amet {i}," for i in range(200)) + "</p>"
+
+
+class CountingSerializer:
+    def __init__(self):
+        self.calls = 0
+        self._orig = BaseBone.serialize
+
+    def __enter__(self):
+        counter = self
+
+        def serialize(bone, *args, **kwargs):
+            counter.calls += 1
+            return counter._orig(bone, *args, **kwargs)
+
+        BaseBone.serialize = serialize
+        return self
+
+    def __exit__(self, *args):
+        BaseBone.serialize = self._orig
+
+
+def main():
+    store = MemoryDatastore()
+    with store.patch():
+        skel = BenchSkel()
+        for i in range(STRING_BONES):
+            skel[f"string{i}"] = f"value {i}"
+        for i in range(TEXT_BONES):
+            skel[f"text{i}"] = html
+        key = skel.toDB(update_relations=False)
+
+        def save(touch_all):
+            skel = BenchSkel()
+            skel.fromDB(key)
+            if touch_all:
+                for name in skel.keys():
+                    if name != "key":
+                        skel[name] = skel[name]
+            skel["string0"] = "changed"
+            skel.toDB(update_relations=False)
+
+        for touch_all, label in ((True, "all bones dirty"), (False, "one bone dirty")):
+            with CountingSerializer() as counter:
+                duration = timeit.timeit(lambda: save(touch_all), number=ROUNDS)
+            print(f"{label:>16}: {duration / ROUNDS * 1000:.3f} ms/save, "
+                  f"{counter.calls / ROUNDS:.0f} bones serialized per save")
+
+
+if __name__ == "__main__":
+    main()
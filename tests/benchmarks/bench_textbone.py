@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+    Benchmarks the `HtmlSerializer` of the `TextBone` on rich-text documents of growing size.
+
+    Compares the buffered serializer using the compiled whitelist of the bone against the previous implementation,
+    which concatenated its result string by string and matched the whitelist by scanning lists; both must produce
+    the same output.
+
+    Run with: python tests/benchmarks/bench_textbone.py
+"""
+import pathlib
+import string
+import sys
+import timeit
+from html import entities as htmlentitydefs
+from html.parser import HTMLParser
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from main import monkey_patch  # noqa: E402
+
+monkey_patch()
+
+from viur.core import db, utils  # noqa: E402
+from viur.core.bones.text import HtmlSerializer, HtmlWhitelist, _defaultTags, parseDownloadUrl  # noqa: E402
+
+SIZES = (10_000, 50_000, 200_000)
+ROUNDS = 3
+
+PARAGRAPH = (
+    '<p class="vitxt-lead other" style="color: red; font-size: 12px">Some <b>bold</b> and <i>italic</i> text, '
+    'a <a href="https://example.com/page?a=1&amp;b=2" target="_blank" onclick="alert(1)">link</a> &amp; an '
+    '<abbr title="abbreviation">abbr.</abbr> with &#8364; &lt;escaped&gt; "quotes" and \'apostrophes\'.</p>'
+    '<div><span class="viur-txt-small">nested <u>spans</u></span><script>alert("x")</script><p></p></div>'
+    '<ul><li>first<li>second</ul><table><tr><td colspan="2" rowspan="x">cell</td></tr></table>'
+    '<img src="https://example.com/image.png" alt="An image"><br><h2 unknown="1">Heading</h2>\n'
+)
+
+
+class LegacyHtmlSerializer(HTMLParser):
+    """
+        The implementation replaced by the buffered serializer with a compiled whitelist.
+    """
+
+    def __init__(self, validHtml=None, srcSet=None):
+        super(LegacyHtmlSerializer, self).__init__()
+        self.result = ""  # The final result that will be returned
+        self.openTagsList = []  # List of tags that still need to be closed
+        self.tagCache = []  # Tuple of tags that have been processed but not written yet
+        self.validHtml = validHtml
+        self.srcSet = srcSet
+
+    def handle_data(self, data):
+        data = str(data) \
+            .replace("<", "&lt;") \
+            .replace(">", "&gt;") \
+            .replace("\"", "&quot;") \
+            .replace("'", "&#39;") \
+            .replace("\0", "")
+        if data.strip():
+            self.flushCache()
+            self.result += data
+
+    def handle_charref(self, name):
+        self.flushCache()
+        self.result += "&#%s;" % (name)
+
+    def handle_entityref(self, name):  # FIXME
+        if name in htmlentitydefs.entitydefs.keys():
+            self.flushCache()
+            self.result += "&%s;" % (name)
+
+    def flushCache(self):
+        """
+            Flush pending tags into the result and push their corresponding end-tags onto the stack
+        """
+        for start, end in self.tagCache:
+            self.result += start
+            self.openTagsList.insert(0, end)
+        self.tagCache = []
+
+    def handle_starttag(self, tag, attrs):
+        """ Delete all tags except for legal ones """
+        filterChars = "\"'\\\0\r\n@()"
+        if self.validHtml and tag in self.validHtml["validTags"]:
+            cacheTagStart = '<' + tag
+            isBlankTarget = False
+            styles = None
+            classes = None
+            for k, v in attrs:
+                k = k.strip()
+                v = v.strip()
+                if any([c in k for c in filterChars]) or any([c in v for c in filterChars]):
+                    if k in {"title", "href", "alt"} and not any([c in v for c in "\"'\\\0\r\n"]):
+                        # If we have a title or href attribute, ignore @ and ()
+                        pass
+                    else:
+                        # Either the key or the value contains a character that's not supposed to be there
+                        continue
+                elif k == "class":
+                    # Classes are handled below
+                    classes = v.split(" ")
+                    continue
+                elif k == "style":
+                    # Styles are handled below
+                    styles = v.split(";")
+                    continue
+                elif k == "src":
+                    # We ensure that any src tag starts with an actual url
+                    checker = v.lower()
+                    if not (checker.startswith("http://") or checker.startswith("https://") or checker.startswith("/")):
+                        continue
+                    blobKey, derived, fileName = parseDownloadUrl(v)
+                    if blobKey:
+                        v = utils.downloadUrlFor(blobKey, fileName, derived, expires=None)
+                        if self.srcSet:
+                            # Build the src set with files already available. If a derived file is not yet build,
+                            # getReferencedBlobs will catch it, build it, and we're going to be re-called afterwards.
+                            fileObj = db.Query("file").filter("dlkey =", blobKey) \
+                                .order(("creationdate", db.SortOrder.Ascending)).getEntry()
+                            srcSet = utils.srcSetFor(fileObj, None, self.srcSet.get("width"), self.srcSet.get("height"))
+                            cacheTagStart += ' srcSet="%s"' % srcSet
+                if not tag in self.validHtml["validAttrs"].keys() or not k in self.validHtml["validAttrs"][tag]:
+                    # That attribute is not valid on this tag
+                    continue
+                if k.lower()[0:2] != 'on' and v.lower()[0:10] != 'javascript':
+                    cacheTagStart += ' %s="%s"' % (k, v)
+                if tag == "a" and k == "target" and v.lower() == "_blank":
+                    isBlankTarget = True
+            if styles:
+                syleRes = {}
+                for s in styles:
+                    style = s[: s.find(":")].strip()
+                    value = s[s.find(":") + 1:].strip()
+                    if any([c in style for c in filterChars]) or any(
+                        [c in value for c in filterChars]):
+                        # Either the key or the value contains a character that's not supposed to be there
+                        continue
+                    if value.lower().startswith("expression") or value.lower().startswith("import"):
+                        # IE evaluates JS inside styles if the keyword expression is present
+                        continue
+                    if style in self.validHtml["validStyles"] and not any(
+                        [(x in value) for x in ["\"", ":", ";"]]):
+                        syleRes[style] = value
+                if len(syleRes.keys()):
+                    cacheTagStart += " style=\"%s\"" % "; ".join(
+                        [("%s: %s" % (k, v)) for (k, v) in syleRes.items()])
+            if classes:
+                validClasses = []
+                for currentClass in classes:
+                    validClassChars = string.ascii_lowercase + string.ascii_uppercase + string.digits + "-"
+                    if not all([x in validClassChars for x in currentClass]):
+                        # The class contains invalid characters
+                        continue
+                    isOkay = False
+                    for validClass in self.validHtml["validClasses"]:
+                        # Check if the classname matches or is white-listed by a prefix
+                        if validClass == currentClass:
+                            isOkay = True
+                            break
+                        if validClass.endswith("*"):
+                            validClass = validClass[:-1]
+                            if currentClass.startswith(validClass):
+                                isOkay = True
+                                break
+                    if isOkay:
+                        validClasses.append(currentClass)
+                if validClasses:
+                    cacheTagStart += " class=\"%s\"" % " ".join(validClasses)
+            if isBlankTarget:
+                # Add rel tag to prevent the browser to pass window.opener around
+                cacheTagStart += " rel=\"noopener noreferrer\""
+            if tag in self.validHtml["singleTags"]:
+                # Single-Tags do have a visual representation; ensure it makes it into the result
+                self.flushCache()
+                self.result += cacheTagStart + '>'  # dont need slash in void elements in html5
+            else:
+                # We opened a 'normal' tag; push it on the cache so it can be discarded later if
+                # we detect it has no content
+                cacheTagStart += '>'
+                self.tagCache.append((cacheTagStart, tag))
+        else:
+            self.result += " "
+
+    def handle_endtag(self, tag):
+        if self.validHtml:
+            if self.tagCache:
+                # Check if that element is still on the cache
+                # and just silently drop the cache up to that point
+                if tag in [x[1] for x in self.tagCache] + self.openTagsList:
+                    for tagCache in self.tagCache[::-1]:
+                        self.tagCache.remove(tagCache)
+                        if tagCache[1] == tag:
+                            return
+            if tag in self.openTagsList:
+                # Close all currently open Tags until we reach the current one. If no one is found,
+                # we just close everything and ignore the tag that should have been closed
+                for endTag in self.openTagsList[:]:
+                    self.result += "</%s>" % endTag
+                    self.openTagsList.remove(endTag)
+                    if endTag == tag:
+                        break
+
+    def cleanup(self):  # FIXME: vertauschte tags
+        """ Append missing closing tags """
+        self.flushCache()
+        for tag in self.openTagsList:
+            endTag = '</%s>' % tag
+            self.result += endTag
+
+    def sanitize(self, instr):
+        self.result = ""
+        self.openTagsList = []
+        self.feed(instr)
+        self.close()
+        self.cleanup()
+        return self.result
+
+
+def document(size: int) -> str:
+    return PARAGRAPH * (size // len(PARAGRAPH) + 1)
+
+
+def main():
+    whitelist = HtmlWhitelist(_defaultTags)
+    for size in SIZES:
+        html = document(size)
+        assert HtmlSerializer(whitelist).sanitize(html) == LegacyHtmlSerializer(_defaultTags).sanitize(html)
+        legacy = timeit.timeit(lambda: LegacyHtmlSerializer(_defaultTags).sanitize(html), number=ROUNDS) / ROUNDS
+        current = timeit.timeit(lambda: HtmlSerializer(whitelist).sanitize(html), number=ROUNDS) / ROUNDS
+        print(f"{len(html) // 1000:>4} KB: legacy {legacy * 1000:8.1f} ms ({len(html) / legacy / 2 ** 20:5.2f} MiB/s), "
+              f"compiled {current * 1000:8.1f} ms ({len(html) / current / 2 ** 20:5.2f} MiB/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+    Benchmarks the thumbnailer of the File module on a large JPEG carrying an ICC profile.
+
+    Compares the previous implementation, which re-opened, converted and scaled down the source for each size and
+    encoded and uploaded the derivatives one after another, to the current pipeline. Blobs are stored in a
+    temporary directory by a `LocalBlobStorage`, so no access to Cloud Storage is needed.
+
+    Run with: python tests/benchmarks/bench_thumbnailer.py
+"""
+import pathlib
+import sys
+import tempfile
+import time
+from io import BytesIO
+from unittest import mock
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from main import monkey_patch  # noqa: E402
+
+monkey_patch()
+
+for mod_name in ("google.auth.transport", "google.oauth2", "google.oauth2.service_account"):
+    sys.modules[mod_name] = mock.Mock()
+
+from viur.core import conf  # noqa: E402
+
+# Allow skeletons from the core, regardless of where the repository has been checked out
+conf["viur.skeleton.searchPath"].append(
+    str(pathlib.Path(__file__).resolve().parents[2] / "core").replace(str(conf["viur.instance.project_base_path"]), ""))
+
+from PIL import Image, ImageCms  # noqa: E402
+from viur.core.skeleton import Skeleton  # noqa: E402
+
+# Outside a "viur/core" checkout, the base skeleton gets a kindName; it would collide with the tree skeletons
+Skeleton.kindName = None
+
+from viur.core.modules import file  # noqa: E402
+from viur.core.storage import LocalBlobStorage  # noqa: E402
+
+ROUNDS = 3
+SOURCE_SIZE = (6000, 4000)
+PARAMS = [{"width": width} for width in (1920, 1280, 800, 400, 200)] + [{"width": 300, "height": 300}]
+
+
+def legacyThumbnailer(fileSkel, existingFiles, params):
+    blobStorage = file.getBlobStorage()
+    fileData = blobStorage.get("%s/source/%s" % (fileSkel["dlkey"], fileSkel["name"]))
+    resList = []
+    for sizeDict in params:
+        fileExtension = sizeDict.get("fileExtension", "webp")
+        if "width" in sizeDict and "height" in sizeDict:
+            width = sizeDict["width"]
+            height = sizeDict["height"]
+            targetName = "thumbnail-%s-%s.%s" % (width, height, fileExtension)
+        else:
+            width = sizeDict["width"]
+            targetName = "thumbnail-w%s.%s" % (width, fileExtension)
+        img = Image.open(BytesIO(fileData))
+        iccProfile = img.info.get("icc_profile")
+        if iccProfile:
+            img = ImageCms.profileToProfile(img, inputProfile=ImageCms.ImageCmsProfile(BytesIO(iccProfile)),
+                                            outputProfile=ImageCms.createProfile("sRGB"), outputMode="RGB")
+        if "height" not in sizeDict:
+            height = int((float(img.size[1]) * float(width / float(img.size[0]))))
+        img = img.resize((width, height), Image.LANCZOS)
+        outData = BytesIO()
+        img.save(outData, fileExtension)
+        outSize = outData.tell()
+        blobStorage.put("%s/derived/%s" % (fileSkel["dlkey"], targetName), outData.getvalue(), "image/webp")
+        resList.append(
+            (targetName, outSize, "image/webp", {"mimetype": "image/webp", "width": width, "height": height}))
+    return resList
+
+
+def main():
+    with tempfile.TemporaryDirectory() as root:
+        conf["viur.file.blobStorage"] = LocalBlobStorage(root)
+        # A gradient with some noise, so the encoders have something to do
+        img = Image.radial_gradient("L").resize(SOURCE_SIZE).convert("RGB")
+        img = Image.blend(img, Image.effect_noise(SOURCE_SIZE, 40).convert("RGB"), 0.3)
+        source = BytesIO()
+        iccProfile = ImageCms.ImageCmsProfile(ImageCms.createProfile("sRGB")).tobytes()
+        img.save(source, "JPEG", quality=90, icc_profile=iccProfile)
+        fileSkel = {"dlkey": "bench", "name": "source.jpg"}
+        conf["viur.file.blobStorage"].put("bench/source/source.jpg", source.getvalue(), "image/jpeg")
+        print(f"{SOURCE_SIZE[0]}x{SOURCE_SIZE[1]} JPEG ({len(source.getvalue()) // 1024} KB), {len(PARAMS)} sizes")
+
+        for label, thumbnailer in (("legacy", legacyThumbnailer), ("pipeline", file.thumbnailer)):
+            thumbnailer(fileSkel, [], PARAMS)  # Warm up (and start the process pool)
+            start = time.perf_counter()
+            for _ in range(ROUNDS):
+                res = thumbnailer(fileSkel, [], PARAMS)
+            duration = (time.perf_counter() - start) / ROUNDS
+            print(f"{label:>10}: {duration * 1000:8.1f} ms/file, "
+                  f"{', '.join('%sx%s' % (x[3]['width'], x[3]['height']) for x in res)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+    Benchmarks the viurTags generated by `ViurTagsSearchAdapter` on a skeleton holding an article-sized text.
+
+    Compares the number and size of the generated index entries for the postfix mode (unlimited and limited by
+    max_postfixes) and the n-gram mode, and the time spent on a save changing the text vs. changing the title only,
+    which re-uses the search tags cached for the text.
+
+    Run with: python tests/benchmarks/bench_viurtags.py
+"""
+import pathlib
+import sys
+import timeit
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from main import monkey_patch  # noqa: E402
+
+monkey_patch()
+
+from viur.core import conf  # noqa: E402
+from benchmarks.memdb import Entity, Key  # noqa: E402
+
+ROUNDS = 200
+
+# Allow skeletons from the core and from this file, regardless of where the repository has been checked out
+for path in (pathlib.Path(__file__).resolve().parents[2] / "core", pathlib.Path(__file__).resolve().parent):
+    conf["viur.skeleton.searchPath"].append(str(path).replace(str(conf["viur.instance.project_base_path"]), ""))
+
+from viur.core.bones import StringBone, TextBone  # noqa: E402
+from viur.core.skeleton import Skeleton, ViurTagsSearchAdapter  # noqa: E402
+
+PARAGRAPHS = [
+    "The municipal library reopened its renovated reading rooms on Monday after eighteen months of construction. "
+    "Visitors can now borrow laptops, reserve soundproof study booths and use the digitization station to scan "
+    "historical newspapers, maps and photographs from the regional archive.",
+    "According to the project management, the refurbishment stayed within budget despite rising material costs. "
+    "Insulation, ventilation and the heating system were replaced, which is expected to reduce the energy "
+    "consumption of the building by approximately forty percent compared to the previous decade.",
+    "Die Stadtbibliothek bietet außerdem wöchentliche Veranstaltungen für Kinder und Jugendliche an, darunter "
+    "Vorlesestunden, Programmierkurse und Workshops zur Medienkompetenz. Anmeldungen sind ab sofort online oder "
+    "persönlich an der Informationstheke im Erdgeschoss möglich.",
+    "Opening hours have been extended: from Tuesday to Saturday, the reading rooms are accessible between nine "
+    "o'clock in the morning and eight o'clock in the evening. Members of the friends association receive early "
+    "access to new acquisitions and invitations to author readings.",
+]
+TEXT = "<p>" + "</p><p>".join(PARAGRAPHS) + "</p>"
+
+
+class ArticleSkel(Skeleton):
+    kindName = "article"
+    title = StringBone(descr="Title", searchable=True)
+    teaser = StringBone(descr="Teaser", searchable=True)
+    text = TextBone(descr="Text", searchable=True)
+
+
+ADAPTERS = {
+    "postfixes": ViurTagsSearchAdapter(),
+    "max_postfixes=4": ViurTagsSearchAdapter(max_postfixes=4),
+    "ngram_length=3": ViurTagsSearchAdapter(ngram_length=3),
+}
+
+
+def main():
+    skel = ArticleSkel()
+    skel["key"] = Key("article", 1)
+    skel["title"] = "Municipal library reopens after renovation"
+    skel["teaser"] = "Laptops, study booths and a digitization station for the regional archive"
+    skel["text"] = TEXT
+    words = len(" ".join(PARAGRAPHS).split())
+    print(f"{words} words of text")
+
+    for label, adapter in ADAPTERS.items():
+        entry = adapter.preprocessEntry(Entity(skel["key"]), skel, [], True)
+        tags = entry["viurTags"]
+        full = timeit.timeit(lambda: adapter.preprocessEntry(Entity(skel["key"]), skel, [], True), number=ROUNDS)
+        title = timeit.timeit(lambda: adapter.preprocessEntry(entry, skel, ["title"], False), number=ROUNDS)
+        print(f"{label:>16}: {len(tags):5d} tags, {sum(len(x) for x in tags):6d} bytes, "
+              f"{full / ROUNDS * 1000:.3f} ms/save (all bones), {title / ROUNDS * 1000:.3f} ms/save (title only)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+    Benchmarks `serializeXML()` on a rendered list of 1000 skeletons.
+
+    Compares the streaming writer against the previous implementation, which built a `xml.dom.minidom` tree
+    of the whole result and serialized it by `toprettyxml()`; both must produce the same document.
+
+    Run with: python tests/benchmarks/bench_xml.py
+"""
+import datetime
+import pathlib
+import sys
+import timeit
+import tracemalloc
+from xml.dom import minidom
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from main import monkey_patch  # noqa: E402
+
+monkey_patch()
+
+from viur.core import conf  # noqa: E402
+
+ENTRIES = 1000
+ROUNDS = 5
+
+# Allow skeletons from the core and from this file, regardless of where the repository has been checked out
+for path in (pathlib.Path(__file__).resolve().parents[2] / "core", pathlib.Path(__file__).resolve().parent):
+    conf["viur.skeleton.searchPath"].append(str(path).replace(str(conf["viur.instance.project_base_path"]), ""))
+
+from viur.core.bones import BooleanBone, DateBone, NumericBone, StringBone, TextBone  # noqa: E402
+from viur.core.render.xml.default import DefaultRender, iterXML, serializeXML  # noqa: E402
+from viur.core.skeleton import Skeleton  # noqa: E402
+
+
+class ProductSkel(Skeleton):
+    kindName = "product"
+    name = StringBone(descr="Name")
+    tags = StringBone(descr="Tags", multiple=True)
+    description = TextBone(descr="Description")
+    price = NumericBone(descr="Price", precision=2)
+    available = BooleanBone(descr="Available")
+    released = DateBone(descr="Released")
+
+
+def legacySerializeXML(data):
+    """
+        The minidom-based implementation replaced by the streaming writer.
+    """
+
+    def recursiveSerializer(data, element):
+        if isinstance(data, dict):
+            element.setAttribute("ViurDataType", "dict")
+            for key in data.keys():
+                docElem = doc.createElement("entry")
+                docElem.setAttribute("KeyName", str(key))
+                element.appendChild(recursiveSerializer(data[key], docElem))
+        elif isinstance(data, (tuple, list)):
+            element.setAttribute("ViurDataType", "list")
+            for value in data:
+                element.appendChild(recursiveSerializer(value, doc.createElement("entry")))
+        else:
+            if isinstance(data, bool):
+                element.setAttribute("ViurDataType", "boolean")
+            elif isinstance(data, (float, int)):
+                element.setAttribute("ViurDataType", "numeric")
+            elif isinstance(data, str):
+                element.setAttribute("ViurDataType", "string")
+            elif data is None:
+                element.setAttribute("ViurDataType", "none")
+                data = ""
+            else:
+                raise NotImplementedError("Type %s is not supported!" % type(data))
+            element.appendChild(doc.createTextNode(str(data)))
+        return element
+
+    doc = minidom.getDOMImplementation().createDocument(None, "ViurResult", None)
+    return recursiveSerializer(data, doc.childNodes[0]).toprettyxml(encoding="UTF-8")
+
+
+def measure(label, func):
+    tracemalloc.start()
+    result = func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    duration = timeit.timeit(func, number=ROUNDS) / ROUNDS
+    print(f"{label:>22}: {duration * 1000:8.1f} ms, {ENTRIES / duration:9.0f} entries/s, "
+          f"peak {peak / 1024 / 1024:6.1f} MiB")
+    return result
+
+
+def main():
+    render = DefaultRender()
+    skellist = []
+    for i in range(ENTRIES):
+        skel = ProductSkel()
+        skel["name"] = f"Product <{i}> & \"friends\""
+        skel["tags"] = ["tag%d" % (i % 7), "tag%d" % (i % 13), "sale"]
+        skel["description"] = "<p>Lorem ipsum dolor sit amet, consectetur adipiscing elit.</p>" * 3
+        skel["price"] = i * 1.25
+        skel["available"] = bool(i % 2)
+        skel["released"] = datetime.datetime(2023, 1, 1) + datetime.timedelta(hours=i)
+        skellist.append(skel)
+
+    data = {
+        "skellist": [render.renderSkelValues(skel) for skel in skellist],
+        "action": "list",
+        "params": None,
+        "cursor": "abc",
+    }
+
+    legacy = measure("minidom (toprettyxml)", lambda: legacySerializeXML(data))
+    pretty = measure("writer (pretty)", lambda: serializeXML(data, pretty=True))
+    measure("writer (compact)", lambda: serializeXML(data, pretty=False))
+    streamed = measure("writer (streamed)", lambda: b"".join(iterXML(data, pretty=True)))
+    assert pretty == legacy == streamed, "Serializers produced different documents"
+    print(f"{len(pretty) / 1024:.0f} KiB, identical output")
+
+
+if __name__ == "__main__":
+    main()
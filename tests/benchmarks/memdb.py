@@ -0,0 +1,279 @@
+"""
+    A tiny in-memory replacement for the datastore functions used by viur-core.
+
+    It's only meant to drive code-paths like `Skeleton.toDB()` in benchmarks and tests without a datastore
+    emulator; transactions are not isolated and queries only support simple filters, orders and cursors.
+"""
+import copy
+import enum
+import itertools
+import operator
+from unittest import mock
+
+
+class Key:
+    def __init__(self, kind, id_or_name=None, parent=None):
+        self.kind = kind
+        self.id_or_name = id_or_name
+        self.parent = parent
+
+    @property
+    def is_partial(self):
+        return self.id_or_name is None
+
+    def __eq__(self, other):
+        return isinstance(other, Key) and (self.kind, self.id_or_name, self.parent) == \
+            (other.kind, other.id_or_name, other.parent)
+
+    def __hash__(self):
+        return hash((self.kind, self.id_or_name))
+
+    def __repr__(self):
+        return f"<Key {self.kind}/{self.id_or_name}>"
+
+
+class Entity(dict):
+    def __init__(self, key=None, exclude_from_indexes=None):
+        super().__init__()
+        self.key = key
+        self.exclude_from_indexes = set(exclude_from_indexes or [])
+
+
+_filterOperators = {
+    "=": operator.eq, "<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge,
+    "!=": operator.ne, "IN": lambda value, values: value in values,
+}
+
+
+def _sortValue(value):
+    # Group values by their type, like the datastore does
+    if isinstance(value, Key):
+        return (3, str(value.kind), _sortValue(value.id_or_name))
+    if isinstance(value, bool):
+        return (0, int(value))
+    if isinstance(value, (int, float)):
+        return (1, value)
+    return (2, str(value))
+
+
+_missing = object()
+
+
+def _propertyValue(entity, field):
+    # Properties of embedded entities are addressed by dotted paths
+    if field in entity:
+        return entity[field]
+    value = entity
+    for part in field.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _missing
+        value = value[part]
+    return value
+
+
+class SortOrder(enum.Enum):
+    Ascending = 1
+    Descending = 2
+    InvertedAscending = 3
+    InvertedDescending = 4
+
+
+class QueryDefinition:
+    def __init__(self, kind, filters, orders):
+        self.kind = kind
+        self.filters = filters
+        self.orders = orders
+        self.distinct = None
+        self.limit = 30
+        self.startCursor = None
+        self.endCursor = None
+        self.currentCursor = None
+
+
+class Query:
+    """
+        Runs a query on the entities of the `MemoryDatastore` set as *store* by a subclass.
+
+        Filters on list properties match if any of their values matches (all inequality filters on a property must
+        be matched by the same value); the result is sorted by the given orders
+        (an inequality filter implies the first one) and the key. Cursors point behind the last entity returned.
+    """
+    store = None
+
+    def __init__(self, kind, srcSkelClass=None, *args, **kwargs):
+        self.store.stats["query"] += 1
+        self.kind = kind
+        self.origKind = kind
+        self.srcSkel = srcSkelClass
+        self.queries = QueryDefinition(kind, {}, [])
+
+    def filter(self, prop, value=None):
+        prop = prop.strip()
+        self.queries.filters[prop if " " in prop else prop + " ="] = value
+        return self
+
+    def order(self, *orderings):
+        self.queries.orders = [
+            (x, SortOrder.Ascending) if isinstance(x, str) else x for x in orderings
+        ]
+        return self
+
+    def setCursor(self, startCursor, endCursor=None):
+        self.queries.startCursor = startCursor
+        self.queries.endCursor = endCursor
+        return self
+
+    def getCursor(self):
+        return self.queries.currentCursor
+
+    def clone(self):
+        res = self.__class__(self.kind, self.srcSkel)
+        res.origKind = self.origKind
+        res.queries = copy.deepcopy(self.queries)
+        return res
+
+    def _filters(self):
+        for prop, value in self.queries.filters.items():
+            field, _, op = prop.partition(" ")
+            yield field, op.upper(), value
+
+    def _matches(self, entity):
+        inequalities = {}
+        for field, op, value in self._filters():
+            if field == "__key__":
+                # Keys are compared in the order of the datastore
+                if not _filterOperators[op](_sortValue(entity.key), _sortValue(value)):
+                    return False
+                continue
+            values = _propertyValue(entity, field)
+            if values is _missing:
+                return False
+            values = values if isinstance(values, list) else [values]
+            if op in ("=", "IN"):
+                if not any(_filterOperators[op](x, value) for x in values):
+                    return False
+            else:
+                inequalities.setdefault(field, (values, []))[1].append((op, value))
+        # A single value of a list must satisfy all inequality filters on its property
+        for values, filters in inequalities.values():
+            if not any(all(_filterOperators[op](x, value) for op, value in filters) for x in values):
+                return False
+        return True
+
+    def _sortKey(self, entity):
+        orders = list(self.queries.orders)
+        inequalities = [field for field, op, _ in self._filters() if op not in ("=", "IN") and field != "__key__"]
+        if inequalities and not any(field == inequalities[0] for field, _ in orders):
+            orders.insert(0, (inequalities[0], None))
+        res = []
+        for field, direction in orders:
+            value = _propertyValue(entity, field)
+            value = None if value is _missing else value
+            value = min(value, key=_sortValue) if isinstance(value, list) and value else value
+            value = _sortValue(value)
+            res.append(value if not direction or direction.value % 2 else _Reversed(value))
+        return tuple(res) + (_sortValue(entity.key),)
+
+    def run(self, limit=-1):
+        entities = sorted(
+            (x for x in self.store.data.values() if x.key.kind == self.queries.kind and self._matches(x)),
+            key=self._sortKey
+        )
+        if self.queries.startCursor is not None:
+            entities = [x for x in entities if self._sortKey(x) > self.store.cursors[self.queries.startCursor]]
+        res = entities[:limit] if limit >= 0 else entities
+        self.queries.currentCursor = None
+        if res and len(entities) > len(res):
+            self.queries.currentCursor = "cursor-%d" % len(self.store.cursors)
+            self.store.cursors[self.queries.currentCursor] = self._sortKey(res[-1])
+        return [self.store._copy(x) for x in res]
+
+    def iter(self):
+        yield from self.run()
+
+    def getEntry(self):
+        res = self.run(1)
+        return res[0] if res else None
+
+    def count(self, up_to=2 ** 63 - 1):
+        return min(len(self.run()), up_to)
+
+
+class _Reversed:
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __gt__(self, other):
+        return other.value > self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+class MemoryDatastore:
+    def __init__(self):
+        self.data = {}
+        self.stats = {"get": 0, "put": 0, "delete": 0, "query": 0}
+        self.cursors = {}
+        self._ids = itertools.count(1)
+        self.Query = type("Query", (Query,), {"store": self})
+
+    def Get(self, keys):
+        self.stats["get"] += 1
+        if isinstance(keys, list):
+            return [self._copy(self.data.get(key)) for key in keys]
+        return self._copy(self.data.get(keys))
+
+    def Put(self, entities):
+        self.stats["put"] += 1
+        for entity in entities if isinstance(entities, list) else [entities]:
+            self.data[entity.key] = self._copy(entity)
+
+    def Delete(self, keys):
+        self.stats["delete"] += 1
+        for key in keys if isinstance(keys, list) else [keys]:
+            self.data.pop(getattr(key, "key", key), None)
+
+    def GetOrInsert(self, key, **kwargs):
+        if (entity := self.Get(key)) is None:
+            entity = Entity(key)
+            entity.update(kwargs)
+            self.Put(entity)
+        return entity
+
+    def AllocateIDs(self, key):
+        return Key(key.kind, next(self._ids))
+
+    @staticmethod
+    def _copy(entity):
+        if entity is None:
+            return None
+        res = Entity(entity.key, entity.exclude_from_indexes)
+        res.update(entity)
+        return res
+
+    def patch(self):
+        """
+            Returns a context-manager replacing the datastore functions of viur.core.db with this store.
+        """
+        from viur.core import db
+        return mock.patch.multiple(
+            db,
+            Key=Key,
+            Entity=Entity,
+            Get=self.Get,
+            Put=self.Put,
+            Delete=self.Delete,
+            AllocateIDs=self.AllocateIDs,
+            GetOrInsert=self.GetOrInsert,
+            Query=self.Query,
+            QueryDefinition=QueryDefinition,
+            SortOrder=SortOrder,
+            IsInTransaction=lambda: False,
+            RunInTransaction=lambda func, *args, **kwargs: func(*args, **kwargs),
+            keyHelper=lambda key, kind, *args, **kwargs: key if isinstance(key, Key) else Key(kind, key),
+            create=True,
+        )
@@ -0,0 +1,38 @@
+import unittest
+
+
+class TestClientData(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        from main import monkey_patch
+        monkey_patch()
+
+    def test_fieldsOf(self):
+        from viur.core.bones.base import ClientData
+        data = ClientData({"name": "a", "name.de": "b", "street.0.nr": "1", "other": "c"})
+        self.assertEqual({"name": "a", "name.de": "b"}, data.fieldsOf("name"))
+        self.assertEqual({"street.0.nr": "1"}, data.fieldsOf("street"))
+        self.assertEqual({}, data.fieldsOf("missing"))
+
+    def test_modifications_drop_index(self):
+        from viur.core.bones.base import ClientData
+        for modify, expected in (
+            (lambda data: data.__setitem__("name.en", "c"), {"name": "a", "name.de": "b", "name.en": "c"}),
+            (lambda data: data.__delitem__("name.de"), {"name": "a"}),
+            (lambda data: data.pop("name"), {"name.de": "b"}),
+            (lambda data: data.setdefault("name.en", "c"), {"name": "a", "name.de": "b", "name.en": "c"}),
+            (lambda data: data.update({"name": "c"}), {"name": "c", "name.de": "b"}),
+            (lambda data: data.popitem(), {"name": "a"}),
+            (lambda data: data.clear(), {}),
+            (lambda data: data.__ior__({"name": "c"}), {"name": "c", "name.de": "b"}),
+        ):
+            data = ClientData({"name": "a", "name.de": "b"})
+            data.fieldsOf("name")
+            modify(data)
+            self.assertEqual(expected, data.fieldsOf("name"))
+
+        # The in-place operator must keep the type (and thus the index)
+        data = ClientData({"name": "a"})
+        data |= {"name.de": "b"}
+        self.assertIsInstance(data, ClientData)
+        self.assertEqual({"name": "a", "name.de": "b"}, data.fieldsOf("name"))
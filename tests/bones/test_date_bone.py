@@ -0,0 +1,42 @@
+import unittest
+from datetime import datetime
+
+
+class TestDateBone(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        from main import monkey_patch
+        monkey_patch()
+
+    def test_singleValueFromClient_formats(self):
+        from viur.core.bones import DateBone
+        bone = DateBone(naive=True)
+        expected = datetime(2023, 1, 5, 10, 20)
+        for value in ("2023-01-05 10:20", "2023-1-5 10:20:00", "01/05/2023 10:20", "5.1.2023 10:20",
+                      "2023-01-05T10:20:00"):
+            self.assertEqual((expected, None), bone.singleValueFromClient(value, None, "date", None), value)
+        self.assertEqual((datetime(2023, 1, 5), None), bone.singleValueFromClient("05.01.2023", None, "date", None))
+        for value in ("2023-13-01", "31.02.2023", "1899-01-01", "garbage"):
+            res, errors = bone.singleValueFromClient(value, None, "date", None)
+            self.assertIsNone(res, value)
+            self.assertEqual(1, len(errors))
+
+    def test_time_only(self):
+        from viur.core.bones import DateBone
+        bone = DateBone(date=False)
+        res, errors = bone.singleValueFromClient("10:20", None, "date", None)
+        self.assertIsNone(errors)
+        self.assertEqual((10, 20, 0), (res.hour, res.minute, res.second))
+
+    def test_timestamp(self):
+        from viur.core.bones import DateBone
+        bone = DateBone(localize=False)
+        res, errors = bone.singleValueFromClient("1672913600", None, "date", None)
+        self.assertIsNone(errors)
+        self.assertEqual(datetime(2023, 1, 5, 10, 13, 20), res.replace(tzinfo=None))
+        for value in ("9" * 400, "-" + "9" * 400, "4294967296"):
+            res, errors = bone.singleValueFromClient(value, None, "date", None)
+            self.assertIsNone(res, value)
+            self.assertEqual(1, len(errors))
+        res, errors = bone.singleValueFromClient("now" + "9" * 400, None, "date", None)
+        self.assertIsNone(errors)
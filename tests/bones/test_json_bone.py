@@ -0,0 +1,37 @@
+import unittest
+
+
+class TestJsonBone(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        from main import monkey_patch
+        monkey_patch()
+
+    def test_singleValueFromClient(self):
+        from viur.core.bones import JsonBone
+        bone = JsonBone(schema={"type": "object", "properties": {"price": {"type": "number"}}}, maxLength=50)
+        self.assertEqual(({"price": 1}, None), bone.singleValueFromClient('{"price": 1}', None, "json", None))
+        self.assertEqual(({"price": 2}, None), bone.singleValueFromClient("{'price': 2}", None, "json", None))
+        for value in ('{"price": "1"}', {"price": "1"}, "{invalid", '{"price": %s}' % ("1" * 50)):
+            res, errors = bone.singleValueFromClient(value, None, "json", None)
+            self.assertIsNone(res)
+            self.assertEqual(1, len(errors))
+
+    def test_rawValue(self):
+        from viur.core.bones import JsonBone
+        bone = JsonBone()
+
+        class Skel(dict):
+            dbEntity = {"json": '{"a": [1, 2]}'}
+            accessedValues = {}
+
+            def __getitem__(self, name):
+                if name not in self.accessedValues:
+                    bone.unserialize(self, name)
+                return self.accessedValues.get(name)
+
+        skel = Skel()
+        self.assertEqual('{"a": [1, 2]}', bone.rawValue(skel, "json"))
+        self.assertNotIn("json", skel.accessedValues)
+        skel["json"]["a"].append(3)
+        self.assertEqual('{"a": [1, 2, 3]}', bone.rawValue(skel, "json"))
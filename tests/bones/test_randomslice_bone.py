@@ -0,0 +1,107 @@
+import unittest
+from unittest import mock
+
+
+class FakeEntity(dict):
+    def __init__(self, key, values):
+        super().__init__(values)
+        self.key = key
+
+
+class FakeQueryDefinition:
+    def __init__(self, kind, filters, orders):
+        self.kind = kind
+        self.filters = filters
+        self.orders = orders
+        self.startCursor = self.endCursor = self.currentCursor = None
+
+
+class FakeQuery:
+    """Mimics the multi-query handling of viur.datastore.Query on a list of entities"""
+
+    def __init__(self, entities, limit):
+        self.entities = entities
+        self.queries = FakeQueryDefinition("test", {}, [])
+        self.limitValue = limit
+        self.customQueryInfo = {}
+        self._filterHook = None
+        self._customMultiQueryMerge = self._calculateInternalMultiQueryLimit = None
+
+    def getKind(self):
+        return "test"
+
+    def filter(self, prop, value):
+        for query in self.queries:
+            query.filters[prop] = value
+
+    def setCursor(self, cursor):
+        self.queries[0].startCursor = cursor
+
+    def _runSingleFilterQuery(self, query, limit):
+        res = self.entities
+        for prop, value in query.filters.items():
+            field, op = prop.split(" ")
+            res = [x for x in res if (x[field] >= value if op == ">=" else x[field] < value)]
+        res = sorted(res, key=lambda x: x[query.orders[0][0]])
+        offset = int(query.startCursor or 0)
+        query.currentCursor = str(offset + limit) if offset + limit < len(res) else None
+        return res[offset:offset + limit]
+
+    def _fixKind(self, res):
+        return res
+
+    def run(self):
+        limit = self._calculateInternalMultiQueryLimit(self, self.limitValue)
+        res = [self._runSingleFilterQuery(x, limit) for x in self.queries]
+        return self._customMultiQueryMerge(self, res, limit)
+
+    def getCursor(self):
+        return self.queries[0].currentCursor
+
+
+class TestRandomSliceBone(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        from main import monkey_patch
+        monkey_patch()
+
+    def setUp(self):
+        from viur.core import db
+        from viur.core.bones import RandomSliceBone
+        self.patch = mock.patch.object(db, "QueryDefinition", FakeQueryDefinition)
+        self.patch.start()
+        self.bone = RandomSliceBone(permutations=3)
+        self.entities = []
+        for idx in range(100):
+            entity = FakeEntity(idx, {})
+            skel = mock.Mock(dbEntity=entity)
+            entity.exclude_from_indexes = set()
+            self.bone.serialize(skel, "random", True)
+            self.entities.append(entity)
+
+    def tearDown(self):
+        self.patch.stop()
+
+    def _page(self, cursor=None, limit=15, **rawFilter):
+        query = FakeQuery(self.entities, limit)
+        self.bone.buildDBSort("random", None, query, {"orderby": "random"} | rawFilter)
+        query.setCursor(cursor)
+        return [x.key for x in query.run()], query.getCursor()
+
+    def test_serialize(self):
+        self.assertEqual(set(self.entities[0].keys()), {"random", "random_1", "random_2"})
+
+    def test_pagination(self):
+        keys, cursor = self._page()
+        pages = [keys]
+        while cursor:
+            self.assertEqual(self._page(cursor)[0], self._page(cursor)[0])  # Same cursor, same entries
+            keys, cursor = self._page(cursor)
+            pages.append(keys)
+        seen = [key for page in pages for key in page]
+        self.assertEqual(len(pages), 7)
+        self.assertEqual(sorted(seen), list(range(100)))
+
+    def test_seed(self):
+        self.assertEqual(self._page(**{"random.seed": "1234"}), self._page(**{"random.seed": "1234"}))
+        self.assertNotEqual(self._page(**{"random.seed": "1234"})[0], self._page(**{"random.seed": "4321"})[0])
@@ -0,0 +1,102 @@
+import enum
+import unittest
+from datetime import timedelta
+
+
+class TestSelectBone(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        from main import monkey_patch
+        monkey_patch()
+
+    def setUp(self) -> None:
+        from viur.core import current
+        self.token = current.request_data.set({})
+
+    def tearDown(self) -> None:
+        from viur.core import current
+        current.request_data.reset(self.token)
+
+    def test_static_values(self):
+        from viur.core.bones import SelectBone
+        bone = SelectBone(values={1: "one", "2": "two"})
+        self.assertTrue(bone.isStructureStatic())
+        self.assertEqual({1: "one", "2": "two"}, bone.values)
+        self.assertEqual((1, None), bone.singleValueFromClient("1", None, "select", None))
+        self.assertEqual(("2", None), bone.singleValueFromClient("2", None, "select", None))
+        self.assertIsNotNone(bone.singleValueFromClient("3", None, "select", None)[1])
+
+    def test_enum_values(self):
+        from viur.core.bones import SelectBone
+
+        class Color(enum.Enum):
+            RED = "red"
+            BLUE = "blue"
+
+        bone = SelectBone(values=Color)
+        self.assertTrue(bone.isStructureStatic())
+        self.assertEqual(["red", "blue"], list(bone.values))
+        self.assertEqual((Color.BLUE, None), bone.singleValueFromClient("blue", None, "select", None))
+        self.assertIs(Color.RED, bone.singleValueUnserialize("red"))
+        self.assertEqual("green", bone.singleValueUnserialize("green"))
+
+    def test_callable_values_cached_per_request(self):
+        from viur.core import current
+        from viur.core.bones import SelectBone
+        calls = []
+
+        def provider():
+            calls.append(1)
+            return ["a", "b"]
+
+        bone = SelectBone(values=provider)
+        self.assertFalse(bone.isStructureStatic())
+        for _ in range(3):
+            self.assertEqual(["a", "b"], list(bone.values))
+            self.assertEqual(("a", None), bone.singleValueFromClient("a", None, "select", None))
+        self.assertEqual(1, len(calls))
+
+        bone.invalidateValues()
+        bone.values
+        self.assertEqual(2, len(calls))
+
+        current.request_data.set({})  # Next request
+        bone.values
+        self.assertEqual(3, len(calls))
+
+    def test_callable_values_lifetime(self):
+        from viur.core import current
+        from viur.core.bones import SelectBone
+        calls = []
+
+        def provider():
+            calls.append(1)
+            return {"a": "A"}
+
+        bone = SelectBone(values=provider, valuesCacheLifetime=timedelta(minutes=5))
+        bone.values
+        current.request_data.set({})  # Next request
+        bone.values
+        self.assertEqual(1, len(calls))
+        bone.invalidateValues()
+        bone.values
+        self.assertEqual(2, len(calls))
+
+    def test_static_values_modified_in_place(self):
+        from viur.core.bones import SelectBone
+        bone = SelectBone(values={"a": "A", "b": "B"})
+        self.assertEqual(("a", None), bone.singleValueFromClient("a", None, "select", None))
+        bone.values["c"] = "C"
+        del bone.values["a"]
+        self.assertEqual(("c", None), bone.singleValueFromClient("c", None, "select", None))
+        self.assertIsNotNone(bone.singleValueFromClient("a", None, "select", None)[1])
+
+    def test_clone_has_own_values(self):
+        import copy
+        from viur.core.bones import SelectBone
+        bone = SelectBone(values=lambda: {"a": "A"})
+        self.assertEqual({"a": "A"}, bone.values)
+        clone = copy.deepcopy(bone)
+        clone.values = lambda: {"b": "B"}
+        self.assertEqual({"b": "B"}, clone.values)
+        self.assertEqual({"a": "A"}, bone.values)
@@ -0,0 +1,115 @@
+import random
+import unittest
+
+
+class FakeEntity(dict):
+    def __init__(self, key, value):
+        super().__init__(location=value)
+        self.key = key
+
+
+class FakeQuery:
+    """Runs the block queries issued by the SpatialBone against a list of entities"""
+
+    def __init__(self, entities):
+        self.entities = entities
+        self.customQueryInfo = {}
+
+    def _runSingleFilterQuery(self, query, limit):
+        block = query.filters["location.tiles.lat ="], query.filters["location.tiles.lng ="]
+        north = "location.coordinates.lat >=" in query.filters
+        lat = query.filters["location.coordinates.lat >=" if north else "location.coordinates.lat <"]
+        res = [
+            x for x in self.entities
+            if block[0] in x["location"]["tiles"]["lat"] and block[1] in x["location"]["tiles"]["lng"]
+            and (x["location"]["coordinates"]["lat"] >= lat) == north
+        ]
+        res.sort(key=lambda x: x["location"]["coordinates"]["lat"], reverse=not north)
+        return res[:limit]
+
+    def _fixKind(self, res):
+        return res
+
+
+class FakeQueryDefinition:
+    def __init__(self):
+        self.filters = {}
+        self.orders = []
+
+
+class TestSpatialBone(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        from main import monkey_patch
+        monkey_patch()
+
+    def setUp(self):
+        from viur.core.bones import SpatialBone
+        self.bone = SpatialBone(boundsLat=(40.0, 50.0), boundsLng=(0.0, 10.0), gridDimensions=(20, 20), maxRings=3)
+        rnd = random.Random(42)
+        self.entities = [
+            FakeEntity(idx, self.bone.singleValueSerialize((rnd.uniform(40, 50), rnd.uniform(0, 10)), None,
+                                                           "location", True))
+            for idx in range(2000)
+        ]
+
+    def _search(self, lat, lng, targetAmount, **kwargs):
+        query = FakeQuery(self.entities)
+        tile = self.bone.getTile(lat, lng)
+        if "radius" in kwargs or "bbox" in kwargs:
+            blocks = self.bone._areaBlocks(tile, kwargs.pop("area"))
+        else:
+            blocks = self.bone._ringBlocks(tile, 0)
+        subQueries = [
+            x for block in blocks for x in self.bone._blockQueries("location", FakeQueryDefinition(), block, lat)
+        ]
+        limit = self.bone.calculateInternalMultiQueryLimit(query, targetAmount)
+        res = self.bone.customMultiQueryMerge(
+            "location", lat, lng, query, [query._runSingleFilterQuery(x, limit) for _, x in subQueries], limit,
+            blocks=[block for block, _ in subQueries], origQuery=FakeQueryDefinition(), **kwargs)
+        return res, query.customQueryInfo["spatialGuaranteedCorrectness"]
+
+    def _bruteForce(self, lat, lng):
+        from viur.core.bones.spatial import haversine
+        return sorted(
+            (haversine(lat, lng, x["location"]["coordinates"]["lat"], x["location"]["coordinates"]["lng"]), x.key)
+            for x in self.entities)
+
+    def test_nearest(self):
+        for lat, lng in [(45.0, 5.0), (40.1, 0.1), (49.9, 7.3), (44.24, 2.25)]:
+            res, guaranteed = self._search(lat, lng, 30)
+            expected = self._bruteForce(lat, lng)
+            self.assertEqual(len(res), 30)
+            self.assertGreaterEqual(guaranteed, expected[29][0])
+            self.assertEqual([x.key for x in res], [key for _, key in expected[:30]])
+
+    def test_radius(self):
+        lat, lng, radius = 45.12, 4.87, 60000
+        res, guaranteed = self._search(lat, lng, 1000, radius=radius, area=(44.5, 4.0, 45.7, 5.7))
+        expected = [key for distance, key in self._bruteForce(lat, lng) if distance <= radius]
+        self.assertEqual(guaranteed, radius)
+        self.assertEqual([x.key for x in res], expected)
+
+    def test_bbox(self):
+        bbox = (42.0, 2.0, 43.0, 3.5)
+        res, _ = self._search(42.5, 2.75, 1000, bbox=bbox, area=bbox)
+        expected = {
+            x.key for x in self.entities
+            if bbox[0] <= x["location"]["coordinates"]["lat"] <= bbox[2]
+            and bbox[1] <= x["location"]["coordinates"]["lng"] <= bbox[3]
+        }
+        self.assertEqual({x.key for x in res}, expected)
+
+    def test_block_limit(self):
+        query = FakeQuery(self.entities)
+        self.assertEqual(150, self.bone.calculateInternalMultiQueryLimit(query, 30))
+        self.assertEqual(500, self.bone.calculateInternalMultiQueryLimit(query, 1000))
+
+    def test_dense_blocks(self):
+        # Blocks with far more entries than fetched still return the nearest ones
+        self.bone.blockLimit = 10
+        for lat, lng in [(45.0, 5.0), (44.24, 2.25)]:
+            res, guaranteed = self._search(lat, lng, 5)
+            expected = self._bruteForce(lat, lng)
+            self.assertGreaterEqual(guaranteed, expected[4][0])
+            self.assertEqual([x.key for x in res], [key for _, key in expected[:5]])
@@ -91,6 +91,22 @@ def monkey_patch():
     os.chdir(original_cwd)
 
 
+def patch_skeleton_search_path():
+    """Allow skeletons from the core and the tests, regardless of where the repository has been checked out"""
+    from viur.core import conf
+
+    for path in (tld / "core", tld / "tests"):
+        path = str(path).replace(str(conf["viur.instance.project_base_path"]), "")
+        if path not in conf["viur.skeleton.searchPath"]:
+            conf["viur.skeleton.searchPath"].append(path)
+
+    from viur.core.skeleton import Skeleton
+
+    # Outside a "viur/core" checkout, the base skeleton gets a kindName, which would collide with its subclasses
+    if Skeleton.kindName == "skeleton":
+        Skeleton.kindName = None
+
+
 if __name__ == "__main__":
     monkey_patch()
 
@@ -0,0 +1,107 @@
+import unittest
+from datetime import timedelta
+from unittest import mock
+
+
+class TestPagination(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        from main import monkey_patch, patch_skeleton_search_path
+        monkey_patch()
+        patch_skeleton_search_path()
+
+    def setUp(self) -> None:
+        from benchmarks.memdb import MemoryDatastore
+        from viur.core.pagination import Pagination
+        self.store = MemoryDatastore()
+        patcher = self.store.patch()
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pagination = Pagination(page_size=10, max_pages=5, cache_size=0)
+        for idx in range(0, 25):
+            self.put(idx)
+
+    def put(self, idx, category="a"):
+        from viur.core import db
+        entity = db.Entity(db.Key("paged", idx + 1))
+        entity["category"] = category
+        entity["sortindex"] = idx
+        db.Put(entity)
+
+    def query(self):
+        from viur.core import db
+        return db.Query("paged").filter("category =", "a").order("sortindex")
+
+    def pages(self):
+        res = []
+        for cursor in self.pagination.get_pages(self.query()):
+            res.append([x["sortindex"] for x in self.query().setCursor(cursor).run(10)])
+        return res
+
+    def index(self):
+        return next(x for x in self.store.data.values() if x.key.kind == "viur_pagination")
+
+    def test_get_pages(self):
+        self.put(100, category="b")
+        self.assertEqual([list(range(0, 10)), list(range(10, 20)), list(range(20, 25))], self.pages())
+        self.assertEqual(1, len([x for x in self.store.data if x.kind == "viur_pagination"]))
+
+    def test_refresh_appended(self):
+        self.pages()
+        for idx in range(25, 40):
+            self.put(idx)
+        self.pagination.refresh_index(self.query(), appended_only=True)
+        self.assertEqual([list(range(x, min(x + 10, 40))) for x in range(0, 40, 10)], self.pages())
+
+    def test_refresh_rebuilds(self):
+        from viur.core import db
+        self.pages()
+        db.Delete(db.Key("paged", 1))
+        self.pagination.refresh_index(self.query())
+        self.assertFalse(self.index()["stale"])
+        self.assertEqual([list(range(1, 11)), list(range(11, 21)), list(range(21, 25))], self.pages())
+
+    def test_lost_rebuild_restarted_once(self):
+        from viur.core import db, utils
+        self.pages()
+        index = self.index()
+        index["stale"] = True
+        index["staledate"] = utils.utcNow() - timedelta(hours=1)
+        db.Put(index)
+
+        with mock.patch("viur.core.pagination.rebuild_pagination_index") as rebuild:
+            for _ in range(0, 3):
+                self.pages()
+        self.assertEqual(1, rebuild.call_count)
+
+    def test_stored_query(self):
+        from viur.core.pagination import _load_query, _store_query
+        from viur.core import db
+        query = self.query()
+        query.queries.distinct = ["category"]
+        query.origKind = "origin"
+        entry = db.Entity(db.Key("viur_pagination", "test"))
+        _store_query(entry, query)
+        loaded = _load_query(entry)
+        self.assertEqual(("paged", "origin", None), (loaded.queries.kind, loaded.origKind, loaded.srcSkel))
+        self.assertEqual(query.queries.filters, loaded.queries.filters)
+        self.assertEqual(query.queries.orders, loaded.queries.orders)
+        self.assertEqual(["category"], loaded.queries.distinct)
+
+    def test_cache_race(self):
+        from collections import OrderedDict
+        from viur.core import utils
+
+        class RacingDict(OrderedDict):
+            def get(self, key, default=None):
+                # Another thread drops the entry right after we've read it
+                value = super().get(key, default)
+                self.pop(key, None)
+                return value
+
+        self.pagination.cache_size = 2
+        self.pagination._cache = RacingDict()
+        self.pagination._cache_set("fresh", [None, "cursor"])
+        self.assertEqual([None, "cursor"], self.pagination._cache_get("fresh"))
+        self.pagination._cache["expired"] = ([None], utils.utcNow() - timedelta(hours=1))
+        self.assertIsNone(self.pagination._cache_get("expired"))
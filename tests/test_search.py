@@ -0,0 +1,176 @@
+import unittest
+from types import SimpleNamespace
+
+
+class TestBM25SearchAdapter(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        from main import monkey_patch, patch_skeleton_search_path
+        monkey_patch()
+        patch_skeleton_search_path()
+
+        from viur.core.bones import StringBone, TextBone
+        from viur.core.search import BM25SearchAdapter
+        from viur.core.skeleton import Skeleton
+
+        class SearchTestSkel(Skeleton):
+            kindName = "searchtest"
+            customDatabaseAdapter = BM25SearchAdapter(max_postings=100)
+            name = StringBone(descr="Name", searchable=True)
+            content = TextBone(descr="Content", searchable=True)
+
+        cls.skelCls = SearchTestSkel
+
+    def setUp(self) -> None:
+        from benchmarks.memdb import MemoryDatastore
+        self.store = MemoryDatastore()
+        patcher = self.store.patch()
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def add(self, name, content=""):
+        skel = self.skelCls()
+        skel["name"] = name
+        skel["content"] = content
+        return skel.toDB(update_relations=False)
+
+    def search(self, queryString, limit=30, cursor=None):
+        query = SimpleNamespace(
+            kind=self.skelCls.kindName,
+            queries=SimpleNamespace(startCursor=cursor, limit=limit, currentCursor=None)
+        )
+        res = self.skelCls.customDatabaseAdapter.fulltextSearch(queryString, query)
+        return [x["name"] for x in res], query.queries.currentCursor
+
+    def postings(self):
+        return sorted(x["term"] for x in self.store.data.values() if x.key.kind == "viur-search-postings")
+
+    def test_indexing(self):
+        key = self.add("Hello World", "<p>hello <b>viur</b></p>")
+        entry = self.store.data[key]
+        self.assertEqual({"hello": 2, "world": 1, "viur": 1}, entry["viurSearchTerms"])
+        self.assertEqual(entry["viurSearchTerms"], entry["viurSearchIndexedTerms"])
+        self.assertEqual(["searchtest:hello", "searchtest:viur", "searchtest:world"], self.postings())
+
+        skel = self.skelCls()
+        skel.fromDB(key)
+        skel["content"] = "goodbye"
+        skel.toDB(update_relations=False)
+        self.assertEqual(["searchtest:goodbye", "searchtest:hello", "searchtest:world"], self.postings())
+        self.assertEqual((["Hello World"], None), self.search("goodbye"))
+        self.assertEqual(([], None), self.search("viur"))
+
+    def test_ranking(self):
+        self.add("apple", "banana")
+        self.add("banana", "banana banana apple")
+        self.add("cherry", "banana")
+        # Entries matching more words rank higher, and so do shorter ones
+        self.assertEqual((["apple", "banana", "cherry"], None), self.search("apple banana"))
+        # ... unless a word occurs more often
+        self.assertEqual("banana", self.search("banana")[0][0])
+
+    def test_prefix(self):
+        self.add("searching")
+        self.add("search")
+        self.add("research")
+        # Exact matches outrank words only starting with the searched one; nothing matches in the middle of a word
+        self.assertEqual((["search", "searching"], None), self.search("search"))
+        self.assertEqual((["searching"], None), self.search("searchi"))
+
+    def test_cursor(self):
+        names = ["common %s" % ("filler " * idx) for idx in range(0, 5)]
+        for name in names:
+            self.add(name.strip())
+        res, cursor = self.search("common", limit=2)
+        pages = [res]
+        while cursor:
+            res, cursor = self.search("common", limit=2, cursor=cursor)
+            pages.append(res)
+        # Shorter entries rank higher
+        self.assertEqual([[x.strip() for x in names[idx:idx + 2]] for idx in (0, 2, 4)], pages)
+
+    def test_delete(self):
+        key = self.add("delete me")
+        self.add("keep me")
+        skel = self.skelCls()
+        skel.fromDB(key)
+        skel.delete()
+        self.assertEqual(["searchtest:keep", "searchtest:me"], self.postings())
+        self.assertEqual((["keep me"], None), self.search("me keep"))
+        stats = [x for x in self.store.data.values() if x.key.kind == "viur-search-stats"]
+        self.assertEqual((1, 2), (sum(x["documents"] for x in stats), sum(x["length"] for x in stats)))
+
+    def test_concurrent_update(self):
+        from viur.core import db
+        from viur.core.search import updateSearchIndex
+        adapter = self.skelCls.customDatabaseAdapter
+        key = self.add("first")
+        entry = self.store.data[key]
+        entry["viurSearchTerms"] = {"second": 1}
+        writePostings = adapter.writePostings
+
+        def interleaved(kindName, docId, terms, newTerms):
+            # Another task indexes a newer state of the entry before our postings are written
+            adapter.writePostings = writePostings
+            entry["viurSearchTerms"] = {"third": 1}
+            updateSearchIndex(kindName, key)
+            writePostings(kindName, docId, terms, newTerms)
+
+        adapter.writePostings = interleaved
+        try:
+            updateSearchIndex(self.skelCls.kindName, key)
+        finally:
+            adapter.writePostings = writePostings
+        self.assertEqual({"third": 1}, db.Get(key)["viurSearchIndexedTerms"])
+        self.assertEqual(["searchtest:third"], self.postings())
+
+
+class TestViurTagsSearchAdapter(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        from main import monkey_patch, patch_skeleton_search_path
+        monkey_patch()
+        patch_skeleton_search_path()
+
+        from viur.core.bones import StringBone
+        from viur.core.skeleton import Skeleton, ViurTagsSearchAdapter
+
+        class NgramTestSkel(Skeleton):
+            kindName = "ngramtest"
+            customDatabaseAdapter = ViurTagsSearchAdapter(min_length=3, ngram_length=4)
+            name = StringBone(descr="Name", searchable=True)
+
+        cls.skelCls = NgramTestSkel
+
+    def setUp(self) -> None:
+        from benchmarks.memdb import MemoryDatastore
+        self.store = MemoryDatastore()
+        patcher = self.store.patch()
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def add(self, name):
+        skel = self.skelCls()
+        skel["name"] = name
+        return skel.toDB(update_relations=False)
+
+    def search(self, queryString):
+        from viur.core import db
+        res = self.skelCls.customDatabaseAdapter.fulltextSearch(queryString, db.Query(self.skelCls.kindName))
+        return sorted(x["name"] for x in res)
+
+    def test_ngram_tags(self):
+        adapter = self.skelCls.customDatabaseAdapter
+        # The postfixes shorter than an n-gram are stored down to min_length
+        self.assertEqual({"bobcat", "obca", "bcat", "cat"}, adapter._tagsFromString("Bobcat"))
+        self.assertEqual({"bcat", "cat"}, adapter._tagsFromString("bcat"))
+        self.assertEqual({"cat"}, adapter._tagsFromString("cat"))
+        self.assertEqual({"hello", "ello", "llo"}, adapter._tagsFromString("hello"))
+
+    def test_ngram_search(self):
+        for name in ("bobcat", "bcat", "scatter", "dog"):
+            self.add(name)
+        self.assertEqual(["bcat", "bobcat", "scatter"], self.search("cat"))
+        self.assertEqual(["bcat", "bobcat"], self.search("bcat"))
+        self.assertEqual(["bobcat"], self.search("obcat"))
+        self.assertEqual(["scatter"], self.search("atte"))
@@ -0,0 +1,398 @@
+import unittest
+from datetime import timedelta
+from unittest import mock
+
+
+class TestSkeletonStructure(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        from main import monkey_patch, patch_skeleton_search_path
+        monkey_patch()
+        patch_skeleton_search_path()
+
+        from viur.core.bones import SelectBone, StringBone
+        from viur.core.skeleton import Skeleton
+
+        class StructureTestSkel(Skeleton):
+            kindName = "structuretest"
+            name = StringBone(descr="Name")
+            color = SelectBone(descr="Color", values={"red": "Red", "blue": "Blue"})
+
+        cls.skelCls = StructureTestSkel
+
+    def test_structure_is_a_copy(self):
+        from viur.core.skeleton import clearStructureCache
+        self.addCleanup(clearStructureCache)
+        with mock.patch("viur.core.skeleton.getSystemInitialized", return_value=True):
+            structure = self.skelCls().structure()
+            self.assertEqual(structure, self.skelCls().structure())
+
+            structure["name"]["descr"] = "Modified"
+            structure["color"]["values"].append(["green", "Green"])
+            del structure["key"]
+
+            structure = self.skelCls().structure()
+            self.assertEqual("Name", structure["name"]["descr"])
+            self.assertEqual(2, len(structure["color"]["values"]))
+            self.assertIn("key", structure)
+
+    def test_renderers_use_cached_structure(self):
+        from viur.core.render.xml.default import DefaultRender
+        from viur.core.skeleton import SkeletonInstance, clearStructureCache
+        self.addCleanup(clearStructureCache)
+        # Renderers only read the structure, so they don't need to pay for a copy
+        with mock.patch("viur.core.skeleton.getSystemInitialized", return_value=True), \
+                mock.patch.object(SkeletonInstance, "structure", side_effect=AssertionError("copied")):
+            skel = self.skelCls()
+            res = DefaultRender().renderEntry(skel, "view")
+        self.assertIn(b'<entry KeyName="descr" ViurDataType="string">Name</entry>', res)
+
+
+class TestSkeletonToDB(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        from main import monkey_patch, patch_skeleton_search_path
+        monkey_patch()
+        patch_skeleton_search_path()
+
+        from viur.core.bones import StringBone
+        from viur.core.skeleton import Skeleton
+
+        class UpperStringBone(StringBone):
+            def singleValueSerialize(self, value, skel, name, parentIndexed):
+                return super().singleValueSerialize(value, skel, name, parentIndexed).upper()
+
+        class ToDBTestSkel(Skeleton):
+            kindName = "todbtest"
+            name = UpperStringBone(descr="Name", readOnly=True)
+            other = StringBone(descr="Other")
+
+        cls.skelCls = ToDBTestSkel
+
+    def test_forceAll(self):
+        from benchmarks.memdb import MemoryDatastore
+        from viur.core import db
+        store = MemoryDatastore()
+        with store.patch():
+            # Stored before the serialization of the bone was changed
+            entity = db.Entity(db.Key("todbtest", 1))
+            entity["name"] = "legacy"
+            entity["other"] = "other"
+            db.Put(entity)
+
+            skel = self.skelCls()
+            skel.fromDB(entity.key)
+            skel["other"] = "changed"
+            skel.toDB(update_relations=False)
+            self.assertEqual(("legacy", "changed"), (store.data[entity.key]["name"], store.data[entity.key]["other"]))
+
+            skel = self.skelCls()
+            skel.fromDB(entity.key)
+            skel.toDB(update_relations=False, forceAll=True)
+            self.assertEqual(("LEGACY", "changed"), (store.data[entity.key]["name"], store.data[entity.key]["other"]))
+
+    def test_saved_bones_not_dirty(self):
+        from benchmarks.memdb import MemoryDatastore
+        store = MemoryDatastore()
+        with store.patch():
+            skel = self.skelCls()
+            skel["name"] = "name"
+            skel["other"] = "first"
+            key = skel.toDB(update_relations=False)
+            self.assertEqual(set(), skel.dirtyBones)
+
+            # Saving the instance again mustn't overwrite what has been changed by someone else in the meantime
+            store.data[key]["other"] = "concurrent"
+            skel.toDB(update_relations=False)
+            self.assertEqual("concurrent", store.data[key]["other"])
+            skel["other"] = "second"
+            skel.toDB(update_relations=False)
+            self.assertEqual("second", store.data[key]["other"])
+
+
+class TestSearchIndexRebuild(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        from main import monkey_patch, patch_skeleton_search_path
+        monkey_patch()
+        patch_skeleton_search_path()
+
+        from viur.core.bones import StringBone
+        from viur.core.skeleton import Skeleton
+
+        class ReindexTestSkel(Skeleton):
+            kindName = "reindextest"
+            name = StringBone(descr="Name")
+            other = StringBone(descr="Other", defaultValue="default")
+
+        cls.skelCls = ReindexTestSkel
+
+    def setUp(self) -> None:
+        from benchmarks.memdb import MemoryDatastore
+        from viur.core import conf
+        from viur.core.skeleton import RebuildSearchIndex
+        self.store = MemoryDatastore()
+        for patcher in (
+            self.store.patch(),
+            mock.patch.dict(conf, {"viur.searchIndex.rebuild.shards": 4, "viur.searchIndex.rebuild.parallelism": 2}),
+            mock.patch.object(RebuildSearchIndex, "startIterOnQuery"),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.startIterOnQuery = RebuildSearchIndex.startIterOnQuery
+
+    def put(self, idOrName, **values):
+        from viur.core import db
+        entity = db.Entity(db.Key("reindextest", idOrName))
+        entity.update(values)
+        db.Put(entity)
+        return entity.key
+
+    def rebuild(self):
+        return next(x for x in self.store.data.values() if x.key.kind == "viur-search-index-rebuilds")
+
+    def startedShards(self):
+        return [(call.args[0], call.args[1]["shardId"]) for call in self.startIterOnQuery.call_args_list]
+
+    def test_shards(self):
+        from viur.core import conf
+        from viur.core.skeleton import TaskUpdateSearchIndex
+        keys = [self.put(x) for x in (5, 2 ** 52, 2 ** 52 + 1, 2 ** 52 + 2 ** 50, 2 ** 53 - 1, "named")]
+        conf["viur.searchIndex.rebuild.parallelism"] = 10
+        TaskUpdateSearchIndex().execute("reindextest")
+        # The scattered ids are split evenly, with ranges of their own for legacy ids and named keys
+        self.assertEqual(6, self.rebuild()["totalShards"])
+        shards = [[x.key for x in query.run()] for query, _ in self.startedShards()]
+        self.assertEqual([keys[:1], keys[1:3], keys[3:4], [], keys[4:5], keys[5:]], shards)
+
+    def test_stale_shards(self):
+        from viur.core import utils
+        from viur.core.skeleton import TaskUpdateSearchIndex, _finishSearchIndexShard, checkSearchIndexRebuilds
+        TaskUpdateSearchIndex().execute("reindextest")
+        (_, stuckId), (_, runningId) = self.startedShards()
+
+        # Nothing to give up yet
+        checkSearchIndexRebuilds()
+        self.assertEqual((2, 0), (len(self.startedShards()), self.rebuild()["failedShards"]))
+
+        rebuild = self.rebuild()
+        rebuild["runningLeases"][0]["startdate"] = utils.utcNow() - timedelta(days=1)
+        self.store.Put(rebuild)
+        checkSearchIndexRebuilds()
+        rebuild = self.rebuild()
+        self.assertEqual(1, rebuild["failedShards"])
+        # The freed slot is used by the next pending shard
+        self.assertEqual(3, len(self.startedShards()))
+        self.assertEqual(2, rebuild["runningShards"])
+        self.assertNotIn(stuckId, [x["id"] for x in rebuild["runningLeases"]])
+
+        # A given up shard finishing late isn't counted
+        _finishSearchIndexShard(rebuild.key, "reindextest", stuckId, 10)
+        self.assertEqual((0, 0), (self.rebuild()["finishedShards"], self.rebuild()["processedEntries"]))
+
+        # The rebuild finishes with the remaining shards
+        while not (rebuild := self.rebuild())["isFinished"]:
+            self.assertTrue(rebuild["runningLeases"])
+            _finishSearchIndexShard(rebuild.key, "reindextest", rebuild["runningLeases"][0]["id"], 1)
+        self.assertEqual((5, 1, 5), (rebuild["finishedShards"], rebuild["failedShards"], rebuild["processedEntries"]))
+
+    def test_reindex(self):
+        from viur.core import db
+        key = self.put(1, name="name")
+        skel = self.skelCls()
+        skel.fromDB(key)
+        # The bone missing from the entry gets written
+        self.assertTrue(skel.reindex())
+        self.assertEqual({"name": "name", "other": "default"}, {k: self.store.data[key][k] for k in ("name", "other")})
+        # Nothing to do anymore
+        self.assertFalse(skel.reindex())
+
+        # The entry is modified while being reindexed: it's refreshed again instead of overwriting the change
+        del self.store.data[key]["other"]
+        runInTransaction = db.RunInTransaction
+
+        def concurrentlyModified(func, *args, **kwargs):
+            if not concurrentlyModified.called:
+                concurrentlyModified.called = True
+                self.store.data[key]["name"] = "changed"
+            return runInTransaction(func, *args, **kwargs)
+
+        concurrentlyModified.called = False
+        with mock.patch.object(db, "RunInTransaction", concurrentlyModified):
+            self.assertTrue(skel.reindex())
+        self.assertEqual({"name": "changed", "other": "default"},
+                         {k: self.store.data[key][k] for k in ("name", "other")})
+
+        db.Delete(key)
+        self.assertFalse(skel.reindex())
+
+
+class TestSeoKeys(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        from main import monkey_patch, patch_skeleton_search_path
+        monkey_patch()
+        patch_skeleton_search_path()
+
+        from viur.core import conf
+        from viur.core.bones import StringBone
+        from viur.core.skeleton import Skeleton
+
+        class SeoTestSkel(Skeleton):
+            kindName = "seotest"
+            name = StringBone(descr="Name")
+
+            @classmethod
+            def getCurrentSEOKeys(cls, skelValues):
+                return {conf["viur.defaultLanguage"]: skelValues["name"]}
+
+        cls.skelCls = SeoTestSkel
+
+    def setUp(self) -> None:
+        from benchmarks.memdb import MemoryDatastore
+        self.store = MemoryDatastore()
+        patcher = self.store.patch()
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def add(self, name):
+        skel = self.skelCls()
+        skel["name"] = name
+        return skel.toDB(update_relations=False)
+
+    def reservations(self):
+        return sorted(key.id_or_name for key in self.store.data if key.kind == "viur-seo-keys")
+
+    def test_reservations(self):
+        from viur.core.skeleton import resolveSeoKeys
+        key = self.add("hello")
+        # The entry's own key is resolved without a reservation of its own
+        self.assertEqual(["seotest/hello"], self.reservations())
+        puts = self.store.stats["put"]
+        self.assertEqual({"hello": key, str(key.id_or_name): key},
+                         resolveSeoKeys("seotest", ["hello", str(key.id_or_name), "missing", "0", "__key__"]))
+        self.assertEqual(puts, self.store.stats["put"])
+
+        # Neither the reservation nor the key of another entry can be taken
+        other = self.store.data[self.add("hello")]
+        self.assertNotEqual("hello", other["viur"]["viurCurrentSeoKeys"]["en"])
+        other = self.store.data[self.add(str(key.id_or_name))]
+        self.assertNotEqual(str(key.id_or_name), other["viur"]["viurCurrentSeoKeys"]["en"])
+
+    def test_legacy_entries(self):
+        from viur.core import db
+        from viur.core.skeleton import resolveSeoKeys
+        # Written before SEO-keys had been reserved
+        legacy = db.Entity(db.Key("seotest", 5))
+        legacy["viur"] = {"viurActiveSeoKeys": ["legacy", "5"]}
+        db.Put(legacy)
+
+        # Resolving them doesn't write, but defers backfilling their reservation
+        with mock.patch("viur.core.skeleton.backfillSeoKeyReservations") as backfill:
+            puts = self.store.stats["put"]
+            self.assertEqual({"legacy": legacy.key, "5": legacy.key}, resolveSeoKeys("seotest", ["legacy", "5"]))
+            self.assertEqual(puts, self.store.stats["put"])
+        backfill.assert_called_once_with("seotest", ["legacy"])
+
+        # Saving an entry requesting a legacy key backfills its reservation
+        other = self.store.data[self.add("legacy")]
+        self.assertNotEqual("legacy", other["viur"]["viurCurrentSeoKeys"]["en"])
+        self.assertIn("seotest/legacy", self.reservations())
+        self.assertNotIn("seotest/5", self.reservations())
+
+
+class TestUniqueValues(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        from main import monkey_patch, patch_skeleton_search_path
+        monkey_patch()
+        patch_skeleton_search_path()
+
+        from viur.core.bones import StringBone, UniqueLockMethod, UniqueValue
+        from viur.core.skeleton import Skeleton
+
+        class UniqueTestSkel(Skeleton):
+            kindName = "uniquetest"
+            email = StringBone(descr="Email", unique=UniqueValue(UniqueLockMethod.SameValue, False, "Email taken"))
+            tags = StringBone(descr="Tags", multiple=True,
+                              unique=UniqueValue(UniqueLockMethod.SameValue, False, "Tag taken"))
+
+        cls.skelCls = UniqueTestSkel
+
+    def setUp(self) -> None:
+        from benchmarks.memdb import MemoryDatastore
+        self.store = MemoryDatastore()
+        patcher = self.store.patch()
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def skel(self, key=None, **values):
+        skel = self.skelCls()
+        if key:
+            skel.fromDB(key)
+        for boneName, value in values.items():
+            skel[boneName] = value
+        return skel
+
+    def locks(self):
+        # The ids of the entries holding a lock, by bone and value
+        from viur.core.skeleton import _uniquePropertyIndexKey
+        res = {}
+        skel = self.skelCls()
+        for boneName in ("email", "tags"):
+            for value in ("a", "b", "c"):
+                skel[boneName] = [value] if boneName == "tags" else value
+                lockValue, = getattr(skel, boneName).getUniquePropertyIndexValues(skel, boneName)
+                if lockObj := self.store.data.get(_uniquePropertyIndexKey("uniquetest", boneName, lockValue)):
+                    res[(boneName, value)] = lockObj["references"]
+        return res
+
+    def test_lock_key(self):
+        from viur.core import db
+        from viur.core.skeleton import _uniquePropertyIndexKey
+        self.assertEqual(db.Key("uniquetest_email_uniquePropertyIndex", "hash"),
+                         _uniquePropertyIndexKey("uniquetest", "email", "hash"))
+
+    def test_collision(self):
+        from viur.core.skeleton import _findUniqueValueCollisions
+        first = self.skel(email="a", tags=["a", "b"]).toDB(update_relations=False)
+        self.assertEqual({("email", "a"): first.id_or_name, ("tags", "a"): first.id_or_name,
+                          ("tags", "b"): first.id_or_name}, self.locks())
+
+        # Both values are already held by the first entry, and are checked with one single fetch
+        gets = self.store.stats["get"]
+        self.assertEqual(["email", "tags"], _findUniqueValueCollisions(self.skel(email="a", tags=["b", "c"])))
+        self.assertEqual(gets + 1, self.store.stats["get"])
+        with self.assertRaises(ValueError):
+            self.skel(email="a").toDB(update_relations=False)
+
+        skel = self.skelCls()
+        self.assertFalse(skel.fromClient({"email": "a", "tags": ["c"]}))
+        self.assertEqual(["email"], [error.fieldPath[0] for error in skel.errors])
+        self.assertEqual(1, len([x for x in self.store.data if x.kind == "uniquetest"]))
+
+    def test_resave(self):
+        from viur.core.skeleton import _findUniqueValueCollisions
+        key = self.skel(email="a", tags=["a"]).toDB(update_relations=False)
+        locks = self.locks()
+        # The entry's own locks don't collide with it
+        skel = self.skel(key)
+        self.assertEqual([], _findUniqueValueCollisions(skel))
+        skel.toDB(update_relations=False, forceAll=True)
+        self.assertEqual(locks, self.locks())
+
+    def test_release_changed_values(self):
+        first = self.skel(email="a", tags=["a", "b"]).toDB(update_relations=False)
+        self.skel(first, email="b", tags=["b", "c"]).toDB(update_relations=False)
+        self.assertEqual({("email", "b"): first.id_or_name, ("tags", "b"): first.id_or_name,
+                          ("tags", "c"): first.id_or_name}, self.locks())
+
+        # The released values can be taken by another entry
+        second = self.skel(email="a", tags=["a"]).toDB(update_relations=False)
+        self.assertEqual(second.id_or_name, self.locks()[("email", "a")])
+        self.assertEqual(second.id_or_name, self.locks()[("tags", "a")])
+
+        # Deleting an entry releases all of its locks
+        self.skel(first).delete()
+        self.assertEqual({("email", "a"): second.id_or_name, ("tags", "a"): second.id_or_name}, self.locks())
+
@@ -0,0 +1,186 @@
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+
+class TestLocalBlobStorage(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        from main import monkey_patch
+        monkey_patch()
+
+    def setUp(self) -> None:
+        from viur.core.storage import LocalBlobStorage
+        self.tmpDir = tempfile.TemporaryDirectory()
+        self.storage = LocalBlobStorage(self.tmpDir.name)
+
+    def tearDown(self) -> None:
+        self.tmpDir.cleanup()
+
+    def test_put_get_list(self):
+        self.storage.put("dlkey/source/image.png", b"png")
+        self.storage.put("dlkey/derived/thumbnail-w200.webp", b"webp")
+        self.storage.put("otherkey/source/text.txt", b"txt")
+        self.assertEqual(b"png", self.storage.get("dlkey/source/image.png"))
+        self.assertIsNone(self.storage.get("dlkey/source/missing.png"))
+        self.assertEqual(
+            ["dlkey/derived/thumbnail-w200.webp", "dlkey/source/image.png"],
+            [x.name for x in self.storage.list("dlkey/")])
+        info = self.storage.stat("dlkey/source/image.png")
+        self.assertEqual((3, "image/png"), (info.size, info.mimeType))
+        with self.assertRaises(ValueError):
+            self.storage.get("../escaped")
+
+    def test_copy_delete(self):
+        self.storage.put("dlkey/source/old.txt", b"text")
+        self.assertTrue(self.storage.copy("dlkey/source/old.txt", "dlkey/source/new.txt"))
+        self.assertFalse(self.storage.copy("dlkey/source/missing.txt", "dlkey/source/other.txt"))
+        self.storage.delete(["dlkey/source/old.txt", "dlkey/source/missing.txt"])
+        self.assertEqual(["dlkey/source/new.txt"], [x.name for x in self.storage.list("dlkey/")])
+
+    def test_serve_range(self):
+        import webob
+        data = bytes(range(256)) * 4096
+        self.storage.put("dlkey/source/data.bin", data)
+        etag = self.storage.stat("dlkey/source/data.bin").etag
+
+        response = webob.Response()
+        body = self.storage.serve("dlkey/source/data.bin", webob.Request.blank("/"), response)
+        self.assertEqual((200, len(data)), (response.status_code, response.content_length))
+        self.assertEqual(data, b"".join(body))
+
+        request = webob.Request.blank("/", headers={"Range": "bytes=1000-300000"})
+        response = webob.Response()
+        body = b"".join(self.storage.serve("dlkey/source/data.bin", request, response))
+        self.assertEqual(206, response.status_code)
+        self.assertEqual(data[1000:300001], body)
+        self.assertEqual("bytes 1000-300000/1048576", response.headers["Content-Range"])
+
+        request = webob.Request.blank("/", headers={"Range": "bytes=2000000-"})
+        response = webob.Response()
+        self.storage.serve("dlkey/source/data.bin", request, response)
+        self.assertEqual(416, response.status_code)
+
+        # The range is ignored if the blob has changed since
+        request = webob.Request.blank("/", headers={"Range": "bytes=0-99", "If-Range": '"outdated"'})
+        response = webob.Response()
+        self.storage.serve("dlkey/source/data.bin", request, response)
+        self.assertEqual((200, len(data)), (response.status_code, response.content_length))
+
+        request = webob.Request.blank("/", headers={"Range": "bytes=0-99", "If-Range": '"%s"' % etag})
+        response = webob.Response()
+        self.storage.serve("dlkey/source/data.bin", request, response)
+        self.assertEqual((206, 100), (response.status_code, response.content_length))
+
+    def test_serve_not_modified(self):
+        import webob
+        self.storage.put("dlkey/source/data.bin", b"data")
+        etag = self.storage.stat("dlkey/source/data.bin").etag
+        request = webob.Request.blank("/", headers={"If-None-Match": '"%s"' % etag})
+        response = webob.Response()
+        self.assertEqual(b"", self.storage.serve("dlkey/source/data.bin", request, response))
+        self.assertEqual(304, response.status_code)
+
+    def test_upload_token(self):
+        from viur.core import conf, utils
+        hmacKey = conf["viur.file.hmacKey"]
+        conf["viur.file.hmacKey"] = b"test-key"
+        try:
+            blobKey, sig = self.storage.uploadUrl("dlkey/source/image.png", "image/png", 3) \
+                .removeprefix("/file/upload/").split("?sig=")
+            self.assertEqual(("dlkey/source/image.png", 3, False), self.storage.verifyUploadToken(blobKey, sig))
+            self.assertIsNone(self.storage.verifyUploadToken(blobKey, "0" * len(sig)))
+
+            # A signed download-url must not be accepted as upload token for the same blob
+            blobKey, sig = utils.downloadUrlFor("dlkey", "image.png").removeprefix("/file/download/").split("?sig=")
+            self.assertTrue(utils.hmacVerify(blobKey.encode("ASCII"), sig))
+            self.assertIsNone(self.storage.verifyUploadToken(blobKey, sig))
+        finally:
+            conf["viur.file.hmacKey"] = hmacKey
+
+    def test_serve_through_handler(self):
+        import webob
+        from viur.core import conf, db, exposed
+        from viur.core.request import BrowseHandler
+        data = bytes(range(256)) * 4096
+        self.storage.put("dlkey/source/data.bin", data)
+
+        @exposed
+        def download(*args, **kwargs):
+            return self.storage.serve("dlkey/source/data.bin", handler.request, handler.response)
+
+        mainResolver = conf["viur.mainResolver"]
+        conf["viur.mainResolver"] = {"download": download}
+        try:
+            for headers, status, body in (({}, 200, data), ({"Range": "bytes=1000-1999"}, 206, data[1000:2000])):
+                with mock.patch.object(db, "currentDbAccessLog", create=True):
+                    handler = BrowseHandler(webob.Request.blank("/download", headers=headers), webob.Response())
+                handler.internalRequest = False
+                handler.isPostRequest = False
+                handler.findAndCall("/download")
+                # The length set up by serve() must survive the dispatch
+                self.assertEqual((status, len(body)), (handler.response.status_code, handler.response.content_length))
+                self.assertEqual(body, handler.response.body)
+        finally:
+            conf["viur.mainResolver"] = mainResolver
+
+    def test_put_no_overwrite(self):
+        self.storage.put("dlkey/source/data.bin", b"old")
+        with self.assertRaises(FileExistsError):
+            self.storage.put("dlkey/source/data.bin", b"new", overwrite=False)
+        self.assertEqual(b"old", self.storage.get("dlkey/source/data.bin"))
+        self.assertEqual(["dlkey/source/data.bin"], [x.name for x in self.storage.list("dlkey/")])
+
+
+class TestFileUpload(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        from main import monkey_patch, patch_skeleton_search_path
+        monkey_patch()
+        patch_skeleton_search_path()
+        for modName in ("google.auth.transport", "google.oauth2", "google.oauth2.service_account"):
+            sys.modules.setdefault(modName, mock.Mock())
+
+    def setUp(self) -> None:
+        from viur.core.storage import LocalBlobStorage
+        self.tmpDir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpDir.cleanup)
+        self.storage = LocalBlobStorage(self.tmpDir.name)
+
+    def test_upload(self):
+        import webob
+        from viur.core import conf, current, errors
+        from viur.core.modules.file import File
+        self.addCleanup(current.request.set, None)
+
+        def upload(url, body, **overrides):
+            blobKey, sig = url.removeprefix("/file/upload/").split("?sig=")
+            request = webob.Request.blank(url, method="POST", body=body)
+            for attr, value in overrides.items():
+                setattr(request, attr, value)
+            current.request.set(mock.Mock(request=request))
+            return File.upload(mock.Mock(), blobKey, sig)
+
+        with mock.patch.dict(conf, {"viur.file.hmacKey": b"test-key", "viur.file.blobStorage": self.storage,
+                                    "viur.file.maxUploadSize": 4}):
+            url = self.storage.uploadUrl("dlkey/source/sized.txt", "text/plain", 3)
+            with self.assertRaises(errors.PreconditionFailed):
+                upload(url, b"long")
+            self.assertEqual("OKAY", upload(url, b"abc"))
+            # Each URL can only be used once
+            with self.assertRaises(errors.Gone):
+                upload(url, b"xyz")
+            self.assertEqual(b"abc", self.storage.get("dlkey/source/sized.txt"))
+
+            # Without a size in the URL, the limit is checked before reading the body
+            url = self.storage.uploadUrl("dlkey/source/unsized.txt", "text/plain")
+            with self.assertRaises(errors.RequestTooLarge):
+                upload(url, b"abcde")
+            with self.assertRaises(errors.PreconditionFailed):
+                upload(url, b"", content_length=None)
+            unreadable = mock.Mock(read=mock.Mock(side_effect=AssertionError("Body read")))
+            with self.assertRaises(errors.RequestTooLarge):
+                upload(url, b"", body_file_raw=unreadable, content_length=2 ** 40)
+            self.assertEqual("OKAY", upload(url, b"abcd"))
+            self.assertEqual(b"abcd", self.storage.get("dlkey/source/unsized.txt"))
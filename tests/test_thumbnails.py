@@ -0,0 +1,74 @@
+import multiprocessing
+import sys
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from unittest import mock
+
+
+def _loadedModules():
+    return set(sys.modules)
+
+
+class TestRenderThumbnails(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        from main import monkey_patch
+        monkey_patch()
+
+    def image(self, size, format, **kwargs):
+        from PIL import Image
+        data = BytesIO()
+        Image.radial_gradient("L").resize(size).convert("RGB").save(data, format, **kwargs)
+        return data.getvalue()
+
+    def decode(self, data):
+        from PIL import Image
+        img = Image.open(BytesIO(data))
+        return img.format, img.size
+
+    def test_targets(self):
+        from viur.core.thumbnails import renderThumbnails
+        targets, encoded = renderThumbnails(self.image((1200, 800), "PNG"), [
+            {"width": 600},
+            {"width": 300, "height": 300},
+            {"width": 150, "fileExtension": "png", "mimeType": "image/png"},
+            {"height": 100},  # Ignored, as there's no width
+        ])
+        self.assertEqual([
+            (600, 400, "thumbnail-w600.webp", "webp", "image/webp", True),
+            (300, 300, "thumbnail-300-300.webp", "webp", "image/webp", False),
+            (150, 100, "thumbnail-w150.png", "png", "image/png", True),
+        ], targets)
+        self.assertEqual([("WEBP", (600, 400)), ("WEBP", (300, 300)), ("PNG", (150, 100))],
+                         [self.decode(x) for x in encoded])
+
+    def test_invalid(self):
+        from viur.core.thumbnails import renderThumbnails
+        self.assertEqual(([], []), renderThumbnails(b"no image", [{"width": 100}]))
+        self.assertEqual(([], []), renderThumbnails(self.image((100, 100), "PNG"), [{"height": 100}]))
+
+    def test_jpeg_draft(self):
+        from PIL import ImageCms
+        from PIL.JpegImagePlugin import JpegImageFile
+        from viur.core.thumbnails import renderThumbnails
+        iccProfile = ImageCms.ImageCmsProfile(ImageCms.createProfile("sRGB")).tobytes()
+        data = self.image((2000, 1000), "JPEG", icc_profile=iccProfile)
+        draft = JpegImageFile.draft
+        with mock.patch.object(JpegImageFile, "draft", autospec=True, side_effect=draft) as mocked:
+            targets, encoded = renderThumbnails(data, [{"width": 400}, {"width": 100, "height": 300}])
+        # The decoder only scales down as far as the largest width and height requested allow
+        self.assertEqual((None, (400, 300)), mocked.call_args.args[1:])
+        self.assertEqual([("WEBP", (400, 200)), ("WEBP", (100, 300))], [self.decode(x) for x in encoded])
+
+    def test_process_pool(self):
+        from main import monkey_patch
+        from viur.core.thumbnails import renderThumbnails
+        pool = ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("forkserver"), initializer=monkey_patch)
+        with pool:
+            targets, encoded = pool.submit(renderThumbnails, self.image((800, 600), "JPEG"), [{"width": 200}]).result()
+            loadedModules = pool.submit(_loadedModules).result()
+        self.assertEqual([("WEBP", (200, 150))], [self.decode(x) for x in encoded])
+        # The workers don't set up the clients of the File module
+        self.assertIn("viur.core.thumbnails", loadedModules)
+        self.assertNotIn("viur.core.modules.file", loadedModules)
@@ -0,0 +1,188 @@
+import unittest
+from unittest import mock
+
+
+class TestTreeDeleteRecursive(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        from main import monkey_patch, patch_skeleton_search_path
+        monkey_patch()
+        patch_skeleton_search_path()
+
+        from viur.core import db
+        from viur.core.prototypes.tree import Tree, TreeSkel
+
+        class TreeTestNodeSkel(TreeSkel):
+            kindName = "treetest_node"
+
+        class TreeTestLeafSkel(TreeSkel):
+            kindName = "treetest_leaf"
+
+        class TreeTest(Tree):
+            nodeSkelCls = TreeTestNodeSkel
+            leafSkelCls = TreeTestLeafSkel
+            subtreeBatchSize = 2
+
+            def deleteSubtreeEntry(self, skelType, entity):
+                db.Delete(entity.key)
+
+        cls.module = TreeTest("treetest", "/treetest")
+
+    def setUp(self) -> None:
+        from benchmarks.memdb import MemoryDatastore
+        self.store = MemoryDatastore()
+        patcher = self.store.patch()
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.root = self.put("treetest_node", "root", None)
+        self.other = self.put("treetest_node", "other", None)
+        self.put("treetest_leaf", "other-leaf", self.other)
+
+        # A subtree spanning several batches on each level
+        parents = [self.root]
+        for depth in range(0, 3):
+            nodes = []
+            for parent in parents:
+                for idx in range(0, 3):
+                    nodes.append(self.put("treetest_node", "%s-%d" % (parent.id_or_name, idx), parent))
+                    self.put("treetest_leaf", "%s-leaf%d" % (parent.id_or_name, idx), parent)
+            parents = nodes
+
+    def put(self, kind, name, parentKey):
+        from viur.core import db
+        entity = db.Entity(db.Key(kind, name))
+        entity["parententry"] = parentKey
+        db.Put(entity)
+        return entity.key
+
+    def remaining(self):
+        return sorted(
+            key.id_or_name for key in self.store.data
+            if key.kind in ("treetest_node", "treetest_leaf")
+        )
+
+    def bookkeeping(self):
+        return [key for key in self.store.data if key.kind.startswith("viur-tree-deletion")]
+
+    def test_delete_recursive(self):
+        self.module.deleteRecursive(self.root.id_or_name)
+        self.assertEqual(["other", "other-leaf", "root"], self.remaining())
+        self.assertEqual([], self.bookkeeping())
+
+    def test_resume(self):
+        calls = []
+        deleteSubtreeEntry = self.module.deleteSubtreeEntry
+
+        def failing(skelType, entity):
+            calls.append(entity.key)
+            if len(calls) == 10:
+                raise RuntimeError("Task aborted")
+            deleteSubtreeEntry(skelType, entity)
+
+        self.module.deleteSubtreeEntry = failing
+        try:
+            with self.assertRaises(RuntimeError):
+                self.module.deleteRecursive(self.root.id_or_name)
+        finally:
+            del self.module.deleteSubtreeEntry
+
+        # Partially done; the pending nodes are kept outside the job entity
+        self.assertGreater(len(self.remaining()), 3)
+        jobKey, = [key for key in self.store.data if key.kind == "viur-tree-deletions"]
+        self.assertNotIn("frontier", self.store.data[jobKey])
+
+        # The retried task continues where the aborted one stopped
+        self.module.deleteRecursiveStep(jobKey)
+        self.assertEqual(["other", "other-leaf", "root"], self.remaining())
+        self.assertEqual([], self.bookkeeping())
+
+
+class TestTreeAncestors(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        from main import monkey_patch, patch_skeleton_search_path
+        monkey_patch()
+        patch_skeleton_search_path()
+
+        from viur.core.prototypes.tree import Tree, TreeSkel
+
+        class AncestorTestNodeSkel(TreeSkel):
+            kindName = "ancestortest_node"
+
+        class AncestorTestLeafSkel(TreeSkel):
+            kindName = "ancestortest_leaf"
+
+        class AncestorTest(Tree):
+            nodeSkelCls = AncestorTestNodeSkel
+            leafSkelCls = AncestorTestLeafSkel
+
+        cls.module = AncestorTest("ancestortest", "/ancestortest")
+
+    def setUp(self) -> None:
+        from benchmarks.memdb import MemoryDatastore
+        from viur.core import securitykey
+        self.store = MemoryDatastore()
+        for patcher in (
+            self.store.patch(),
+            mock.patch.object(securitykey, "validate", return_value=True),
+            mock.patch.object(self.module, "canMove", return_value=True, create=True),
+            mock.patch.object(self.module, "render", create=True),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        # root -> a -> b -> c -> d (-> leaf) and root -> x
+        self.root = self.add("node", None)
+        self.a = self.add("node", self.root)
+        self.b = self.add("node", self.a)
+        self.c = self.add("node", self.b)
+        self.d = self.add("node", self.c)
+        self.leaf = self.add("leaf", self.d)
+        self.x = self.add("node", self.root)
+
+    def add(self, skelType, parentKey):
+        skel = self.module.addSkel(skelType)
+        skel["parententry"] = parentKey
+        skel["parentrepo"] = self.root if parentKey else None
+        return skel.toDB(update_relations=False)
+
+    def ancestors(self, key):
+        return self.store.data[key]["viurAncestors"]
+
+    def test_materialized_path(self):
+        self.assertEqual([], self.ancestors(self.root))
+        self.assertEqual([self.root, self.a, self.b, self.c], self.ancestors(self.d))
+        self.assertEqual([self.root, self.a, self.b, self.c, self.d], self.ancestors(self.leaf))
+        self.assertEqual([self.c, self.d], [x.key for x in self.module.subtreeQuery("node", self.b).run()])
+        self.assertEqual([self.leaf], [x.key for x in self.module.subtreeQuery("leaf", self.b).run()])
+
+    def test_stale_paths(self):
+        from viur.core import errors
+        from viur.core.prototypes.tree import getAncestorKeys
+        # The deferred update of the subtree hasn't run yet
+        with mock.patch.object(self.module, "updateParentRepo"):
+            self.module.move("node", self.b, self.x, skey="skey")
+        self.assertEqual([self.root, self.a, self.b, self.c], self.ancestors(self.d))
+        self.assertEqual([self.root, self.x, self.b, self.c], getAncestorKeys(self.store.data[self.d]))
+
+        # Moving x below d would create a loop
+        with self.assertRaises(errors.NotAcceptable):
+            self.module.move("node", self.x, self.d, skey="skey")
+
+        # The deferred update fixes the stored paths
+        self.module.updateParentRepo(self.b, self.root)
+        self.assertEqual([self.root, self.x, self.b, self.c], self.ancestors(self.d))
+        self.assertEqual([self.root, self.x, self.b, self.c, self.d], self.ancestors(self.leaf))
+
+    def test_backfill(self):
+        from viur.core.prototypes.tree import TaskBackfillTreeAncestors
+        # Written before the ancestors were stored, except for a node whose path has become outdated
+        for key in (self.b, self.c, self.d, self.leaf):
+            del self.store.data[key]["viurAncestors"]
+        self.store.data[self.a]["parententry"] = self.x
+        TaskBackfillTreeAncestors().execute("ancestortest_node")
+        TaskBackfillTreeAncestors().execute("ancestortest_leaf")
+        self.assertEqual([self.root, self.x, self.a], self.ancestors(self.b))
+        self.assertEqual([self.root, self.x, self.a, self.b, self.c], self.ancestors(self.d))
+        self.assertEqual([self.root, self.x, self.a, self.b, self.c, self.d], self.ancestors(self.leaf))
@@ -13,3 +13,19 @@ class TestUtils(unittest.TestCase):
         self.assertEqual("None", escapeString(None))
         self.assertEqual("abcde", escapeString("abcdefghi", maxLength=5))
         self.assertEqual("&lt;html&gt;&&lt;/html&gt;", escapeString("<html>\n&\0</html>"))
+
+    def test_markFilesForDeletion(self):
+        from benchmarks.memdb import MemoryDatastore
+        from viur.core import db
+        from viur.core.utils import markFilesForDeletion
+        store = MemoryDatastore()
+        with store.patch():
+            legacy = db.Entity(db.Key("viur-deleted-files", 4711))  # Written by a previous version
+            legacy["itercount"] = 1
+            legacy["dlkey"] = "legacy"
+            db.Put(legacy)
+            markFilesForDeletion(["legacy", "new", "new"])
+            markFilesForDeletion(["new"])
+            self.assertEqual(
+                {4711: "legacy", "new": "new"},
+                {key.id_or_name: x["dlkey"] for key, x in store.data.items()})